@@ -0,0 +1,70 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+# Замер памяти под записи пациентов: словари (как раньше) против Patient.
+#
+# Записи создаются с одинаковыми строками пола и общими числами, а ФИО у
+# каждой свое - как при чтении из JSON. Считается прирост памяти
+# по tracemalloc на создание списка из --count записей.
+#
+#     python benchmarks/bench_memory.py --count 100000
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from patient_model import Patient, normalize_gender  # noqa: E402
+
+
+def sample_rows(count, seed=1):
+    rng = random.Random(seed)
+    for i in range(count):
+        gender = rng.choice(('М', 'Ж'))
+        yield (f"Пациент {i:07d}", rng.randint(18, 90), gender,
+               float(rng.randint(150, 200)), float(rng.randint(45, 120)),
+               normalize_gender(gender))
+
+
+def as_dict(row):
+    return dict(zip(Patient.FIELDS + ('gender_code',), row))
+
+
+def as_patient(row):
+    return Patient(*row)
+
+
+def measure(make, rows):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = [make(row) for row in rows]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / len(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Память на одну запись пациента")
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--output', help="записать результаты в JSON-файл")
+    args = parser.parse_args(argv)
+
+    rows = list(sample_rows(args.count))
+    # Строки ФИО уже созданы и в замер не попадают - сравниваются сами записи
+    report = {
+        'count': args.count,
+        'dict_bytes_per_record': measure(as_dict, rows),
+        'patient_bytes_per_record': measure(as_patient, rows),
+    }
+    report['ratio'] = report['dict_bytes_per_record'] / report['patient_bytes_per_record']
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
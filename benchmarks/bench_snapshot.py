@@ -0,0 +1,90 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Замер записи и чтения снимка базы: JSON (как в хранилище 'journal')
+# против колоночного двоичного снимка (хранилище 'columnar').
+#
+# Для каждого размера базы снимок записывается и читается --runs раз,
+# в отчет идет лучшее время и размер файла.
+#
+#     python benchmarks/bench_snapshot.py --sizes 10000 100000 1000000
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from patient_model import Patient, PatientList, normalize_gender  # noqa: E402
+from patient_storage import (ColumnarStorage, JournalStorage,  # noqa: E402
+                             dump_patients, encode_columnar, write_file_atomic)
+
+FORMATS = (
+    ('json', JournalStorage, dump_patients, '.json'),
+    ('columnar', ColumnarStorage, encode_columnar, '.dpcol'),
+)
+
+
+def sample_patients(count, seed=1):
+    rng = random.Random(seed)
+    patients = []
+    for i in range(count):
+        gender = rng.choice(('М', 'Ж'))
+        patients.append(Patient(f"Пациент {i:07d}", rng.randint(18, 90), gender,
+                                float(rng.randint(150, 200)), float(rng.randint(45, 120)),
+                                normalize_gender(gender), patient_id=i + 1))
+    return PatientList(patients)
+
+
+def best_time(action, runs):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        action()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure(patients, directory, runs):
+    result = {}
+    for name, storage_class, encode, suffix in FORMATS:
+        path = os.path.join(directory, 'patients' + suffix)
+        save = best_time(lambda: write_file_atomic(path, encode(patients)), runs)
+        storage = storage_class(path)
+        load = best_time(storage.load_snapshot, runs)
+        result[name] = {
+            'save_ms': save * 1000,
+            'load_ms': load * 1000,
+            'bytes': os.path.getsize(path),
+        }
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Запись и чтение снимка базы: JSON и колонки")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--output', help="записать результаты в JSON-файл")
+    args = parser.parse_args(argv)
+
+    report = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            formats = measure(sample_patients(size), directory, args.runs)
+            report.append({'count': size, **formats})
+            print(f"{size}: " + ", ".join(
+                f"{name} запись {r['save_ms']:.0f} мс, чтение {r['load_ms']:.0f} мс, "
+                f"{r['bytes'] / 1e6:.1f} МБ" for name, r in formats.items()), file=sys.stderr)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
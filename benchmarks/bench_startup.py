@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Замер запуска графического приложения.
+#
+# Каждый прогон - отдельный процесс Python, то есть холодный старт: время
+# импорта dear_patients и время до первого отрисованного кадра (MedicalApp
+# создан и root.update() отработал). Заодно проверяется, что тяжелые модули
+# не загружены до первого кадра. Перед замерами делается прогревочный запуск,
+# который заполняет кэш уменьшенных картинок - как у пользователя, который
+# запускает программу не в первый раз.
+#
+# Приложение запускается во временной папке с копией patients.json и
+# картинок: при запуске оно может переписать файл пациентов и оставить рядом
+# журнал и блокировку, а рабочая копия репозитория должна остаться как есть.
+#
+#     python benchmarks/bench_startup.py --runs 5 --budget-ms 1500
+#
+# Нужен экран (или Xvfb). При превышении бюджета скрипт завершается с кодом 1.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('numpy', 'matplotlib', 'PIL', 'seaborn')
+
+PROBE = r"""
+import json, sys, time
+started = time.perf_counter()
+import tkinter as tk
+import dear_patients
+imported = time.perf_counter()
+dear_patients.WARMUP_CHARTS = None
+root = tk.Tk()
+app = dear_patients.MedicalApp(root)
+root.update()
+first_frame = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_frame_ms': (first_frame - started) * 1000,
+    'heavy_modules': [m for m in HEAVY_MODULES if m in sys.modules],
+}))
+root.destroy()
+"""
+
+
+def prepare_workdir(workdir):
+    """Копия данных приложения, с которой оно запускается"""
+    shutil.copy2(os.path.join(ROOT, 'patients.json'), workdir)
+    # copytree сохраняет время изменения картинок - кэш уменьшенных копий
+    # с прогревочного запуска остается действительным
+    shutil.copytree(os.path.join(ROOT, 'images'), os.path.join(workdir, 'images'))
+
+
+def run_probe(workdir):
+    code = f"HEAVY_MODULES = {HEAVY_MODULES!r}\n" + PROBE
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', code], cwd=workdir, env=env,
+                            capture_output=True, text=True)
+    process_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or "процесс завершился с ошибкой")
+    # Приложение само печатает в stdout, замер - последняя строка
+    measurement = json.loads(result.stdout.strip().splitlines()[-1])
+    measurement['process_ms'] = process_ms
+    return measurement
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замер холодного запуска приложения")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help="допустимое время до первого кадра (медиана)")
+    parser.add_argument('--output', help="записать результаты в JSON-файл")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare_workdir(workdir)
+        try:
+            run_probe(workdir)
+            runs = [run_probe(workdir) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"Не удалось запустить приложение: {e}", file=sys.stderr)
+            return 2
+    report = {
+        'runs': runs,
+        'median_import_ms': statistics.median(r['import_ms'] for r in runs),
+        'median_first_frame_ms': statistics.median(r['first_frame_ms'] for r in runs),
+        'median_process_ms': statistics.median(r['process_ms'] for r in runs),
+        'heavy_modules': sorted({m for r in runs for m in r['heavy_modules']}),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    failed = False
+    if report['heavy_modules']:
+        print(f"До первого кадра загружены тяжелые модули: {report['heavy_modules']}",
+              file=sys.stderr)
+        failed = True
+    if args.budget_ms is not None and report['median_first_frame_ms'] > args.budget_ms:
+        print(f"Первый кадр: {report['median_first_frame_ms']:.0f} мс, "
+              f"бюджет {args.budget_ms:.0f} мс", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+# Набор замеров того, как программа ведет себя с ростом базы.
+#
+# Для каждого размера (по умолчанию 1, 10, 100 тысяч и миллион записей)
+# генерируется одна и та же по seed база с "грязными" записями
+# (synthetic_patients) и замеряются:
+#
+#   - load_patients и сохранение (одна измененная запись и снимок целиком);
+#   - calculate_bmi по всем записям в цикле и update_bmi целиком;
+#   - сбор агрегатов для графиков и каждый create_*_chart с отрисовкой в PNG;
+#   - поиск дублей: отчет по всей базе и проверка одной записи, как при
+#     сохранении формы;
+#   - создание окна и заполнение таблицы (load_patients_data) и сортировка
+#     по ФИО - в скрытом окне Tk. Без экрана эта часть пропускается.
+#
+# Берется лучшее из --runs повторов. Результаты пишутся в JSON вместе с
+# версией (git) и окружением, чтобы сравнивать прогоны разных версий:
+#
+#     python benchmarks/bench_suite.py --output bench_v2.json
+#     python benchmarks/bench_suite.py --sizes 1000 10000 --runs 5
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from patient_model import calculate_bmi, update_bmi  # noqa: E402
+from patient_storage import open_storage, load_patients  # noqa: E402
+from synthetic_patients import generate_patients, write_patients_file  # noqa: E402
+
+
+def best_ms(action, runs):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        action()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def git_version():
+    try:
+        result = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT,
+                                capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def bench_storage(path, backend, runs):
+    # Первая загрузка переписывает файл старого формата (id, коды пола) -
+    # ее не считаем, замеряется обычный запуск
+    storage = open_storage(path, backend)
+    load_patients(storage)
+    storage.close()
+
+    def load():
+        storage = open_storage(path, backend)
+        load_patients(storage)
+        storage.close()
+
+    result = {'load_patients_ms': best_ms(load, runs)}
+    storage = open_storage(path, backend)
+    patients = load_patients(storage)
+    patient = patients[len(patients) // 2]
+    result['save_one_change_ms'] = best_ms(
+        lambda: storage.commit(patients, [('update', patient.id, patient)]), runs)
+    if hasattr(storage, 'compact'):
+        result['save_snapshot_ms'] = best_ms(lambda: storage.compact(patients), runs)
+    storage.close()
+    return result, patients
+
+
+def bench_bmi(patients, runs):
+    def one_by_one():
+        for patient in patients:
+            calculate_bmi(patient.weight, patient.height)
+
+    return {
+        'calculate_bmi_ms': best_ms(one_by_one, runs),
+        'update_bmi_ms': best_ms(lambda: update_bmi(patients), runs),
+    }
+
+
+def bench_charts(patients, runs):
+    from patient_charts import CHARTS, render_chart_png
+    from patient_stats import PatientColumns, PatientStats
+
+    result = {'patient_stats_ms': best_ms(lambda: PatientStats(PatientColumns(patients)), runs)}
+    stats = PatientStats(PatientColumns(patients))
+    for title, create_chart in CHARTS:
+        result[f"{create_chart.__name__}_ms"] = best_ms(lambda: create_chart(stats), runs)
+        fig = create_chart(stats)
+        if fig is not None:
+            result[f"{create_chart.__name__}_png_ms"] = best_ms(lambda: render_chart_png(fig), runs)
+    return result
+
+
+def bench_duplicates(patients, runs):
+    from patient_duplicates import DuplicateIndex, find_duplicate_groups
+
+    result = {'find_duplicate_groups_ms': best_ms(lambda: find_duplicate_groups(patients), runs)}
+    index = DuplicateIndex(patients)
+    sample = [patients[i] for i in range(0, len(patients), max(1, len(patients) // 100))]
+
+    def check_sample():
+        for patient in sample:
+            index.find(patient, exclude=patient.id)
+
+    result['duplicate_check_ms'] = best_ms(check_sample, runs) / len(sample)
+    return result
+
+
+def bench_window(directory, backend, runs):
+    """Окно приложения в скрытом корне Tk; без экрана - только причина пропуска"""
+    import tkinter as tk
+    import dear_patients
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        return {'skipped': str(e)}
+    root.withdraw()
+    dear_patients.WARMUP_CHARTS = None
+    dear_patients.STORAGE_BACKEND = backend
+    # Приложение открывает patients.json в текущей папке
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        started = time.perf_counter()
+        app = dear_patients.MedicalApp(root)
+        root.update()
+        result = {'create_window_ms': (time.perf_counter() - started) * 1000}
+        result['load_patients_data_ms'] = best_ms(app.load_patients_data, runs)
+
+        def scroll_to_middle():
+            app.table.first = len(app.patients) // 2
+            app.load_patients_data()
+
+        result['scroll_to_middle_ms'] = best_ms(scroll_to_middle, runs)
+        # Первая сортировка строит порядок по столбцу, следующие его переиспользуют
+        started = time.perf_counter()
+        app.sort_by("ФИО")
+        result['first_sort_by_name_ms'] = (time.perf_counter() - started) * 1000
+        app.storage.close()
+    finally:
+        os.chdir(cwd)
+        root.destroy()
+    return result
+
+
+def run_size(size, args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'patients.json')
+        write_patients_file(path, generate_patients(size, args.seed, args.dirty))
+        result = {'count': size}
+        storage_result, patients = bench_storage(path, args.backend, args.runs)
+        result.update(storage_result)
+        result.update(bench_bmi(patients, args.runs))
+        result.update(bench_charts(patients, args.runs))
+        result.update(bench_duplicates(patients, args.runs))
+        if not args.no_window:
+            result['window'] = bench_window(directory, args.backend, args.runs)
+    print(f"{size}: загрузка {result['load_patients_ms']:.0f} мс")
+    return result
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры программы на базах разного размера")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--dirty', type=float, default=0.05, help="доля испорченных записей")
+    parser.add_argument('--backend', default='journal',
+                        choices=('journal', 'json', 'columnar', 'sqlite'))
+    parser.add_argument('--no-window', action='store_true', help="не замерять окно Tk")
+    parser.add_argument('--output', help="записать результаты в JSON-файл")
+    args = parser.parse_args(argv)
+
+    report = {
+        'version': git_version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'dirty': args.dirty,
+        'backend': args.backend,
+        'runs': args.runs,
+        'results': [],
+    }
+    # Сообщения программы (миграции и т.п.) - в stderr, в stdout только отчет
+    with contextlib.redirect_stdout(sys.stderr):
+        for size in args.sizes:
+            report['results'].append(run_size(size, args))
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import argparse
+import json
+import random
+import sys
+
+# Генератор правдоподобных пациентов для замеров.
+#
+# Один и тот же seed всегда дает одни и те же записи, поэтому замеры разных
+# версий программы идут на одинаковых данных. Записи - словари в том виде,
+# в каком они лежат в patients.json (без id: их проставит загрузка). Часть
+# записей (dirty) испорчена так, как это бывает в живых базах: числа
+# строками, запятая вместо точки, пустые и бессмысленные значения, пол
+# разными написаниями.
+#
+#     python benchmarks/synthetic_patients.py 100000 big_patients.json --seed 1
+
+MALE_SURNAMES = ('Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров',
+                 'Соколов', 'Михайлов', 'Новиков', 'Федоров', 'Морозов', 'Волков',
+                 'Алексеев', 'Лебедев', 'Семенов', 'Егоров', 'Павлов', 'Козлов')
+MALE_NAMES = ('Александр', 'Дмитрий', 'Максим', 'Сергей', 'Андрей', 'Алексей',
+              'Артем', 'Илья', 'Кирилл', 'Михаил', 'Никита', 'Иван', 'Егор')
+FEMALE_NAMES = ('Анна', 'Мария', 'Елена', 'Ольга', 'Наталья', 'Татьяна', 'Ирина',
+                'Екатерина', 'Светлана', 'Юлия', 'Дарья', 'Полина', 'Алиса')
+PATRONYMICS = ('Александров', 'Дмитриев', 'Сергеев', 'Андреев', 'Алексеев',
+               'Михайлов', 'Иванов', 'Петров', 'Николаев', 'Владимиров')
+
+# Написания пола с частотами: чаще всего так, как вводит форма
+MALE_SPELLINGS = (('м', 60), ('М', 25), ('муж', 5), ('Мужской', 5), ('male', 3), ('M', 2))
+FEMALE_SPELLINGS = (('ж', 60), ('Ж', 25), ('жен.', 5), ('Женский', 5), ('female', 3), ('F', 2))
+UNKNOWN_GENDERS = ('', '-', 'не указан', None, 'x')
+
+
+def pick(rng, weighted):
+    values = [value for value, weight in weighted]
+    weights = [weight for value, weight in weighted]
+    return rng.choices(values, weights)[0]
+
+
+def make_name(rng, male):
+    surname = rng.choice(MALE_SURNAMES)
+    patronymic = rng.choice(PATRONYMICS)
+    if male:
+        return f"{surname} {rng.choice(MALE_NAMES)} {patronymic}ич"
+    return f"{surname}а {rng.choice(FEMALE_NAMES)} {patronymic}на"
+
+
+def make_body(rng, male, age):
+    """Рост и вес: взрослые по нормальному распределению, дети ниже и легче"""
+    height = rng.gauss(176, 7) if male else rng.gauss(164, 6)
+    if age < 18:
+        height *= 0.55 + 0.025 * age
+    bmi = rng.gauss(26, 4.5) if age >= 18 else rng.gauss(17, 2.5)
+    bmi = min(max(bmi, 13), 55)
+    weight = bmi * (height / 100) ** 2
+    return round(height, 1), round(weight, 1)
+
+
+def spoil(rng, record):
+    """Портит одно поле записи так, как это бывает при ручном вводе и импорте"""
+    field = rng.choice(('age', 'height', 'weight', 'gender', 'name'))
+    value = record[field]
+    if field == 'gender':
+        record['gender'] = rng.choice(UNKNOWN_GENDERS)
+    elif field == 'name':
+        record['name'] = rng.choice(('', ' ' + value + ' ', value.upper()))
+    else:
+        record[field] = rng.choice((
+            str(value),
+            str(value).replace('.', ','),
+            f" {value} ",
+            None,
+            0,
+            'н/д',
+            -value,
+        ))
+    return record
+
+
+def generate_patients(count, seed=1, dirty=0.05):
+    """Список из count словарей пациентов; доля dirty записей испорчена"""
+    rng = random.Random(seed)
+    patients = []
+    for _ in range(count):
+        male = rng.random() < 0.48
+        age = min(int(rng.triangular(0, 100, 45)), 99)
+        height, weight = make_body(rng, male, age)
+        record = {
+            'name': make_name(rng, male),
+            'age': age,
+            'gender': pick(rng, MALE_SPELLINGS if male else FEMALE_SPELLINGS),
+            'height': height,
+            'weight': weight,
+        }
+        if rng.random() < dirty:
+            record = spoil(rng, record)
+        patients.append(record)
+    return patients
+
+
+def write_patients_file(path, patients):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(patients, f, ensure_ascii=False, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Файл со случайными пациентами для замеров")
+    parser.add_argument('count', type=int)
+    parser.add_argument('output', help="файл .json")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--dirty', type=float, default=0.05, help="доля испорченных записей")
+    args = parser.parse_args(argv)
+
+    write_patients_file(args.output, generate_patients(args.count, args.seed, args.dirty))
+    print(f"Пациентов: {args.count}, файл {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,24 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib
-matplotlib.use('TkAgg')
+from tkinter import ttk, messagebox, filedialog
+import base64
+import hashlib
 import json
+import logging
 import os
-from PIL import Image, ImageTk, ImageDraw
-import seaborn as sns
-import numpy as np
-import math
+import queue
+import threading
+
+from patient_model import (GENDER_MALE, GENDER_FEMALE, GENDER_UNKNOWN, Patient, PatientList,
+                           PatientValidationError, normalize_gender, validate_patient)
+from patient_storage import open_storage, load_patients, apply_change, StorageConflictError
+from patient_io import import_chunks, export_patients
+from patient_index import PatientIndex, parse_number
+from patient_duplicates import DuplicateIndex, find_duplicate_groups
+from patient_metrics import metrics, configure_logging
+
+# NumPy, Matplotlib и PIL здесь не импортируются: они нужны только для
+# статистики и картинок, и загружаются при первом обращении (или заранее
+# в фоне, см. WARMUP_CHARTS), чтобы окно с таблицей появлялось быстрее
 
 # Бежево-фисташковая цветовая палитра
 PRIMARY_BG = "#f5f5dc"
@@ -27,6 +36,64 @@ HOVER_GREEN = "#659965"
 HOVER_ORANGE = "#b0956b"
 HOVER_RED = "#c1956c"
 
+# Способ хранения данных: 'journal' - снимок + журнал изменений,
+# 'json' - перезапись всего файла при каждом сохранении,
+# 'columnar' - то же, что 'journal', но снимок - двоичный файл patients.dpcol
+# по колонкам: на 100 тыс. записей читается в 2-3 раза, а пишется примерно в
+# 5 раз быстрее JSON (при первом запуске заполняется из patients.json),
+# 'sqlite' - база patients.db (при первом запуске заполняется из patients.json)
+STORAGE_BACKEND = 'journal'
+
+# Как часто (мс) проверять, не изменили ли базу другие рабочие места, и
+# подтягивать их изменения в таблицу (None - не проверять)
+SYNC_INTERVAL = 2000
+
+# Строить графики статистики в фоновом потоке, не блокируя окно
+ASYNC_STATISTICS = True
+
+# Сколько места на диске могут занимать уменьшенные копии картинок
+IMAGE_CACHE_LIMIT = 5 * 1024 * 1024
+
+# Через сколько миллисекунд после запуска начать подгружать в фоне
+# NumPy и Matplotlib (None - не подгружать до первого открытия статистики)
+WARMUP_CHARTS = 1500
+
+# Если операция меняет больше записей, индексы поиска не обновляются по
+# одной записи, а строятся заново при следующем поиске
+INDEX_REBUILD_FROM = 1000
+
+# Сколько похожих пациентов перечислять в предупреждении о дубле
+DUPLICATES_SHOWN = 5
+
+# Через сколько миллисекунд после запуска строить в фоне индекс для проверки
+# новых записей на дубли (None - при первой проверке). Пока индекс строится,
+# проверка пропускается: на большой базе это несколько секунд
+DUPLICATE_INDEX_DELAY = 1000
+
+# Начиная с такого числа пациентов статистика строится по сводке
+# (patient_sketch), которая обновляется при каждом изменении, а не
+# пересчитывается по всем записям
+STATISTICS_SKETCH_FROM = 100000
+
+# Уровень журнала ('DEBUG', 'INFO', 'WARNING'); на DEBUG пишется и
+# отладочный вывод по отдельным записям
+LOG_LEVEL = 'WARNING'
+
+# Файл, куда каждый замер времени дописывается строкой JSON (None - не писать).
+# Сами замеры видны в скрытой панели диагностики: Ctrl+Shift+D
+METRICS_LOG = None
+
+# Профилировать через cProfile каждое нажатие кнопки, сортировку и поиск
+# (включается и в панели диагностики). Файлы .prof пишутся в PROFILE_DIR
+PROFILE_ACTIONS = False
+PROFILE_DIR = None
+
+log = logging.getLogger('dear_patients.app')
+
+# Поля, которые можно изменить сразу у нескольких выбранных пациентов
+BULK_EDIT_FIELDS = (("Пол", 'gender'), ("Возраст", 'age'),
+                    ("Рост (см)", 'height'), ("Вес (кг)", 'weight'))
+
 class RoundedButton(tk.Canvas):
     def __init__(self, parent, text, command, width=200, height=40, 
                  corner_radius=20, bg_color=ACCENT_BLUE, text_color='white', 
@@ -74,7 +141,8 @@ class RoundedButton(tk.Canvas):
         self.is_pressed = True
         self.draw_button(self.hover_color)
         self.after(150, self.reset_button)
-        self.command()
+        with metrics.action(self.text):
+            self.command()
     
     def reset_button(self):
         self.is_pressed = False
@@ -88,33 +156,290 @@ class RoundedButton(tk.Canvas):
         if not self.is_pressed:
             self.draw_button(self.bg_color)
 
+class VirtualTreeview(ttk.Frame):
+    """Таблица, в которой созданы только видимые на экране строки.
+
+    Количество строк берется из row_count(), значения строки - из
+    fetch_row(позиция), постоянный ключ строки (он же iid в Treeview) - из
+    row_key(позиция). При прокрутке строки запрашиваются заново, а уже
+    полученные значения хранятся в кэше на buffer_rows строк вокруг окна.
+    Выбранные строки запоминаются по ключам (selected_keys), в том числе
+    ушедшие за пределы окна; on_select получает ключ последней выбранной.
+    Ctrl+щелчок добавляет строку к выбору, Shift+щелчок - диапазон строк.
+    """
+
+    HEADING_HEIGHT = 30
+
+    def __init__(self, parent, columns, row_count, fetch_row, row_key, on_select=None,
+                 buffer_rows=50):
+        super().__init__(parent, style='Modern.TFrame')
+        self.row_count = row_count
+        self.fetch_row = fetch_row
+        self.row_key = row_key
+        self.on_select = on_select
+        self.buffer_rows = buffer_rows
+
+        self.first = 0
+        self.visible_rows = 8
+        self.visible_iids = []
+        self.selected_keys = {}
+        self.selected_key = None
+        self.selected_position = None
+        self.cache_start = 0
+        self.cache_rows = []
+
+        self.tree = ttk.Treeview(self, columns=columns, show="headings",
+                                 height=self.visible_rows, selectmode='extended')
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.on_scrollbar)
+
+        self.tree.pack(side='left', fill='both', expand=True)
+        self.scrollbar.pack(side='right', fill='y')
+
+        self.tree.bind('<Configure>', self.on_resize)
+        self.tree.bind('<Button-1>', self.on_click)
+        self.tree.bind('<MouseWheel>', self.on_mousewheel)
+        self.tree.bind('<Button-4>', lambda e: self.scroll_rows(-3))
+        self.tree.bind('<Button-5>', lambda e: self.scroll_rows(3))
+        self.tree.bind('<Up>', lambda e: self.move_selection(-1))
+        self.tree.bind('<Down>', lambda e: self.move_selection(1))
+        self.tree.bind('<Prior>', lambda e: self.move_selection(-self.visible_rows))
+        self.tree.bind('<Next>', lambda e: self.move_selection(self.visible_rows))
+
+    def get_row(self, position):
+        offset = position - self.cache_start
+        if 0 <= offset < len(self.cache_rows):
+            return self.cache_rows[offset]
+
+        # Промах мимо кэша - забираем окно вместе с запасом с обеих сторон
+        count = self.row_count()
+        self.cache_start = max(0, position - self.buffer_rows)
+        cache_end = min(count, position + self.visible_rows + self.buffer_rows)
+        self.cache_rows = [(self.row_key(i), self.fetch_row(i))
+                           for i in range(self.cache_start, cache_end)]
+        return self.cache_rows[position - self.cache_start]
+
+    def render(self):
+        count = self.row_count()
+        self.first = max(0, min(self.first, count - self.visible_rows))
+        last = min(count, self.first + self.visible_rows)
+
+        self.tree.delete(*self.tree.get_children())
+        self.visible_iids = []
+        selected_iids = []
+        for position in range(self.first, last):
+            key, values = self.get_row(position)
+            iid = str(key)
+            self.tree.insert("", "end", iid=iid, values=values)
+            self.visible_iids.append(iid)
+            if key in self.selected_keys:
+                selected_iids.append(iid)
+
+        self.tree.selection_set(selected_iids)
+        if self.selected_key is not None and str(self.selected_key) in self.visible_iids:
+            self.tree.focus(str(self.selected_key))
+
+        if count:
+            self.scrollbar.set(self.first / count, last / count)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def refresh(self):
+        """Перечитать видимые строки, например после добавления или удаления"""
+        self.cache_rows = []
+        self.render()
+
+    def refresh_row(self, position):
+        """Обновить одну строку на месте"""
+        offset = position - self.cache_start
+        if 0 <= offset < len(self.cache_rows):
+            self.cache_rows[offset] = (self.row_key(position), self.fetch_row(position))
+        key, values = self.get_row(position)
+        iid = str(key)
+        if self.tree.exists(iid):
+            self.tree.item(iid, values=values)
+
+    def see(self, position):
+        if position < self.first:
+            self.first = position
+        elif position >= self.first + self.visible_rows:
+            self.first = position - self.visible_rows + 1
+        self.render()
+
+    def select(self, position):
+        self.selected_position = position
+        self.selected_key = self.get_row(position)[0]
+        self.selected_keys = {self.selected_key: None}
+        self.see(position)
+        if self.on_select:
+            self.on_select(self.selected_key)
+
+    def clear_selection(self):
+        self.selected_keys = {}
+        self.selected_key = None
+        self.selected_position = None
+        self.tree.selection_remove(*self.tree.selection())
+        if self.on_select:
+            self.on_select(None)
+
+    def scroll_rows(self, delta):
+        self.first += delta
+        self.render()
+        return "break"
+
+    def move_selection(self, delta):
+        count = self.row_count()
+        if not count:
+            return "break"
+        if self.selected_position is None:
+            position = self.first
+        else:
+            position = max(0, min(count - 1, self.selected_position + delta))
+        self.select(position)
+        return "break"
+
+    def on_scrollbar(self, *args):
+        count = self.row_count()
+        if args[0] == 'moveto':
+            self.first = int(float(args[1]) * count)
+        elif args[0] == 'scroll':
+            step = self.visible_rows if args[2] == 'pages' else 1
+            self.first += int(args[1]) * step
+        self.render()
+
+    def on_mousewheel(self, event):
+        return self.scroll_rows(-3 if event.delta > 0 else 3)
+
+    def on_resize(self, event):
+        rowheight = int(ttk.Style().lookup("Treeview", "rowheight") or 25)
+        visible_rows = max(1, (event.height - self.HEADING_HEIGHT) // rowheight)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.render()
+
+    def on_click(self, event):
+        # Выбор строк обрабатывается здесь, а не стандартной привязкой Tk:
+        # Tk знает только о строках в окне, а выбор может уходить за его края
+        iid = self.tree.identify_row(event.y)
+        if iid not in self.visible_iids:
+            return None
+        self.tree.focus_set()
+        position = self.first + self.visible_iids.index(iid)
+        key = self.get_row(position)[0]
+
+        if event.state & 0x0001 and self.selected_position is not None:
+            # Shift: диапазон от последней строки, выбранной без Shift
+            low, high = sorted((self.selected_position, position))
+            self.selected_keys = dict.fromkeys(self.row_key(p) for p in range(low, high + 1))
+            self.selected_key = key
+        elif event.state & 0x0004:
+            # Ctrl: добавить строку к выбору или убрать из него
+            self.selected_position = position
+            if key in self.selected_keys:
+                del self.selected_keys[key]
+                self.selected_key = next(reversed(self.selected_keys), None)
+            else:
+                self.selected_keys[key] = None
+                self.selected_key = key
+        else:
+            self.selected_position = position
+            self.selected_key = key
+            self.selected_keys = {key: None}
+
+        self.render()
+        if self.on_select:
+            self.on_select(self.selected_key)
+        return "break"
+
 class ImageLoader:
-    def __init__(self):
+    """Картинки интерфейса: декодируются при первом get_image.
+
+    Уменьшенные копии сохраняются на диск в кэш (ключ - путь к исходнику,
+    время его изменения и размер), поэтому при следующих запусках картинка
+    читается средствами Tk без PIL и без пересчета размера. Кэш ограничен
+    по объему: лишние файлы удаляются начиная с самых давно использованных.
+    """
+
+    IMAGES = {
+        'header_icon': ('header_icon.png', (64, 64)),
+        'clinic_logo': ('clinic_logo.png', (200, 100)),
+        'tools_decor': ('tools_decor.png', (40, 40)),
+        'patient_avatar': ('patient_avatar.png', (100, 100)),
+        'stats_decor': ('stats_decor.png', (50, 50)),
+    }
+
+    def __init__(self, cache_dir=None, cache_limit=IMAGE_CACHE_LIMIT):
         self.images = {}
-        
-    def load_images(self):
-        try:
-            self.images['header_icon'] = self.load_image('header_icon.png', (64, 64))
-            self.images['clinic_logo'] = self.load_image('clinic_logo.png', (200, 100))
-            self.images['tools_decor'] = self.load_image('tools_decor.png', (40, 40))
-            self.images['patient_avatar'] = self.load_image('patient_avatar.png', (100, 100))
-            self.images['stats_decor'] = self.load_image('stats_decor.png', (50, 50))
-            print("Все изображения успешно загружены!")
-        except Exception as e:
-            print(f"Ошибка загрузки изображений: {e}")
+        if cache_dir is None:
+            cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+            cache_dir = os.path.join(cache_home, 'dear_patients', 'images')
+        self.cache_dir = cache_dir
+        self.cache_limit = cache_limit
+        
+    def cache_path(self, image_path, size):
+        stat = os.stat(image_path)
+        key = f"{os.path.abspath(image_path)}|{stat.st_mtime_ns}|{size[0]}x{size[1]}"
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.png")
     
     def load_image(self, filename, size=None):
         image_path = os.path.join('images', filename)
         if not os.path.exists(image_path):
-            print(f"Файл {image_path} не найден")
+            log.warning("Файл %s не найден", image_path)
             return None
+        if not size:
+            return tk.PhotoImage(file=image_path)
+        
+        cache_path = self.cache_path(image_path, size)
+        if os.path.exists(cache_path):
+            try:
+                image = tk.PhotoImage(file=cache_path)
+                # Отметка времени нужна, чтобы при чистке кэша удалять
+                # самые давно использованные картинки
+                os.utime(cache_path)
+                return image
+            except (tk.TclError, OSError) as e:
+                log.debug("Кэш изображения %s не читается: %s", cache_path, e)
+        
+        from PIL import Image, ImageTk
         image = Image.open(image_path)
-        if size:
-            image = image.resize(size, Image.Resampling.LANCZOS)
+        image = image.resize(size, Image.Resampling.LANCZOS)
+        self.save_to_cache(image, cache_path)
         return ImageTk.PhotoImage(image)
     
+    def save_to_cache(self, image, cache_path):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = cache_path + '.tmp'
+            image.save(tmp_path, format='PNG')
+            os.replace(tmp_path, cache_path)
+            self.trim_cache()
+        except OSError as e:
+            log.warning("Не удалось сохранить изображение в кэш: %s", e)
+    
+    def trim_cache(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith('.png'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.cache_limit:
+                break
+            os.remove(path)
+            total -= size
+    
     def get_image(self, name):
-        return self.images.get(name)
+        if name not in self.images:
+            if name not in self.IMAGES:
+                return None
+            filename, size = self.IMAGES[name]
+            try:
+                self.images[name] = self.load_image(filename, size)
+            except Exception as e:
+                log.warning("Ошибка загрузки изображения %s: %s", filename, e)
+                self.images[name] = None
+        return self.images[name]
 
 class MedicalApp:
     def __init__(self, root):
@@ -123,17 +448,51 @@ class MedicalApp:
         self.root.geometry("1400x900")
         self.root.configure(bg=PRIMARY_BG)
         
+        # Картинки декодируются при первом показе
         self.image_loader = ImageLoader()
-        self.image_loader.load_images()
         
         self.patients_file = "patients.json"
+        self.storage = open_storage(self.patients_file, STORAGE_BACKEND)
         self.patients = self.load_patients()
+        self.data_version = 0
+        self.patient_stats = None
+        self.patient_sketch = None
+        self.search_index = None
+        self.duplicate_index = None
+        # Изменения, сделанные, пока индекс дублей строится в потоке
+        self.duplicate_changes = None
+        self.filtered_patients = None
+        # Результат фильтра и позиции записей в нем по id
+        self.filtered_positions = (None, {})
+        self.filter_job = None
+        self.sort_field = None
+        self.sort_descending = False
         
         self.setup_styles()
         self.create_interface()
         
-        self.chart_canvases = []
-        self.selected_patient_index = None
+        self.chart_cache = {}
+        self.selected_patient_id = None
+        
+        if WARMUP_CHARTS is not None:
+            self.root.after(WARMUP_CHARTS, self.warm_up_charts)
+        if DUPLICATE_INDEX_DELAY is not None:
+            self.root.after(DUPLICATE_INDEX_DELAY, self.build_duplicate_index)
+        
+        self.diagnostics_window = None
+        self.root.bind('<Control-Shift-D>', self.show_diagnostics)
+        
+        if SYNC_INTERVAL is not None:
+            self.root.after(SYNC_INTERVAL, self.watch_storage)
+    
+    def warm_up_charts(self):
+        def warm_up():
+            try:
+                import patient_charts
+                import patient_stats
+            except Exception as e:
+                log.warning("Не удалось заранее загрузить модули графиков: %s", e)
+        threading.Thread(target=warm_up, daemon=True).start()
     
     def setup_styles(self):
         style = ttk.Style()
@@ -177,6 +536,7 @@ class MedicalApp:
         self.create_header(main_frame)
         self.create_logo_section(main_frame)
         self.create_control_panel(main_frame)
+        self.create_search_bar(main_frame)
         self.create_patients_table(main_frame)
         
         self.charts_container = ttk.Frame(main_frame, style='Modern.TFrame')
@@ -238,11 +598,161 @@ class MedicalApp:
                      width=130, height=35, bg_color=ACCENT_ORANGE,
                      hover_color=HOVER_ORANGE).pack(side='left', padx=5)
         
+        RoundedButton(buttons_frame, "Сеть клиник", 
+                     command=self.show_network_statistics,
+                     width=130, height=35, bg_color=ACCENT_ORANGE,
+                     hover_color=HOVER_ORANGE).pack(side='left', padx=5)
+        
+        RoundedButton(buttons_frame, "Дубли", 
+                     command=self.show_duplicates,
+                     width=100, height=35, bg_color=ACCENT_ORANGE,
+                     hover_color=HOVER_ORANGE).pack(side='left', padx=5)
+        
         RoundedButton(buttons_frame, "Удалить", 
                      command=self.delete_patient,
                      width=100, height=35, bg_color=ACCENT_RED,
                      hover_color=HOVER_RED).pack(side='left', padx=5)
         
+        RoundedButton(buttons_frame, "Импорт", 
+                     command=self.import_patients_file,
+                     width=100, height=35, bg_color=ACCENT_BLUE,
+                     hover_color=HOVER_BLUE).pack(side='left', padx=5)
+        
+        RoundedButton(buttons_frame, "Экспорт", 
+                     command=self.export_patients_file,
+                     width=100, height=35, bg_color=ACCENT_BLUE,
+                     hover_color=HOVER_BLUE).pack(side='left', padx=5)
+        
+        self.status_label = ttk.Label(control_frame, text="", style='Regular.TLabel')
+        self.status_label.pack(side='left', padx=10)
+        
+    def create_search_bar(self, parent):
+        search_frame = ttk.Frame(parent, style='Modern.TFrame')
+        search_frame.pack(fill='x', pady=(0, 10))
+        
+        self.search_var = tk.StringVar()
+        self.age_from_var = tk.StringVar()
+        self.age_to_var = tk.StringVar()
+        self.bmi_from_var = tk.StringVar()
+        self.bmi_to_var = tk.StringVar()
+        
+        ttk.Label(search_frame, text="Поиск по ФИО:", style='Regular.TLabel').pack(side='left', padx=(10, 5))
+        ttk.Entry(search_frame, width=30, textvariable=self.search_var,
+                  font=('Georgia', 10)).pack(side='left', padx=5)
+        
+        for label, from_var, to_var in (("Возраст от", self.age_from_var, self.age_to_var),
+                                        ("ИМТ от", self.bmi_from_var, self.bmi_to_var)):
+            ttk.Label(search_frame, text=label, style='Regular.TLabel').pack(side='left', padx=(15, 5))
+            ttk.Entry(search_frame, width=6, textvariable=from_var,
+                      font=('Georgia', 10)).pack(side='left')
+            ttk.Label(search_frame, text="до", style='Regular.TLabel').pack(side='left', padx=5)
+            ttk.Entry(search_frame, width=6, textvariable=to_var,
+                      font=('Georgia', 10)).pack(side='left')
+        
+        RoundedButton(search_frame, "Сбросить", 
+                     command=self.reset_filter,
+                     width=110, height=30, bg_color=ACCENT_ORANGE,
+                     hover_color=HOVER_ORANGE).pack(side='left', padx=15)
+        
+        for var in (self.search_var, self.age_from_var, self.age_to_var,
+                    self.bmi_from_var, self.bmi_to_var):
+            var.trace_add('write', self.schedule_filter)
+    
+    def schedule_filter(self, *args):
+        # Фильтр применяется, когда пользователь перестал печатать
+        if self.filter_job is not None:
+            self.root.after_cancel(self.filter_job)
+        self.filter_job = self.root.after(200, self.run_filter)
+    
+    def run_filter(self):
+        with metrics.action('Поиск'):
+            self.apply_filter()
+    
+    def get_search_index(self):
+        # Индексы строятся при первом поиске, дальше только обновляются
+        if self.search_index is None:
+            self.search_index = PatientIndex(self.patients)
+        return self.search_index
+    
+    def get_duplicate_index(self):
+        """Индекс дублей; None, пока он строится в потоке"""
+        if self.duplicate_index is None and self.duplicate_changes is None:
+            self.build_duplicate_index()
+        return self.duplicate_index
+    
+    def build_duplicate_index(self):
+        """Строит индекс дублей в потоке по копии списка.
+
+        Изменения, сделанные за это время, копятся в duplicate_changes и
+        вливаются в готовый индекс. Если список успели перезагрузить, индекс
+        по старой копии выбрасывается.
+        """
+        if self.duplicate_index is not None:
+            return
+        patients = list(self.patients)
+        changes = self.duplicate_changes = []
+        results = queue.Queue()
+        
+        def worker():
+            try:
+                with metrics.timer('duplicates.build'):
+                    results.put(DuplicateIndex(patients))
+            except Exception as e:
+                results.put(e)
+        
+        def poll():
+            try:
+                index = results.get_nowait()
+            except queue.Empty:
+                self.root.after(100, poll)
+                return
+            if changes is not self.duplicate_changes:
+                return
+            self.duplicate_changes = None
+            if isinstance(index, Exception):
+                log.warning("Не удалось построить индекс дублей: %s", index)
+                return
+            for added, removed in changes:
+                for patient in removed:
+                    index.remove(patient)
+                for patient in added:
+                    index.add(patient)
+            self.duplicate_index = index
+        
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(100, poll)
+    
+    def filter_is_active(self):
+        return any(var.get().strip() for var in (self.search_var, self.age_from_var,
+                                                 self.age_to_var, self.bmi_from_var,
+                                                 self.bmi_to_var))
+    
+    def filter_patients(self):
+        """Пациенты под текущий фильтр в текущем порядке сортировки"""
+        patients = self.get_search_index().search(
+            self.search_var.get(),
+            age_range=(parse_number(self.age_from_var.get()), parse_number(self.age_to_var.get())),
+            bmi_range=(parse_number(self.bmi_from_var.get()), parse_number(self.bmi_to_var.get())))
+        if self.sort_field is not None:
+            patients = self.get_search_index().sort_patients(
+                patients, self.sort_field, self.sort_descending)
+        return patients
+    
+    def apply_filter(self):
+        self.filter_job = None
+        if self.filter_is_active():
+            self.filtered_patients = self.filter_patients()
+        else:
+            self.filtered_patients = None
+        self.table.clear_selection()
+        self.table.first = 0
+        self.load_patients_data()
+    
+    def reset_filter(self):
+        for var in (self.search_var, self.age_from_var, self.age_to_var,
+                    self.bmi_from_var, self.bmi_to_var):
+            var.set('')
+    
     def create_patients_table(self, parent):
         table_frame = ttk.Frame(parent, style='Modern.TFrame')
         table_frame.pack(fill='both', expand=True, pady=10)
@@ -252,7 +762,13 @@ class MedicalApp:
                  style='Subtitle.TLabel').pack(anchor='w')
         
         columns = ("ФИО", "Возраст", "Пол", "Рост", "Вес", "ИМТ")
-        self.tree = ttk.Treeview(table_frame, columns=columns, show="headings", height=8)
+        self.column_fields = dict(zip(columns, ('name', 'age', 'gender', 'height', 'weight', 'bmi')))
+        self.table = VirtualTreeview(table_frame, columns,
+                                     row_count=self.view_count,
+                                     fetch_row=self.patient_row_values,
+                                     row_key=self.patient_row_key,
+                                     on_select=self.on_patient_select)
+        self.tree = self.table.tree
         
         style = ttk.Style()
         style.configure("Treeview", font=('Georgia', 9), background="white", rowheight=25)
@@ -261,82 +777,200 @@ class MedicalApp:
         style.map("Treeview.Heading", background=[('active', HOVER_BLUE)])
         
         for col in columns:
-            self.tree.heading(col, text=col)
+            self.tree.heading(col, text=col, command=lambda col=col: self.run_sort(col))
             self.tree.column(col, width=120)
         
-        self.tree.bind('<<TreeviewSelect>>', self.on_patient_select)
+        self.table.pack(fill='both', expand=True)
         
-        scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.load_patients_data()
+    
+    def run_sort(self, column):
+        with metrics.action(f"Сортировка: {column}"):
+            self.sort_by(column)
+    
+    def sort_by(self, column):
+        # Повторный щелчок по тому же столбцу меняет направление
+        field = self.column_fields[column]
+        if self.sort_field == field:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_field = field
+            self.sort_descending = False
+        self.update_headings()
         
-        self.tree.pack(side='left', fill='both', expand=True)
-        scrollbar.pack(side='right', fill='y')
+        if self.filtered_patients is not None:
+            self.filtered_patients = self.get_search_index().sort_patients(
+                self.filtered_patients, self.sort_field, self.sort_descending)
         
+        self.table.first = 0
         self.load_patients_data()
+        if self.selected_patient_id is not None:
+            # Выбранный пациент остается выбранным на новом месте
+            position = self.view_position(self.selected_patient_id)
+            if position is None:
+                self.table.clear_selection()
+            else:
+                self.table.select(position)
     
-    def on_patient_select(self, event):
-        selected = self.tree.selection()
-        if selected:
-            item = selected[0]
-            index = self.tree.index(item)
-            self.selected_patient_index = index
-        else:
-            self.selected_patient_index = None
+    def update_headings(self):
+        for column, field in self.column_fields.items():
+            arrow = ''
+            if field == self.sort_field:
+                arrow = ' ▼' if self.sort_descending else ' ▲'
+            self.tree.heading(column, text=column + arrow)
+    
+    def view_count(self):
+        if self.filtered_patients is not None:
+            return len(self.filtered_patients)
+        return len(self.patients)
+    
+    def view_patient(self, position):
+        if self.filtered_patients is not None:
+            return self.filtered_patients[position]
+        if self.sort_field is not None:
+            return self.get_search_index().sorted_patient(self.sort_field, position,
+                                                          self.sort_descending)
+        return self.patients[position]
+    
+    def view_position(self, patient_id):
+        """Строка пациента в таблице; None, если его в таблице нет"""
+        if self.filtered_patients is not None:
+            if self.filtered_positions[0] is not self.filtered_patients:
+                # Позиции считаются один раз на каждый новый результат фильтра
+                self.filtered_positions = (self.filtered_patients, {
+                    patient.id: position
+                    for position, patient in enumerate(self.filtered_patients)})
+            return self.filtered_positions[1].get(patient_id)
+        patient = self.patients.get(patient_id)
+        if patient is None:
+            return None
+        if self.sort_field is not None:
+            return self.get_search_index().sort_position(self.sort_field, patient,
+                                                         self.sort_descending)
+        return self.patients.position(patient_id)
+    
+    def patient_row_key(self, position):
+        return self.view_patient(position).id
+    
+    def on_patient_select(self, patient_id):
+        # Строки таблицы - это id пациентов, при любом порядке и фильтре
+        self.selected_patient_id = patient_id
         
     def load_patients_data(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-            
-        for patient in self.patients:
-            bmi = self.calculate_bmi(patient['weight'], patient['height'])
-            self.tree.insert("", "end", values=(
-                patient['name'],
-                patient['age'],
-                patient['gender'],
-                patient['height'],
-                patient['weight'],
-                f"{bmi:.1f}"
-            ))
-    
-    def calculate_bmi(self, weight, height):
-        try:
-            height = float(height)
-            weight = float(weight)
-            
-            if height <= 0 or weight <= 0:
-                return float('nan')
-                
-            height_m = height / 100
-            bmi = weight / (height_m ** 2)
-            
-            if bmi < 10 or bmi > 100:
-                return float('nan')
-                
-            return bmi
-        except (ValueError, TypeError, ZeroDivisionError):
-            return float('nan')
-    
-    def save_patients(self):
+        # Таблица виртуальная: перечитываются только строки в окне
+        with metrics.timer('load_patients_data'):
+            self.table.refresh()
+    
+    def patient_row_values(self, position):
+        patient = self.view_patient(position)
+        return (
+            patient.name,
+            patient.age,
+            patient.gender,
+            patient.height,
+            patient.weight,
+            f"{patient.bmi:.1f}"
+        )
+    
+    def save_patients(self, changes):
+        """Записывает изменения, а затем применяет их к списку и индексам.
+
+        Если записать не удалось, список в памяти не меняется. О неудаче
+        метод сообщает сам и возвращает False.
+        """
+        metrics.count('saved_changes', len(changes))
+        removed = [self.patients.get(patient_id) for op, patient_id, patient in changes
+                   if op != 'add' and patient_id in self.patients]
         try:
-            with open(self.patients_file, 'w', encoding='utf-8') as f:
-                json.dump(self.patients, f, ensure_ascii=False, indent=2)
-            return True
+            with metrics.timer('save_patients', changes=len(changes)):
+                changes = self.storage.commit(self.patients, changes)
+        except StorageConflictError as e:
+            # Список в памяти разошелся с файлом - перечитываем базу
+            self.reload_patients()
+            messagebox.showwarning("Данные изменены",
+                                   f"{e}.\nДанные перечитаны, повторите изменение.")
+            return False
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось сохранить данные: {e}")
             return False
+        self.data_version += 1
+        self.update_indexes(added=[patient for op, patient_id, patient in changes
+                                   if patient is not None],
+                            removed=removed)
+        return True
+    
+    def watch_storage(self):
+        """Периодически забирает изменения, сделанные на других рабочих местах"""
+        try:
+            with metrics.timer('sync_patients'):
+                changes = self.storage.sync(self.patients)
+            if changes:
+                self.apply_external_changes(changes)
+        except Exception as e:
+            log.warning("Не удалось проверить изменения базы: %s", e)
+        self.root.after(SYNC_INTERVAL, self.watch_storage)
+    
+    def apply_external_changes(self, changes):
+        """Вливает чужие изменения по одной записи: список, индексы и видимые строки"""
+        added = []
+        removed = []
+        for op, patient_id, patient in changes:
+            old_patient = self.patients.get(patient_id)
+            if op == 'add' and old_patient is not None:
+                op = 'update'
+            elif op != 'add' and old_patient is None:
+                continue
+            apply_change(self.patients, (op, patient_id, patient))
+            if old_patient is not None:
+                removed.append(old_patient)
+            if patient is not None:
+                added.append(patient)
+        self.data_version += 1
+        metrics.count('synced_changes', len(changes))
+        self.update_indexes(added=added, removed=removed)
+        
+        for patient in removed:
+            if patient.id not in self.patients:
+                self.table.selected_keys.pop(patient.id, None)
+        if self.selected_patient_id is not None and self.selected_patient_id not in self.patients:
+            self.table.clear_selection()
+        if self.filtered_patients is not None:
+            # Позиция прокрутки и выбор сохраняются, меняются только строки
+            self.filtered_patients = self.filter_patients()
+        self.load_patients_data()
+        self.status_label.config(text=f"Изменения с других рабочих мест: {len(changes)}")
+    
+    def reload_patients(self):
+        """Полная перезагрузка - только когда чужие изменения не слить по записям"""
+        self.patients = self.load_patients()
+        self.data_version += 1
+        self.search_index = None
+        self.duplicate_index = None
+        self.build_duplicate_index()
+        self.patient_sketch = None
+        self.patient_stats = None
+        self.table.clear_selection()
+        if self.filtered_patients is not None:
+            self.filtered_patients = self.filter_patients()
+        self.load_patients_data()
     
     def add_patient(self):
         self.show_patient_form()
     
     def edit_patient(self):
-        if self.selected_patient_index is None:
+        if self.selected_patient_id is None:
             messagebox.showwarning("Внимание", "Выберите пациента для редактирования")
             return
         
-        patient_data = self.patients[self.selected_patient_index]
-        self.show_patient_form(patient_data, self.selected_patient_index)
+        patient_ids = list(self.table.selected_keys)
+        if len(patient_ids) > 1:
+            self.show_bulk_edit_form(patient_ids)
+            return
+        
+        patient_data = self.patients.get(self.selected_patient_id)
+        self.show_patient_form(patient_data, self.selected_patient_id)
     
-    def show_patient_form(self, patient_data=None, patient_index=None):
+    def show_patient_form(self, patient_data=None, patient_id=None):
         form_window = tk.Toplevel(self.root)
         form_window.title("Редактирование пациента" if patient_data else "Новый пациент")
         form_window.geometry("400x500")
@@ -353,11 +987,17 @@ class MedicalApp:
         self.weight_var = tk.StringVar()
         
         if patient_data:
-            self.name_var.set(patient_data.get('name', ''))
-            self.age_var.set(str(patient_data.get('age', '')))
-            self.gender_var.set(patient_data.get('gender', 'М'))
-            self.height_var.set(str(patient_data.get('height', '')))
-            self.weight_var.set(str(patient_data.get('weight', '')))
+            self.name_var.set(patient_data.name)
+            self.age_var.set(str(patient_data.age))
+            gender_code = patient_data.gender_code
+            if gender_code == GENDER_FEMALE:
+                self.gender_var.set("Ж")
+            elif gender_code == GENDER_MALE:
+                self.gender_var.set("М")
+            else:
+                self.gender_var.set(patient_data.gender or 'М')
+            self.height_var.set(str(patient_data.height))
+            self.weight_var.set(str(patient_data.weight))
         
         avatar = self.image_loader.get_image('patient_avatar')
         if avatar:
@@ -393,80 +1033,416 @@ class MedicalApp:
         button_frame.pack(fill='x', pady=20)
         
         save_text = "Сохранить изменения" if patient_data else "Добавить пациента"
-        save_command = lambda: self.save_patient_data(patient_index, form_window)
+        save_command = lambda: self.save_patient_data(patient_id, form_window)
         
         RoundedButton(button_frame, save_text, 
                      command=save_command,
                      width=200, height=40, bg_color=ACCENT_GREEN,
                      hover_color=HOVER_GREEN).pack()
     
-    def save_patient_data(self, patient_index, window):
-        if not self.name_var.get().strip():
-            messagebox.showwarning("Ошибка", "Введите ФИО пациента")
-            return
-        
+    def save_patient_data(self, patient_id, window):
         try:
-            age = int(self.age_var.get())
-            height = float(self.height_var.get())
-            weight = float(self.weight_var.get())
-            
-            if age <= 0 or height <= 0 or weight <= 0:
-                raise ValueError("Значения должны быть положительными")
-                
-        except ValueError as e:
-            messagebox.showwarning("Ошибка", "Проверьте корректность введенных данных:\n- Возраст - целое число\n- Рост и вес - числа больше 0")
+            patient_data = validate_patient(self.name_var.get(), self.age_var.get(),
+                                            self.gender_var.get(), self.height_var.get(),
+                                            self.weight_var.get())
+        except PatientValidationError as e:
+            messagebox.showwarning("Ошибка", str(e))
             return
         
-        patient_data = {
-            'name': self.name_var.get().strip(),
-            'age': age,
-            'gender': self.gender_var.get(),
-            'height': height,
-            'weight': weight
-        }
+        if patient_id is not None and patient_id not in self.patients:
+            window.destroy()
+            messagebox.showwarning("Ошибка", "Пациента уже удалили на другом рабочем месте")
+            return
         
-        if patient_index is not None:
-            self.patients[patient_index] = patient_data
+        # Похожих пациентов ищем для новой записи и при смене ФИО или возраста
+        old_patient = self.patients.get(patient_id) if patient_id is not None else None
+        duplicate_index = self.get_duplicate_index()
+        if duplicate_index is None:
+            self.status_label.config(text="Проверка на дубли пропущена: индекс еще строится")
+        elif old_patient is None or (old_patient.name, old_patient.age) != (patient_data.name,
+                                                                             patient_data.age):
+            with metrics.timer('duplicates.find'):
+                duplicates = duplicate_index.find(patient_data, exclude=patient_id)
+            if duplicates and not self.confirm_duplicates(duplicates, window):
+                return
+        
+        if patient_id is not None:
+            change = ('update', patient_id, patient_data)
         else:
-            self.patients.append(patient_data)
-        
-        if self.save_patients():
-            self.load_patients_data()
+            change = ('add', None, patient_data)
+        
+        if self.save_patients([change]):
+            if self.filtered_patients is not None:
+                # Запись могла перестать подходить под фильтр - запрос по
+                # индексам дешевый, просто выполняем его заново
+                self.apply_filter()
+            elif self.sort_field is not None:
+                # Запись могла переехать на другое место в порядке сортировки
+                self.table.refresh()
+                position = self.view_position(patient_data.id)
+                if position is not None:
+                    self.table.select(position)
+            elif patient_id is not None:
+                self.table.refresh_row(self.patients.position(patient_id))
+            else:
+                self.table.refresh()
+                self.table.select(len(self.patients) - 1)
             window.destroy()
             messagebox.showinfo("Успех", "Данные пациента сохранены")
-        else:
-            messagebox.showerror("Ошибка", "Не удалось сохранить данные")
+    
+    def confirm_duplicates(self, duplicates, window):
+        lines = [f"{patient.name}, возраст {patient.age}, пол {patient.gender} (запись {patient.id})"
+                 for score, patient in duplicates[:DUPLICATES_SHOWN]]
+        if len(duplicates) > DUPLICATES_SHOWN:
+            lines.append(f"и еще {len(duplicates) - DUPLICATES_SHOWN}")
+        return messagebox.askyesno("Возможный дубль",
+                                   "Похожие пациенты уже есть в базе:\n" + "\n".join(lines) +
+                                   "\n\nВсе равно сохранить?", parent=window)
+    
+    def show_bulk_edit_form(self, patient_ids):
+        form_window = tk.Toplevel(self.root)
+        form_window.title("Изменение выбранных пациентов")
+        form_window.geometry("400x320")
+        form_window.configure(bg=PRIMARY_BG)
+        form_window.resizable(False, False)
+        
+        form_window.transient(self.root)
+        form_window.grab_set()
+        
+        field_var = tk.StringVar(value=BULK_EDIT_FIELDS[0][0])
+        value_var = tk.StringVar()
+        
+        form_frame = ttk.Frame(form_window, style='Modern.TFrame')
+        form_frame.pack(fill='both', expand=True, padx=20)
+        
+        ttk.Label(form_frame, text=f"Выбрано пациентов: {len(patient_ids)}",
+                  style='Subtitle.TLabel').pack(anchor='w', pady=(15, 5))
+        
+        ttk.Label(form_frame, text="Поле:", style='Subtitle.TLabel').pack(anchor='w', pady=(10, 5))
+        ttk.Combobox(form_frame, textvariable=field_var, state='readonly', font=('Georgia', 10),
+                     values=[label for label, field in BULK_EDIT_FIELDS]).pack(fill='x', pady=5)
+        
+        ttk.Label(form_frame, text="Новое значение:", style='Subtitle.TLabel').pack(anchor='w', pady=(10, 5))
+        ttk.Entry(form_frame, width=30, textvariable=value_var, font=('Georgia', 10)).pack(fill='x', pady=5)
+        
+        button_frame = ttk.Frame(form_frame, style='Modern.TFrame')
+        button_frame.pack(fill='x', pady=20)
+        
+        save_command = lambda: self.apply_bulk_edit(
+            patient_ids, dict(BULK_EDIT_FIELDS)[field_var.get()], value_var.get(), form_window)
+        
+        RoundedButton(button_frame, "Применить", 
+                     command=save_command,
+                     width=200, height=40, bg_color=ACCENT_GREEN,
+                     hover_color=HOVER_GREEN).pack()
+    
+    def apply_bulk_edit(self, patient_ids, field, value, window):
+        if field == 'gender' and normalize_gender(value) == GENDER_UNKNOWN:
+            messagebox.showwarning("Ошибка", "Укажите пол: М или Ж")
+            return
+        
+        # Записи, удаленные на другом рабочем месте, пока форма была открыта
+        missing = [patient_id for patient_id in patient_ids if patient_id not in self.patients]
+        if missing:
+            window.destroy()
+            messagebox.showwarning("Ошибка", f"Часть выбранных пациентов уже удалили на другом "
+                                             f"рабочем месте: {len(missing)}.\nВыберите записи заново.")
+            return
+        
+        # Сначала проверяем все записи: пачка применяется целиком или никак
+        updated = []
+        rejected = []
+        for patient_id in patient_ids:
+            patient = self.patients.get(patient_id)
+            fields = {name: getattr(patient, name) for name in Patient.FIELDS}
+            fields[field] = value
+            try:
+                updated.append((patient, validate_patient(**fields)))
+            except PatientValidationError as e:
+                rejected.append((patient, e))
+        
+        if rejected:
+            patient, error = rejected[0]
+            messagebox.showwarning("Ошибка", f"Изменения не применены, записей с ошибками: "
+                                             f"{len(rejected)}\n\n{patient.name}: {error}")
+            return
+        
+        if self.save_patients([('update', old.id, new) for old, new in updated]):
+            if self.filtered_patients is not None:
+                # Записи могли перестать подходить под фильтр
+                self.apply_filter()
+            else:
+                self.load_patients_data()
+            window.destroy()
+            messagebox.showinfo("Успех", f"Изменено пациентов: {len(updated)}")
+    
+    def update_indexes(self, added=(), removed=()):
+        """Учитывает новые и удаленные записи в индексах поиска и в сводке статистики.
+
+        Измененная запись передается дважды: старая - в removed, новая - в added.
+        """
+        if self.patient_sketch is not None:
+            if removed:
+                self.patient_sketch.remove(removed)
+            if added:
+                self.patient_sketch.add(added)
+        if self.duplicate_changes is not None:
+            self.duplicate_changes.append((list(added), list(removed)))
+        
+        if len(added) + len(removed) >= INDEX_REBUILD_FROM:
+            # Большую пачку дешевле учесть, построив индексы заново при
+            # следующем поиске, чем вставлять записи по одной
+            self.search_index = None
+            if self.duplicate_index is not None:
+                self.duplicate_index = None
+                self.build_duplicate_index()
+            return
+        for index in (self.search_index, self.duplicate_index):
+            if index is None:
+                continue
+            for patient in removed:
+                index.remove(patient)
+            for patient in added:
+                index.add(patient)
     
     def delete_patient(self):
-        if self.selected_patient_index is None:
+        if self.selected_patient_id is None:
             messagebox.showwarning("Внимание", "Выберите пациента для удаления")
             return
         
-        patient_name = self.patients[self.selected_patient_index]['name']
+        patient_ids = list(self.table.selected_keys) or [self.selected_patient_id]
+        if len(patient_ids) == 1:
+            question = (f"Вы уверены, что хотите удалить пациента:\n"
+                        f"{self.patients.get(patient_ids[0]).name}?")
+        else:
+            question = f"Вы уверены, что хотите удалить выбранных пациентов ({len(patient_ids)})?"
         
-        result = messagebox.askyesno(
-            "Подтверждение удаления", 
-            f"Вы уверены, что хотите удалить пациента:\n{patient_name}?",
-            icon='warning'
-        )
+        result = messagebox.askyesno("Подтверждение удаления", question, icon='warning')
         
         if result:
-            del self.patients[self.selected_patient_index]
-            
-            if self.save_patients():
-                self.selected_patient_index = None
+            # Вся пачка - одно сохранение и один проход по списку
+            if self.save_patients([('delete', patient_id, None) for patient_id in patient_ids]):
+                if self.filtered_patients is not None:
+                    removed_ids = set(patient_ids)
+                    self.filtered_patients = [p for p in self.filtered_patients
+                                              if p.id not in removed_ids]
+                self.table.clear_selection()
                 self.load_patients_data()
-                messagebox.showinfo("Успех", "Пациент удален")
+                if len(patient_ids) == 1:
+                    messagebox.showinfo("Успех", "Пациент удален")
+                else:
+                    messagebox.showinfo("Успех", f"Удалено пациентов: {len(patient_ids)}")
+    
+    def import_patients_file(self):
+        path = filedialog.askopenfilename(
+            parent=self.root, title="Импорт пациентов",
+            filetypes=[("CSV и JSON Lines", "*.csv *.jsonl *.ndjson"), ("Все файлы", "*.*")])
+        if not path:
+            return
+        
+        chunks = import_chunks(path)
+        imported = []
+        rejected = []
+        
+        # Файл разбирается порциями между событиями Tk, чтобы окно не
+        # зависало; в хранилище все записи уходят одним сохранением
+        def next_chunk():
+            try:
+                accepted, chunk_rejected = next(chunks)
+            except StopIteration:
+                self.finish_import(path, imported, rejected)
+                return
+            except Exception as e:
+                self.status_label.configure(text="")
+                messagebox.showerror("Ошибка", f"Не удалось прочитать файл: {e}")
+                return
+            imported.extend(accepted)
+            rejected.extend(chunk_rejected)
+            self.status_label.configure(
+                text=f"Импорт: принято {len(imported)}, отклонено {len(rejected)}")
+            self.root.after(1, next_chunk)
+        
+        next_chunk()
+    
+    def finish_import(self, path, imported, rejected):
+        self.status_label.configure(text="")
+        if imported:
+            if not self.save_patients([('add', None, patient) for patient in imported]):
+                return
+            if self.filtered_patients is not None:
+                self.apply_filter()
             else:
-                messagebox.showerror("Ошибка", "Не удалось удалить пациента")
+                self.load_patients_data()
+        
+        message = f"Файл: {os.path.basename(path)}\nДобавлено пациентов: {len(imported)}\nОтклонено строк: {len(rejected)}"
+        if rejected:
+            self.show_import_report(message, rejected)
+        else:
+            messagebox.showinfo("Импорт", message)
     
-    def show_statistics(self):
+    def show_import_report(self, message, rejected):
+        report_window = tk.Toplevel(self.root)
+        report_window.title("Результаты импорта")
+        report_window.geometry("600x400")
+        report_window.configure(bg=PRIMARY_BG)
+        
+        ttk.Label(report_window, text=message, style='Regular.TLabel').pack(anchor='w', padx=10, pady=10)
+        
+        text = tk.Text(report_window, font=('Georgia', 9), wrap='none')
+        scrollbar = ttk.Scrollbar(report_window, orient="vertical", command=text.yview)
+        text.configure(yscrollcommand=scrollbar.set)
+        text.insert('end', '\n'.join(f"Строка {line}: {reason}" for line, reason in rejected))
+        text.configure(state='disabled')
+        
+        text.pack(side='left', fill='both', expand=True, padx=(10, 0), pady=(0, 10))
+        scrollbar.pack(side='right', fill='y', pady=(0, 10))
+    
+    def export_patients_file(self):
+        path = filedialog.asksaveasfilename(
+            parent=self.root, title="Экспорт пациентов", defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl")])
+        if not path:
+            return
+        
+        # Выгружается то, что сейчас видно в таблице (с учетом фильтра)
+        patients = self.filtered_patients if self.filtered_patients is not None else self.patients
+        try:
+            count = export_patients(patients, path)
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось выгрузить данные: {e}")
+            return
+        messagebox.showinfo("Экспорт", f"Выгружено пациентов: {count}")
+    
+    def show_network_statistics(self):
+        directory = filedialog.askdirectory(parent=self.root, title="Папка с файлами клиник")
+        if not directory:
+            return
+        
+        from patient_shards import shard_files, aggregate_shards
+        
+        paths = shard_files(directory)
+        if not paths:
+            messagebox.showinfo("Статистика", "В папке нет файлов пациентов (*.json)")
+            return
+        
+        # Файлы разбираются в отдельных процессах, а окно в это время
+        # только опрашивает очередь
+        self.status_label.configure(text=f"Сбор статистики по файлам: {len(paths)}...")
+        results = queue.Queue()
+        
+        def worker():
+            try:
+                results.put(aggregate_shards(paths))
+            except Exception as e:
+                results.put(e)
+        
+        def poll():
+            try:
+                result = results.get_nowait()
+            except queue.Empty:
+                self.root.after(100, poll)
+                return
+            self.status_label.configure(text="")
+            if isinstance(result, Exception):
+                messagebox.showerror("Ошибка", f"Не удалось собрать статистику: {result}")
+                return
+            
+            sketch, errors = result
+            for path, error in errors:
+                log.warning("Файл %s пропущен: %s", path, error)
+            if sketch.size:
+                title = (f"Статистика сети: {os.path.basename(directory)} "
+                         f"(файлов {len(paths) - len(errors)}, пациентов {sketch.size})")
+                self.show_statistics(title, sketch.stats())
+            if errors:
+                skipped = "\n".join(os.path.basename(path) for path, error in errors)
+                messagebox.showwarning("Статистика", f"Не удалось прочитать файлы:\n{skipped}")
+            elif not sketch.size:
+                messagebox.showinfo("Статистика", "Нет данных для построения графиков")
+        
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(100, poll)
+    
+    def show_duplicates(self):
+        """Отчет о возможных дублях по всей базе; собирается в фоновом потоке"""
         if not self.patients:
+            messagebox.showinfo("Дубли", "База пуста")
+            return
+        
+        self.status_label.configure(text="Поиск дублей...")
+        # Записи при изменении заменяются новыми, поэтому копии списка
+        # достаточно, чтобы окно могло работать дальше
+        patients = list(self.patients)
+        results = queue.Queue()
+        
+        def worker():
+            try:
+                with metrics.timer('duplicates.report', patients=len(patients)):
+                    results.put(find_duplicate_groups(patients))
+            except Exception as e:
+                results.put(e)
+        
+        def poll():
+            try:
+                result = results.get_nowait()
+            except queue.Empty:
+                self.root.after(100, poll)
+                return
+            self.status_label.configure(text="")
+            if isinstance(result, Exception):
+                messagebox.showerror("Ошибка", f"Не удалось найти дубли: {result}")
+            elif not result:
+                messagebox.showinfo("Дубли", "Похожих пациентов не найдено")
+            else:
+                self.show_duplicate_groups(result)
+        
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(100, poll)
+    
+    def show_duplicate_groups(self, groups):
+        window = tk.Toplevel(self.root)
+        window.title("Возможные дубли")
+        window.geometry("760x520")
+        window.configure(bg=PRIMARY_BG)
+        
+        records = sum(len(group) for group in groups)
+        ttk.Label(window, text=f"Групп похожих пациентов: {len(groups)}, записей: {records}",
+                  style='Subtitle.TLabel').pack(anchor='w', padx=10, pady=10)
+        
+        columns = ("Группа", "Запись", "ФИО", "Возраст", "Пол")
+        tree = ttk.Treeview(window, columns=columns, show='headings')
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=300 if col == "ФИО" else 80, anchor='w')
+        scrollbar = ttk.Scrollbar(window, orient='vertical', command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        
+        for number, group in enumerate(groups, 1):
+            for patient in group:
+                tree.insert('', 'end', values=(number, patient.id, patient.name,
+                                               patient.age, patient.gender))
+        
+        def save_report():
+            path = filedialog.asksaveasfilename(parent=window, defaultextension='.json',
+                                                filetypes=[("JSON", "*.json")])
+            if path:
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump([[patient.to_dict() for patient in group] for group in groups],
+                              f, ensure_ascii=False, indent=2)
+        
+        button_frame = ttk.Frame(window, style='Modern.TFrame')
+        button_frame.pack(side='bottom', fill='x', pady=10)
+        ttk.Button(button_frame, text="Сохранить отчет", command=save_report).pack(side='right', padx=10)
+        scrollbar.pack(side='right', fill='y')
+        tree.pack(fill='both', expand=True, padx=10)
+    
+    def show_statistics(self, title="Медицинская статистика", network_stats=None):
+        if network_stats is None and not self.patients:
             messagebox.showinfo("Статистика", "Нет данных для построения графиков")
             return
             
         stats_window = tk.Toplevel(self.root)
-        stats_window.title("Медицинская статистика")
+        stats_window.title(title)
         stats_window.geometry("1200x800")
         stats_window.configure(bg=PRIMARY_BG)
         
@@ -479,7 +1455,7 @@ class MedicalApp:
             icon_label.pack(side='left', padx=10)
         
         ttk.Label(title_frame, 
-                 text="Медицинская статистика", 
+                 text=title, 
                  style='Title.TLabel').pack(side='left')
         
         canvas = tk.Canvas(stats_window, bg=PRIMARY_BG, highlightthickness=0)
@@ -497,7 +1473,7 @@ class MedicalApp:
         canvas.pack(side="left", fill="both", expand=True, padx=10)
         scrollbar.pack(side="right", fill="y")
         
-        self.create_charts(scrollable_frame)
+        self.create_charts(scrollable_frame, title_frame, network_stats)
         
         button_frame = ttk.Frame(stats_window, style='Modern.TFrame')
         button_frame.pack(fill='x', pady=10)
@@ -507,230 +1483,274 @@ class MedicalApp:
                      width=200, height=40, bg_color=ACCENT_RED,
                      hover_color=HOVER_RED).pack()
     
-    def create_charts(self, parent):
-        try:
-            self.create_gender_chart(parent)
-            self.create_age_chart(parent)
-            self.create_bmi_gender_chart(parent)
-            self.create_bmi_age_chart(parent)
-        except Exception as e:
-            print(f"Ошибка создания графиков: {e}")
-            error_frame = ttk.Frame(parent, style='Modern.TFrame')
-            error_frame.pack(fill='x', pady=20)
-            ttk.Label(error_frame, 
-                     text=f"Ошибка при создании графиков: {str(e)}", 
-                     style='Subtitle.TLabel',
-                     foreground='red').pack()
-    
-    def create_gender_chart(self, parent):
-        """График распределения по полу - ИСПРАВЛЕННАЯ ВЕРСИЯ"""
-        gender_count = {'Мужчины': 0, 'Женщины': 0}
-        
-        # Отладочная информация
-        print("=== ДАННЫЕ ПАЦИЕНТОВ ДЛЯ ГРАФИКА ПОЛА ===")
-        for i, patient in enumerate(self.patients):
-            gender = patient.get('gender', '')
-            print(f"Пациент {i}: {patient.get('name')} - Пол: '{gender}'")
-            
-            # Универсальная проверка пола
-            gender_str = str(gender).lower().strip()
-            
-            if any(word in gender_str for word in ['м', 'муж', 'male', 'мужской', 'мужчина']):
-                gender_count['Мужчины'] += 1
-                print(f"  -> Определен как Мужчина")
-            elif any(word in gender_str for word in ['ж', 'жен', 'female', 'женский', 'женщина']):
-                gender_count['Женщины'] += 1
-                print(f"  -> Определен как Женщина")
+    def create_charts(self, parent, status_frame, network_stats=None):
+        """Графики по пациентам приложения или по готовым агрегатам сети клиник.
+
+        Картинки графиков сети не кэшируются - data_version к ним не относится.
+        """
+        from patient_charts import CHARTS
+        
+        pending = []
+        for title, create_chart in CHARTS:
+            chart_frame = ttk.Frame(parent, style='Modern.TFrame')
+            chart_frame.pack(fill='x', pady=10, padx=20)
+            # Если данные не менялись, показываем уже отрисованную картинку
+            cached = self.chart_cache.get(title) if network_stats is None else None
+            if cached is not None and cached[0] == self.data_version:
+                self.show_chart_image(chart_frame, title, cached[1])
             else:
-                print(f"  -> Пол не распознан: '{gender}'")
+                ttk.Label(chart_frame, 
+                         text=f"{title} - построение графика...", 
+                         style='Subtitle.TLabel',
+                         foreground=TEXT_SECONDARY).pack()
+                pending.append((title, create_chart, chart_frame))
         
-        print(f"Итоговый подсчет: {gender_count}")
-        print("=========================================")
-        
-        # Проверяем, есть ли данные для графика
-        total_patients = sum(gender_count.values())
-        if total_patients == 0:
-            self.show_no_data_message(parent, "Распределение по полу")
+        if not pending:
             return
         
-        fig, ax = plt.subplots(figsize=(8, 6))
-        colors = ['#93c572', '#78b478']
-        
-        labels = [f'Мужчины ({gender_count["Мужчины"]})', f'Женщины ({gender_count["Женщины"]})']
-        sizes = [gender_count['Мужчины'], gender_count['Женщины']]
-        
-        wedges, texts, autotexts = ax.pie(
-            sizes, 
-            labels=labels, 
-            autopct='%1.1f%%',
-            colors=colors, 
-            startangle=90,
-            textprops={'fontsize': 12, 'fontfamily': 'Georgia'}
-        )
-        
-        for autotext in autotexts:
-            autotext.set_color('white')
-            autotext.set_fontweight('bold')
-        
-        ax.set_title('Распределение пациентов по полу', 
-                    fontsize=14, fontfamily='Georgia', fontweight='bold', pad=20)
+        progress = ttk.Progressbar(status_frame, maximum=len(pending), length=200)
+        progress.pack(side='right', padx=20)
         
-        self.embed_chart(parent, fig, "Распределение по полу")
-    
-    def create_age_chart(self, parent):
-        ages = []
-        for patient in self.patients:
-            try:
-                age = float(patient.get('age', 0))
-                if 0 < age <= 120:
-                    ages.append(age)
-            except (ValueError, TypeError):
-                continue
+        data_version = self.data_version if network_stats is None else None
         
-        if not ages:
-            self.show_no_data_message(parent, "Распределение по возрасту")
+        if not ASYNC_STATISTICS:
+            stats = self.get_patient_stats() if network_stats is None else network_stats
+            for title, create_chart, chart_frame in pending:
+                result = self.render_chart(title, create_chart, stats)
+                self.finish_chart(chart_frame, progress, data_version, *result)
             return
         
-        fig, ax = plt.subplots(figsize=(8, 6))
-        bins = min(10, len(set(ages)))
-        n, bins, patches = ax.hist(ages, bins=bins, color='#93c572', alpha=0.7, 
-                                 edgecolor='white', linewidth=1.2)
-        
-        ax.set_title('Распределение пациентов по возрасту', 
-                    fontsize=14, fontfamily='Georgia', fontweight='bold', pad=20)
-        ax.set_xlabel('Возраст', fontfamily='Georgia', fontsize=12)
-        ax.set_ylabel('Количество пациентов', fontfamily='Georgia', fontsize=12)
-        ax.grid(True, alpha=0.3)
-        
-        self.embed_chart(parent, fig, "Распределение по возрасту")
-    
-    def create_bmi_gender_chart(self, parent):
-        bmi_data = {'Мужчины': [], 'Женщины': []}
-        
-        for patient in self.patients:
+        stats = network_stats
+        if stats is None and self.patient_stats and self.patient_stats[0] == data_version:
+            stats = self.patient_stats[1]
+        if stats is None and self.patient_sketch is not None:
+            # Сводка обновляется при каждом изменении - агрегаты по ней
+            # считаются сразу, сколько бы ни было пациентов
+            stats = self.patient_sketch.stats()
+            self.patient_stats = (data_version, stats)
+        use_sketch = len(self.patients) >= STATISTICS_SKETCH_FROM
+        # Список копируется целиком: пока поток рисует графики, пользователь
+        # может продолжать добавлять и удалять пациентов
+        patients = list(self.patients) if stats is None else None
+        results = queue.Queue()
+        
+        def worker():
+            nonlocal stats
+            from patient_stats import PatientColumns, PatientStats
             try:
-                bmi = self.calculate_bmi(patient.get('weight', 0), patient.get('height', 0))
-                if not math.isnan(bmi):
-                    gender_str = str(patient.get('gender', '')).lower().strip()
-                    
-                    if any(word in gender_str for word in ['м', 'муж', 'male', 'мужской', 'мужчина']):
-                        bmi_data['Мужчины'].append(bmi)
-                    elif any(word in gender_str for word in ['ж', 'жен', 'female', 'женский', 'женщина']):
-                        bmi_data['Женщины'].append(bmi)
-            except (ValueError, TypeError):
-                continue
-        
-        if not bmi_data['Мужчины'] and not bmi_data['Женщины']:
-            self.show_no_data_message(parent, "ИМТ по полу")
+                if stats is None and use_sketch:
+                    from patient_sketch import PatientSketch
+                    sketch = PatientSketch(patients)
+                    stats = sketch.stats()
+                    results.put(('sketch', sketch))
+                    results.put(('stats', stats))
+                elif stats is None:
+                    stats = PatientStats(PatientColumns(patients))
+                    results.put(('stats', stats))
+                for title, create_chart, chart_frame in pending:
+                    results.put(('chart', chart_frame, *self.render_chart(title, create_chart, stats)))
+            except Exception as e:
+                results.put(('error', e))
+            results.put(('done',))
+        
+        def poll():
+            while True:
+                try:
+                    item = results.get_nowait()
+                except queue.Empty:
+                    self.root.after(50, poll)
+                    return
+                kind = item[0]
+                if kind == 'sketch':
+                    # Сводку, посчитанную по устаревшему списку, не берем
+                    if self.data_version == data_version:
+                        self.patient_sketch = item[1]
+                elif kind == 'stats':
+                    if self.data_version == data_version:
+                        self.patient_stats = (data_version, item[1])
+                elif kind == 'chart':
+                    self.finish_chart(item[1], progress, data_version, *item[2:])
+                elif kind == 'error':
+                    self.show_charts_error(parent, item[1])
+                elif kind == 'done':
+                    return
+        
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(50, poll)
+    
+    def render_chart(self, title, create_chart, stats):
+        """Строит график и рисует его в PNG. Не трогает Tk, можно звать из потока"""
+        from patient_charts import render_chart_png
+        try:
+            with metrics.timer(create_chart.__name__):
+                fig = create_chart(stats)
+            if fig is None:
+                return title, None, None
+            with metrics.timer('render_chart_png'):
+                png = render_chart_png(fig)
+            return title, base64.b64encode(png).decode('ascii'), None
+        except Exception as e:
+            log.warning("Ошибка создания графика %s: %s", title, e)
+            return title, None, e
+    
+    def finish_chart(self, chart_frame, progress, data_version, title, image_data, error):
+        if error is None and data_version is not None:
+            self.chart_cache[title] = (data_version, image_data)
+        if not chart_frame.winfo_exists():
+            # Окно статистики успели закрыть - картинка остается в кэше
             return
-        
-        fig, ax = plt.subplots(figsize=(8, 6))
-        data = []
-        labels = []
-        colors = []
-        
-        if bmi_data['Мужчины']:
-            data.append(bmi_data['Мужчины'])
-            labels.append('Мужчины')
-            colors.append('#93c572')
-        
-        if bmi_data['Женщины']:
-            data.append(bmi_data['Женщины'])
-            labels.append('Женщины')
-            colors.append('#78b478')
-        
-        if data:
-            box_plot = ax.boxplot(data, labels=labels, patch_artist=True)
-            for patch, color in zip(box_plot['boxes'], colors):
-                patch.set_facecolor(color)
-                patch.set_alpha(0.7)
-            
-            ax.set_title('Распределение ИМТ по полу', 
-                        fontsize=14, fontfamily='Georgia', fontweight='bold', pad=20)
-            ax.set_ylabel('ИМТ', fontfamily='Georgia', fontsize=12)
-            ax.grid(True, alpha=0.3)
-            
-            self.embed_chart(parent, fig, "ИМТ по полу")
+        for child in chart_frame.winfo_children():
+            child.destroy()
+        if error is not None:
+            ttk.Label(chart_frame, 
+                     text=f"Ошибка отображения графика: {str(error)}", 
+                     foreground='red').pack()
         else:
-            self.show_no_data_message(parent, "ИМТ по полу")
+            self.show_chart_image(chart_frame, title, image_data)
+        progress.step(1)
+        if progress['value'] >= progress['maximum'] - 0.5:
+            progress.destroy()
     
-    def create_bmi_age_chart(self, parent):
-        ages = []
-        bmis = []
-        
-        for patient in self.patients:
-            try:
-                age = float(patient.get('age', 0))
-                bmi = self.calculate_bmi(patient.get('weight', 0), patient.get('height', 0))
-                
-                if 0 < age <= 120 and not math.isnan(bmi):
-                    ages.append(age)
-                    bmis.append(bmi)
-            except (ValueError, TypeError):
-                continue
-        
-        if len(ages) < 2:
-            self.show_no_data_message(parent, "ИМТ от возраста")
+    def show_charts_error(self, parent, error):
+        log.warning("Ошибка создания графиков: %s", error)
+        if not parent.winfo_exists():
             return
-        
-        fig, ax = plt.subplots(figsize=(8, 6))
-        scatter = ax.scatter(ages, bmis, color='#93c572', alpha=0.6, s=60)
-        
-        if len(ages) > 1:
-            try:
-                z = np.polyfit(ages, bmis, 1)
-                p = np.poly1d(z)
-                ax.plot(ages, p(ages), color='#d2a679', linestyle='--', alpha=0.8, linewidth=2)
-            except:
-                pass
-        
-        ax.set_title('Зависимость ИМТ от возраста', 
-                    fontsize=14, fontfamily='Georgia', fontweight='bold', pad=20)
-        ax.set_xlabel('Возраст', fontfamily='Georgia', fontsize=12)
-        ax.set_ylabel('ИМТ', fontfamily='Georgia', fontsize=12)
-        ax.grid(True, alpha=0.3)
-        
-        self.embed_chart(parent, fig, "ИМТ от возраста")
-    
-    def show_no_data_message(self, parent, chart_name):
-        no_data_frame = ttk.Frame(parent, style='Modern.TFrame')
-        no_data_frame.pack(fill='x', pady=10, padx=20)
-        ttk.Label(no_data_frame, 
-                 text=f"{chart_name} - недостаточно данных", 
+        error_frame = ttk.Frame(parent, style='Modern.TFrame')
+        error_frame.pack(fill='x', pady=20)
+        ttk.Label(error_frame, 
+                 text=f"Ошибка при создании графиков: {str(error)}", 
                  style='Subtitle.TLabel',
-                 foreground=TEXT_SECONDARY).pack()
+                 foreground='red').pack()
     
-    def embed_chart(self, parent, fig, title):
-        chart_frame = ttk.Frame(parent, style='Modern.TFrame')
-        chart_frame.pack(fill='x', pady=10, padx=20)
+    def get_patient_stats(self):
+        from patient_stats import PatientColumns, PatientStats
+        
+        # Массивы и агрегаты считаются один раз на версию данных
+        if self.patient_stats is None or self.patient_stats[0] != self.data_version:
+            if self.patient_sketch is None and len(self.patients) >= STATISTICS_SKETCH_FROM:
+                from patient_sketch import PatientSketch
+                self.patient_sketch = PatientSketch(self.patients)
+            if self.patient_sketch is not None:
+                stats = self.patient_sketch.stats()
+            else:
+                stats = PatientStats(PatientColumns(self.patients))
+            self.patient_stats = (self.data_version, stats)
+        return self.patient_stats[1]
+    
+    def show_chart_image(self, chart_frame, title, image_data):
+        with metrics.timer('show_chart_image'):
+            self.embed_chart(chart_frame, title, image_data)
+    
+    def embed_chart(self, chart_frame, title, image_data):
+        if image_data is None:
+            ttk.Label(chart_frame, 
+                     text=f"{title} - недостаточно данных", 
+                     style='Subtitle.TLabel',
+                     foreground=TEXT_SECONDARY).pack()
+            return
+        
         ttk.Label(chart_frame, 
                  text=title, 
                  style='Subtitle.TLabel').pack(anchor='w', pady=(0, 10))
-        try:
-            canvas = FigureCanvasTkAgg(fig, chart_frame)
-            canvas.draw()
-            canvas_widget = canvas.get_tk_widget()
-            canvas_widget.pack(fill='x', padx=10)
-            self.chart_canvases.append(canvas)
-        except Exception as e:
-            print(f"Ошибка встраивания графика {title}: {e}")
-            ttk.Label(chart_frame, 
-                     text=f"Ошибка отображения графика: {str(e)}", 
-                     foreground='red').pack()
+        photo = tk.PhotoImage(master=chart_frame, data=image_data)
+        chart_label = tk.Label(chart_frame, image=photo, bg=PRIMARY_BG)
+        # Без ссылки Tk удалит картинку вместе со сборкой мусора
+        chart_label.image = photo
+        chart_label.pack(fill='x', padx=10)
+    
+    def show_diagnostics(self, event=None):
+        """Скрытая панель диагностики: замеры времени, счетчики и профили действий"""
+        if self.diagnostics_window is not None and self.diagnostics_window.winfo_exists():
+            self.diagnostics_window.lift()
+            return
+        window = tk.Toplevel(self.root)
+        window.title("Диагностика")
+        window.geometry("760x560")
+        window.configure(bg=PRIMARY_BG)
+        self.diagnostics_window = window
+        
+        columns = ("Замер", "Вызовов", "Всего, мс", "Среднее, мс", "Макс., мс", "Последний, мс")
+        tree = ttk.Treeview(window, columns=columns, show='headings', height=12)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=100 if col != "Замер" else 220, anchor='w' if col == "Замер" else 'e')
+        tree.pack(fill='x', padx=10, pady=10)
+        
+        controls = ttk.Frame(window, style='Modern.TFrame')
+        controls.pack(fill='x', padx=10)
+        profile_var = tk.BooleanVar(value=metrics.profile_actions)
+        
+        def toggle_profiling():
+            metrics.profile_actions = profile_var.get()
+        
+        ttk.Checkbutton(controls, text="Профилировать действия (cProfile)",
+                        variable=profile_var, command=toggle_profiling).pack(side='left')
+        profile_choice = ttk.Combobox(controls, state='readonly', width=30)
+        profile_choice.pack(side='left', padx=10)
+        
+        profile_text = tk.Text(window, wrap='none', font=('Courier', 9), height=14)
+        profile_text.pack(fill='both', expand=True, padx=10, pady=10)
+        
+        def show_profile(event=None):
+            text = metrics.profiles.get(profile_choice.get(), '')
+            profile_text.delete('1.0', 'end')
+            profile_text.insert('1.0', text)
+        
+        profile_choice.bind('<<ComboboxSelected>>', show_profile)
+        
+        def refresh():
+            if not window.winfo_exists():
+                return
+            report = metrics.snapshot()
+            tree.delete(*tree.get_children())
+            for name, timer in sorted(report['timers'].items()):
+                tree.insert('', 'end', values=(name, timer['calls'], f"{timer['total_ms']:.1f}",
+                                               f"{timer['avg_ms']:.1f}", f"{timer['max_ms']:.1f}",
+                                               f"{timer['last_ms']:.1f}"))
+            for name, value in sorted(report['counters'].items()):
+                tree.insert('', 'end', values=(name, value, '', '', '', ''))
+            profile_choice['values'] = report['profiles']
+            window.after(1000, refresh)
+        
+        def save_report():
+            path = filedialog.asksaveasfilename(parent=window, defaultextension='.json',
+                                                filetypes=[("JSON", "*.json")])
+            if path:
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump({**metrics.snapshot(), 'profile_text': dict(metrics.profiles)},
+                              f, ensure_ascii=False, indent=2)
+        
+        def reset():
+            metrics.reset()
+            profile_text.delete('1.0', 'end')
+        
+        ttk.Button(controls, text="Сохранить отчет", command=save_report).pack(side='right')
+        ttk.Button(controls, text="Сбросить", command=reset).pack(side='right', padx=5)
+        refresh()
     
     def load_patients(self):
-        if os.path.exists(self.patients_file):
-            try:
-                with open(self.patients_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"Ошибка загрузки данных: {e}")
-        return []
+        try:
+            with metrics.timer('load_patients'):
+                patients = load_patients(self.storage)
+            metrics.count('loaded_patients', len(patients))
+            return patients
+        except Exception as e:
+            log.exception("Ошибка загрузки данных")
+            messagebox.showerror("Ошибка", f"Не удалось загрузить пациентов: {e}")
+        # Пустой список того же типа: добавление и правка работают и после ошибки
+        return PatientList()
 
 def main():
+    configure_logging(LOG_LEVEL)
+    if METRICS_LOG:
+        metrics.open_log(METRICS_LOG)
+    metrics.profile_actions = PROFILE_ACTIONS
+    metrics.profile_dir = PROFILE_DIR
     root = tk.Tk()
     app = MedicalApp(root)
     root.mainloop()
+    app.storage.close()
+    metrics.close()
 
 if __name__ == "__main__":
     main()
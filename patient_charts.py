@@ -0,0 +1,138 @@
+import io
+import logging
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import numpy as np
+
+# Графики статистики.
+#
+# Графики строятся по готовым агрегатам PatientStats и не зависят от Tk:
+# фигуры создаются напрямую через Figure (без pyplot с его глобальным
+# состоянием) и рисуются в PNG бэкендом Agg. Поэтому их можно строить и в
+# фоновом потоке приложения, и из командной строки на сервере без экрана.
+
+log = logging.getLogger('dear_patients.charts')
+
+
+def create_gender_chart(stats):
+    """График распределения по полу - ИСПРАВЛЕННАЯ ВЕРСИЯ"""
+    gender_count = stats.gender_counts
+    log.debug("Итоговый подсчет: %s", gender_count)
+
+    # Проверяем, есть ли данные для графика
+    total_patients = sum(gender_count.values())
+    if total_patients == 0:
+        return None
+
+    fig = Figure(figsize=(8, 6))
+    ax = fig.subplots()
+    colors = ['#93c572', '#78b478']
+
+    labels = [f'Мужчины ({gender_count["Мужчины"]})', f'Женщины ({gender_count["Женщины"]})']
+    sizes = [gender_count['Мужчины'], gender_count['Женщины']]
+
+    wedges, texts, autotexts = ax.pie(
+        sizes, 
+        labels=labels, 
+        autopct='%1.1f%%',
+        colors=colors, 
+        startangle=90,
+        textprops={'fontsize': 12, 'fontfamily': 'Georgia'}
+    )
+
+    for autotext in autotexts:
+        autotext.set_color('white')
+        autotext.set_fontweight('bold')
+
+    ax.set_title('Распределение пациентов по полу', 
+                fontsize=14, fontfamily='Georgia', fontweight='bold', pad=20)
+
+    return fig
+
+
+def create_age_chart(stats):
+    age_hist = stats.age_hist
+
+    if age_hist is None:
+        return None
+
+    fig = Figure(figsize=(8, 6))
+    ax = fig.subplots()
+    # Гистограмма уже посчитана - рисуем готовые столбцы через веса
+    counts, bins = age_hist
+    ax.hist(bins[:-1], bins=bins, weights=counts, color='#93c572', alpha=0.7, 
+            edgecolor='white', linewidth=1.2)
+
+    ax.set_title('Распределение пациентов по возрасту', 
+                fontsize=14, fontfamily='Georgia', fontweight='bold', pad=20)
+    ax.set_xlabel('Возраст', fontfamily='Georgia', fontsize=12)
+    ax.set_ylabel('Количество пациентов', fontfamily='Georgia', fontsize=12)
+    ax.grid(True, alpha=0.3)
+
+    return fig
+
+
+def create_bmi_gender_chart(stats):
+    bmi_boxes = stats.bmi_boxes
+
+    if not bmi_boxes:
+        return None
+
+    fig = Figure(figsize=(8, 6))
+    ax = fig.subplots()
+    box_colors = {'Мужчины': '#93c572', 'Женщины': '#78b478'}
+
+    # Квартили и усы посчитаны заранее, ax.bxp только рисует их
+    box_plot = ax.bxp(bmi_boxes, patch_artist=True)
+    for patch, box in zip(box_plot['boxes'], bmi_boxes):
+        patch.set_facecolor(box_colors[box['label']])
+        patch.set_alpha(0.7)
+
+    ax.set_title('Распределение ИМТ по полу', 
+                fontsize=14, fontfamily='Georgia', fontweight='bold', pad=20)
+    ax.set_ylabel('ИМТ', fontfamily='Georgia', fontsize=12)
+    ax.grid(True, alpha=0.3)
+
+    return fig
+
+
+def create_bmi_age_chart(stats):
+    ages = stats.trend_ages
+    bmis = stats.trend_bmis
+
+    if len(ages) < 2:
+        return None
+
+    fig = Figure(figsize=(8, 6))
+    ax = fig.subplots()
+    scatter = ax.scatter(ages, bmis, color='#93c572', alpha=0.6, s=60)
+
+    if stats.trend is not None:
+        p = np.poly1d(stats.trend)
+        line_ages = np.array([ages.min(), ages.max()])
+        ax.plot(line_ages, p(line_ages), color='#d2a679', linestyle='--', alpha=0.8, linewidth=2)
+
+    ax.set_title('Зависимость ИМТ от возраста', 
+                fontsize=14, fontfamily='Georgia', fontweight='bold', pad=20)
+    ax.set_xlabel('Возраст', fontfamily='Georgia', fontsize=12)
+    ax.set_ylabel('ИМТ', fontfamily='Georgia', fontsize=12)
+    ax.grid(True, alpha=0.3)
+
+    return fig
+
+
+# Заголовки и функции построения в том порядке, в каком графики показываются
+CHARTS = (
+    ("Распределение по полу", create_gender_chart),
+    ("Распределение по возрасту", create_age_chart),
+    ("ИМТ по полу", create_bmi_gender_chart),
+    ("ИМТ от возраста", create_bmi_age_chart),
+)
+
+
+def render_chart_png(fig):
+    buffer = io.BytesIO()
+    FigureCanvasAgg(fig)
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
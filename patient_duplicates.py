@@ -0,0 +1,245 @@
+import re
+from functools import lru_cache
+
+from patient_model import to_number
+
+# Поиск возможных дублей пациентов.
+#
+# Сравнивать каждую запись с каждой - квадратичная работа, поэтому записи
+# раскладываются по "корзинам", и сравниваются только соседи по корзине:
+#
+#   - звучание всего ФИО: слова приводятся к упрощенному произношению
+#     (безударные гласные, оглушение, мягкий знак, латиница) и сортируются,
+#     так что "Картман Эрик" и "Эрик Кардман" попадают в одну корзину;
+#   - звучание фамилии (первое слово) и первая буква имени - для записей,
+#     где отчества нет или имя записано инициалом;
+#   - трехбуквенные куски слов (n-граммы) - для опечаток, которые меняют
+#     звучание. Куски, которые есть у слишком многих записей ("ова", "ич"),
+#     пропускаются: они ничего не говорят о сходстве и стоят дороже всего.
+#
+# Внутри корзины записи еще разложены по возрасту, и смотрятся только
+# возрасты в пределах AGE_TOLERANCE (возраст в записи мог устареть на год).
+# Кандидаты проверяются по полу и по сходству ФИО.
+#
+# Индекс обновляется по одной записи, как и PatientIndex: проверка новой
+# записи перед сохранением - это несколько обращений к словарям. Отчет по
+# всей базе строится за один проход: каждая запись ищется среди уже
+# просмотренных и добавляется в индекс.
+
+AGE_TOLERANCE = 1
+# Сходство ФИО (0..1), начиная с которого записи считаются возможными дублями
+MATCH_SCORE = 0.8
+# Какая доля кусков ФИО должна совпасть, чтобы запись стала кандидатом
+GRAM_SHARE = 0.6
+# Куски, которые встречаются чаще, при поиске кандидатов не используются
+MAX_GRAM_BUCKET = 200
+
+GRAM_SIZE = 3
+
+LATIN_SOUNDS = (('shch', 'щ'), ('sch', 'щ'), ('sh', 'ш'), ('ch', 'ч'), ('zh', 'ж'),
+                ('kh', 'х'), ('ts', 'ц'), ('yu', 'ю'), ('ya', 'я'), ('yo', 'е'), ('x', 'кс'))
+LATIN_LETTERS = str.maketrans('abcdefghijklmnopqrstuvwyz', 'абкдефгхийклмнопкрстуввиз')
+# Гласные сводятся к трем, звонкие согласные оглушаются, знаки пропадают
+SOUNDS = str.maketrans({'о': 'а', 'ы': 'а', 'я': 'а', 'е': 'и', 'э': 'и', 'й': 'и',
+                        'ю': 'у', 'б': 'п', 'в': 'ф', 'г': 'к', 'д': 'т', 'ж': 'ш',
+                        'з': 'с', 'ь': None, 'ъ': None})
+REPEATS = re.compile(r'(.)\1+')
+WORDS = re.compile(r'[^\W\d_]+')
+
+
+def name_words(name):
+    """Слова ФИО в нижнем регистре, без знаков препинания"""
+    text = str(name if name is not None else '').lower().replace('ё', 'е')
+    return WORDS.findall(text)
+
+
+@lru_cache(maxsize=65536)
+def sound_key(word):
+    """Упрощенное звучание слова: "Кардман" и "Kartman" дают одно и то же"""
+    for latin, cyrillic in LATIN_SOUNDS:
+        word = word.replace(latin, cyrillic)
+    word = word.translate(LATIN_LETTERS).translate(SOUNDS)
+    return REPEATS.sub(r'\1', word)
+
+
+def word_grams(words):
+    grams = set()
+    for word in words:
+        padded = f" {word} "
+        grams.update(padded[i:i + GRAM_SIZE] for i in range(len(padded) - GRAM_SIZE + 1))
+    return grams
+
+
+class DuplicateProfile:
+    """То, по чему запись сравнивается с другими"""
+
+    __slots__ = ('sounds', 'name_key', 'grams', 'age', 'gender_code', 'keys')
+
+    def __init__(self, patient):
+        words = name_words(patient.name)
+        self.sounds = tuple(sound_key(word) for word in words)
+        self.name_key = ' '.join(sorted(self.sounds))
+        self.grams = word_grams(words)
+        age = to_number(patient.age, int)
+        self.age = age if isinstance(age, int) else None
+        self.gender_code = patient.gender_code
+        self.keys = []
+        if self.sounds:
+            self.keys.append('n:' + self.name_key)
+            initial = self.sounds[1][:1] if len(self.sounds) > 1 else ''
+            self.keys.append(f"s:{self.sounds[0]}:{initial}")
+
+
+def words_contained(short, long):
+    """Каждое слово short есть в long (однобуквенное - как инициал)"""
+    for word in short:
+        if len(word) == 1:
+            if not any(other.startswith(word) for other in long):
+                return False
+        elif word not in long:
+            return False
+    return True
+
+
+def name_score(a, b):
+    """Сходство ФИО двух профилей от 0 до 1"""
+    if not a.sounds or not b.sounds:
+        return 0.0
+    if a.name_key == b.name_key:
+        return 1.0
+    # "Картман Эрик" и "Картман Эрик Теодор", "Иванов И." и "Иванов Иван"
+    if a.sounds[0] == b.sounds[0]:
+        for short, long in ((a, b), (b, a)):
+            if (len(short.sounds) <= len(long.sounds)
+                    and words_contained(short.sounds[1:], long.sounds[1:])):
+                return 0.9
+    return 2 * len(a.grams & b.grams) / (len(a.grams) + len(b.grams))
+
+
+def can_be_same(a, b):
+    if a.gender_code and b.gender_code and a.gender_code != b.gender_code:
+        return False
+    if a.age is not None and b.age is not None and abs(a.age - b.age) > AGE_TOLERANCE:
+        return False
+    return True
+
+
+class DuplicateIndex:
+    """Корзины для поиска возможных дублей; пациенты различаются по id"""
+
+    def __init__(self, patients=()):
+        self.records = {}
+        self.profiles = {}
+        # ключ корзины -> возраст (или None) -> id записей
+        self.blocks = {}
+        self.grams = {}
+        for patient in patients:
+            self.add(patient)
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, patient):
+        key = patient.id
+        profile = DuplicateProfile(patient)
+        self.records[key] = patient
+        self.profiles[key] = profile
+        for block_key in profile.keys:
+            self.blocks.setdefault(block_key, {}).setdefault(profile.age, set()).add(key)
+        for gram in profile.grams:
+            self.grams.setdefault(gram, set()).add(key)
+
+    def remove(self, patient):
+        key = patient.id
+        if key not in self.records:
+            return
+        del self.records[key]
+        profile = self.profiles.pop(key)
+        for block_key in profile.keys:
+            ages = self.blocks[block_key]
+            ages[profile.age].discard(key)
+            if not ages[profile.age]:
+                del ages[profile.age]
+                if not ages:
+                    del self.blocks[block_key]
+        for gram in profile.grams:
+            bucket = self.grams[gram]
+            bucket.discard(key)
+            if not bucket:
+                del self.grams[gram]
+
+    def replace(self, old_patient, new_patient):
+        self.remove(old_patient)
+        self.add(new_patient)
+
+    def candidates(self, profile):
+        found = set()
+        for block_key in profile.keys:
+            ages = self.blocks.get(block_key)
+            if not ages:
+                continue
+            if profile.age is None:
+                groups = ages.values()
+            else:
+                groups = [ages.get(age) for age in range(profile.age - AGE_TOLERANCE,
+                                                         profile.age + AGE_TOLERANCE + 1)]
+                groups.append(ages.get(None))
+            for group in groups:
+                if group:
+                    found.update(group)
+
+        counts = {}
+        for gram in profile.grams:
+            bucket = self.grams.get(gram)
+            if bucket and len(bucket) <= MAX_GRAM_BUCKET:
+                for key in bucket:
+                    counts[key] = counts.get(key, 0) + 1
+        needed = GRAM_SHARE * len(profile.grams)
+        found.update(key for key, count in counts.items() if count >= needed)
+        return found
+
+    def find(self, patient, exclude=None):
+        """Возможные дубли записи: список (сходство, пациент), самые похожие первыми.
+
+        exclude - id, который не надо предлагать (сама редактируемая запись).
+        """
+        profile = DuplicateProfile(patient)
+        matches = []
+        for key in self.candidates(profile):
+            if key == exclude:
+                continue
+            other = self.profiles[key]
+            if not can_be_same(profile, other):
+                continue
+            score = name_score(profile, other)
+            if score >= MATCH_SCORE:
+                matches.append((score, self.records[key]))
+        matches.sort(key=lambda match: (-match[0], match[1].id))
+        return matches
+
+
+def find_duplicate_groups(patients):
+    """Группы возможных дублей по всей базе - списки пациентов в порядке id.
+
+    Записи, похожие через третью ("Иванов И." - "Иванов Иван" - "Иванов
+    Иван Петрович"), попадают в одну группу.
+    """
+    index = DuplicateIndex()
+    parent = {}
+
+    def root(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    for patient in patients:
+        parent[patient.id] = patient.id
+        for score, other in index.find(patient):
+            parent[root(other.id)] = root(patient.id)
+        index.add(patient)
+
+    groups = {}
+    for patient in patients:
+        groups.setdefault(root(patient.id), []).append(patient)
+    return [group for group in groups.values() if len(group) > 1]
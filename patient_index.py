@@ -0,0 +1,332 @@
+import bisect
+import math
+
+# Индексы для поиска и фильтрации пациентов.
+#
+# Индексы строятся один раз при загрузке и дальше обновляются при каждом
+# добавлении, изменении и удалении пациента, а не перестраиваются заново.
+# Пациенты в индексе различаются по id записи; при изменении нужно
+# передавать и старую, и новую запись.
+#
+# Там же хранятся порядки сортировки таблицы по столбцам. Порядок по столбцу
+# строится при первом запросе и дальше тоже обновляется по одной записи;
+# обратный порядок - тот же список, прочитанный с конца (кроме записей без
+# значения, они всегда в конце).
+
+NAME_BLOCK_SIZE = 512
+# Во сколько раз поиск подстроки по блокам дешевле поштучной проверки записей
+NAME_SCAN_COST = 20
+
+
+def parse_number(value):
+    try:
+        number = float(value)
+    except (ValueError, TypeError):
+        return None
+    if math.isnan(number):
+        return None
+    return number
+
+
+# Записи без числа уходят в конец списка
+MISSING_SORT_GROUP = (1,)
+
+
+def number_sort_key(value):
+    number = parse_number(value)
+    return MISSING_SORT_GROUP + (0.0,) if number is None else (0, number)
+
+
+def text_sort_key(value):
+    return (0, str(value if value is not None else '').lower())
+
+
+SORT_FIELDS = {
+    'name': text_sort_key,
+    'age': number_sort_key,
+    'gender': text_sort_key,
+    'height': number_sort_key,
+    'weight': number_sort_key,
+    'bmi': number_sort_key,
+}
+
+
+class SortedColumn:
+    """Отсортированный массив значений с ключами записей для поиска по диапазону"""
+
+    def __init__(self):
+        self.values = []
+        self.keys = []
+
+    def build(self, pairs):
+        pairs = sorted(pairs, key=lambda pair: pair[0])
+        self.values = [value for value, key in pairs]
+        self.keys = [key for value, key in pairs]
+
+    def insert(self, value, key):
+        position = bisect.bisect_right(self.values, value)
+        self.values.insert(position, value)
+        self.keys.insert(position, key)
+
+    def remove(self, value, key):
+        lo = bisect.bisect_left(self.values, value)
+        hi = bisect.bisect_right(self.values, value)
+        for position in range(lo, hi):
+            if self.keys[position] == key:
+                del self.values[position]
+                del self.keys[position]
+                return
+
+    def range_bounds(self, low=None, high=None):
+        lo = 0 if low is None else bisect.bisect_left(self.values, low)
+        hi = len(self.values) if high is None else bisect.bisect_right(self.values, high)
+        return lo, max(lo, hi)
+
+    def prefix_bounds(self, prefix):
+        lo = bisect.bisect_left(self.values, prefix)
+        hi = bisect.bisect_left(self.values, prefix + '\uffff')
+        return lo, hi
+
+
+class NameBlocks:
+    """Имена, сгруппированные в блоки, для поиска по подстроке.
+
+    Имена блока склеены в одну строку, поэтому проверка "есть ли подстрока
+    где-то в блоке" выполняется одним поиском в строке на стороне C, и
+    поштучно просматриваются только блоки, где она нашлась. Изменение
+    записи пересобирает строку только ее блока.
+    """
+
+    def __init__(self, block_size=NAME_BLOCK_SIZE):
+        self.block_size = block_size
+        self.blocks = []
+        self.block_of = {}
+
+    def build(self, names):
+        self.blocks = []
+        self.block_of = {}
+        block = None
+        for key, name in names:
+            if block is None or len(block['keys']) >= self.block_size:
+                block = {'keys': [], 'names': [], 'text': ''}
+                self.blocks.append(block)
+            block['keys'].append(key)
+            block['names'].append(name)
+            self.block_of[key] = block
+        for block in self.blocks:
+            block['text'] = '\n'.join(block['names'])
+
+    def insert(self, key, name):
+        if not self.blocks or len(self.blocks[-1]['keys']) >= self.block_size:
+            self.blocks.append({'keys': [], 'names': [], 'text': ''})
+        block = self.blocks[-1]
+        block['keys'].append(key)
+        block['names'].append(name)
+        block['text'] = '\n'.join(block['names'])
+        self.block_of[key] = block
+
+    def remove(self, key):
+        block = self.block_of.pop(key)
+        position = block['keys'].index(key)
+        del block['keys'][position]
+        del block['names'][position]
+        if block['keys']:
+            block['text'] = '\n'.join(block['names'])
+        else:
+            self.blocks.remove(block)
+
+    def find(self, text):
+        for block in self.blocks:
+            if text in block['text']:
+                for key, name in zip(block['keys'], block['names']):
+                    if text in name:
+                        yield key
+
+
+class PatientIndex:
+    """Индексы по ФИО (слова и блоки для подстрок), возрасту и ИМТ"""
+
+    def __init__(self, patients=()):
+        self.records = {}
+        self.sort_orders = {}
+        self.name_of = {}
+        self.age_of = {}
+        self.bmi_value_of = {}
+        self.names = NameBlocks()
+        self.words = SortedColumn()
+        self.ages = SortedColumn()
+        self.bmis = SortedColumn()
+        self.build(patients)
+
+    def patient_keys(self, patient):
+        name = str(patient.name).lower()
+        age = parse_number(patient.age)
+        bmi = parse_number(patient.bmi)
+        return name, age, bmi
+
+    def build(self, patients):
+        names, words, ages, bmis = [], [], [], []
+        for patient in patients:
+            key = patient.id
+            name, age, bmi = self.store(key, patient)
+            names.append((key, name))
+            words.extend((word, key) for word in name.split())
+            if age is not None:
+                ages.append((age, key))
+            if bmi is not None:
+                bmis.append((bmi, key))
+        # Сортируем один раз целиком, а не вставляем по одной записи
+        self.names.build(names)
+        self.words.build(words)
+        self.ages.build(ages)
+        self.bmis.build(bmis)
+
+    def store(self, key, patient):
+        name, age, bmi = self.patient_keys(patient)
+        self.records[key] = patient
+        self.name_of[key] = name
+        self.age_of[key] = age
+        self.bmi_value_of[key] = bmi
+        return name, age, bmi
+
+    def add(self, patient):
+        key = patient.id
+        name, age, bmi = self.store(key, patient)
+        self.names.insert(key, name)
+        for word in name.split():
+            self.words.insert(word, key)
+        if age is not None:
+            self.ages.insert(age, key)
+        if bmi is not None:
+            self.bmis.insert(bmi, key)
+        for field, order in self.sort_orders.items():
+            order.insert(self.sort_value(field, key), key)
+
+    def remove(self, patient):
+        key = patient.id
+        if key not in self.records:
+            return
+        for field, order in self.sort_orders.items():
+            order.remove(self.sort_value(field, key), key)
+        name = self.name_of.pop(key)
+        age = self.age_of.pop(key)
+        bmi = self.bmi_value_of.pop(key)
+        del self.records[key]
+
+        self.names.remove(key)
+        for word in name.split():
+            self.words.remove(word, key)
+        if age is not None:
+            self.ages.remove(age, key)
+        if bmi is not None:
+            self.bmis.remove(bmi, key)
+
+    def replace(self, old_patient, new_patient):
+        self.remove(old_patient)
+        self.add(new_patient)
+
+    def sort_value(self, field, key):
+        # id записи делает значения уникальными: равные значения не нужно
+        # перебирать при удалении, а при равенстве сохраняется порядок списка
+        value = getattr(self.records[key], field)
+        return SORT_FIELDS[field](value) + (key,)
+
+    def sort_order(self, field):
+        order = self.sort_orders.get(field)
+        if order is None:
+            order = SortedColumn()
+            order.build((self.sort_value(field, key), key) for key in self.records)
+            self.sort_orders[field] = order
+        return order
+
+    def sorted_patient(self, field, position, descending=False):
+        """Пациент на позиции position в порядке сортировки по field"""
+        order = self.sort_order(field)
+        if descending:
+            # Обратный порядок читается с конца, но записи без значения
+            # остаются в конце списка при любом направлении
+            missing = bisect.bisect_left(order.values, MISSING_SORT_GROUP)
+            if position < missing:
+                position = missing - 1 - position
+        return self.records[order.keys[position]]
+
+    def sort_position(self, field, patient, descending=False):
+        """Позиция пациента в порядке сортировки по field"""
+        order = self.sort_order(field)
+        position = bisect.bisect_left(order.values, self.sort_value(field, patient.id))
+        if descending:
+            missing = bisect.bisect_left(order.values, MISSING_SORT_GROUP)
+            if position < missing:
+                position = missing - 1 - position
+        return position
+
+    def sort_patients(self, patients, field, descending=False):
+        """Сортирует часть пациентов (например, результат поиска) по field"""
+        values = sorted(((self.sort_value(field, patient.id), patient) for patient in patients),
+                        key=lambda pair: pair[0])
+        result = [patient for value, patient in values]
+        if descending:
+            missing = bisect.bisect_left([value for value, patient in values], MISSING_SORT_GROUP)
+            result[:missing] = result[missing - 1::-1] if missing else []
+        return result
+
+    def search(self, text='', age_range=(None, None), bmi_range=(None, None)):
+        """Пациенты, у которых ФИО содержит text, а возраст и ИМТ попадают в диапазоны.
+
+        Короткий запрос (одна-две буквы) ищется как начало любого слова ФИО,
+        более длинный - как подстрока. Просматривается только самый узкий
+        из критериев, остальные проверяются по готовым значениям.
+        """
+        text = text.strip().lower()
+        candidates = []
+
+        if text and len(text) < 3:
+            lo, hi = self.words.prefix_bounds(text)
+            candidates.append((hi - lo, lambda: dict.fromkeys(self.words.keys[lo:hi])))
+        elif text:
+            # Поиск подстроки почти целиком идет внутри C, поэтому он
+            # выгоднее любого диапазона, кроме совсем узкого
+            size = len(self.records) // NAME_SCAN_COST
+            candidates.append((size, lambda: self.names.find(text)))
+
+        ranges = ((self.ages, age_range), (self.bmis, bmi_range))
+        for column, (low, high) in ranges:
+            if low is not None or high is not None:
+                lo, hi = column.range_bounds(low, high)
+                candidates.append((hi - lo, lambda column=column, lo=lo, hi=hi: column.keys[lo:hi]))
+
+        if not candidates:
+            return list(self.records.values())
+        size, narrowest = min(candidates, key=lambda candidate: candidate[0])
+        keys = narrowest()
+
+        result = []
+        for key in keys:
+            if text and not self.name_matches(self.name_of[key], text):
+                continue
+            if not self.in_range(self.age_of[key], age_range):
+                continue
+            if not self.in_range(self.bmi_value_of[key], bmi_range):
+                continue
+            result.append(self.records[key])
+        return result
+
+    def name_matches(self, name, text):
+        if len(text) >= 3:
+            return text in name
+        return any(word.startswith(text) for word in name.split())
+
+    def in_range(self, value, value_range):
+        low, high = value_range
+        if low is None and high is None:
+            return True
+        if value is None:
+            return False
+        if low is not None and value < low:
+            return False
+        if high is not None and value > high:
+            return False
+        return True
+
+    def __len__(self):
+        return len(self.records)
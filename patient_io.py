@@ -0,0 +1,110 @@
+import csv
+import json
+import os
+
+from patient_model import PatientValidationError, validate_patient
+
+# Массовый импорт и экспорт пациентов в CSV и JSON Lines.
+#
+# Файлы читаются и пишутся потоком, построчно: в памяти одновременно
+# держится только текущая порция из chunk_size записей.
+
+DEFAULT_CHUNK_SIZE = 5000
+EXPORT_FIELDS = ('name', 'age', 'gender', 'height', 'weight')
+
+# Заголовки столбцов, которые понимает импорт CSV
+FIELD_ALIASES = {
+    'name': 'name', 'фио': 'name', 'имя': 'name',
+    'age': 'age', 'возраст': 'age',
+    'gender': 'gender', 'sex': 'gender', 'пол': 'gender',
+    'height': 'height', 'рост': 'height',
+    'weight': 'weight', 'вес': 'weight',
+}
+
+
+def file_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    raise ValueError(f"Неподдерживаемый формат файла: {extension or path}")
+
+
+def read_csv_rows(path):
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.DictReader(f)
+        fields = {column: FIELD_ALIASES.get(column.strip().lower())
+                  for column in reader.fieldnames or []}
+        for row in reader:
+            yield reader.line_num, {fields[column]: value for column, value in row.items()
+                                    if fields.get(column)}
+
+
+def read_jsonl_rows(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, e
+                continue
+            yield line_number, row
+
+
+def read_rows(path):
+    if file_format(path) == 'csv':
+        return read_csv_rows(path)
+    return read_jsonl_rows(path)
+
+
+def import_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Читает файл порциями: (принятые записи, [(номер строки, причина)])"""
+    accepted = []
+    rejected = []
+    for line_number, row in read_rows(path):
+        if isinstance(row, Exception):
+            rejected.append((line_number, f"Некорректный JSON: {row}"))
+        elif not isinstance(row, dict):
+            rejected.append((line_number, "Строка должна быть объектом JSON"))
+        else:
+            try:
+                accepted.append(validate_patient(row.get('name'), row.get('age'),
+                                                 row.get('gender', ''), row.get('height'),
+                                                 row.get('weight')))
+            except PatientValidationError as e:
+                rejected.append((line_number, str(e).replace('\n', ' ')))
+
+        if len(accepted) + len(rejected) >= chunk_size:
+            yield accepted, rejected
+            accepted, rejected = [], []
+
+    if accepted or rejected:
+        yield accepted, rejected
+
+
+def import_patients(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    patients = []
+    rejected = []
+    for chunk_accepted, chunk_rejected in import_chunks(path, chunk_size):
+        patients.extend(chunk_accepted)
+        rejected.extend(chunk_rejected)
+    return patients, rejected
+
+
+def export_patients(patients, path):
+    if file_format(path) == 'csv':
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(EXPORT_FIELDS)
+            for patient in patients:
+                writer.writerow([getattr(patient, field) for field in EXPORT_FIELDS])
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            for patient in patients:
+                f.write(json.dumps({field: getattr(patient, field) for field in EXPORT_FIELDS},
+                                   ensure_ascii=False))
+                f.write('\n')
+    return len(patients)
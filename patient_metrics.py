@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Замеры времени и счетчики для диагностики.
+#
+# Горячие места приложения (загрузка и сохранение, таблица, каждый график)
+# обернуты в metrics.timer(имя). По каждому имени копится число вызовов,
+# суммарное, последнее и наибольшее время; их показывает скрытая панель
+# диагностики (Ctrl+Shift+D в окне). Если открыт журнал (open_log), каждый
+# замер еще и дописывается в него строкой JSON - для разбора скриптами.
+#
+# Действия пользователя (кнопки, сортировка, поиск) можно по желанию
+# профилировать через cProfile: тогда для каждого действия сохраняется
+# текстовый отчет последнего запуска, а при заданном profile_dir - и файл
+# .prof для snakeviz или pstats.
+#
+# Модуль не зависит от Tk, таймеры можно звать из любого потока.
+
+PROFILE_TOP = 25
+
+# Журналы модулей приложения - дочерние к этому ('dear_patients.charts' и т.д.),
+# поэтому уровень задается им всем сразу, не трогая журналы библиотек
+LOGGER_NAME = 'dear_patients'
+
+log = logging.getLogger(LOGGER_NAME + '.metrics')
+
+# Имя действия ("Сохранить: запись", "Импорт CSV/JSONL") в имени файла .prof
+UNSAFE_FILENAME_CHARS = re.compile(r'[^\w.-]')
+
+
+def configure_logging(level):
+    """Уровень журнала по имени ('DEBUG', 'INFO', ...): DEBUG включает вывод по записям"""
+    logging.basicConfig(level=logging.WARNING,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logging.getLogger(LOGGER_NAME).setLevel(getattr(logging, str(level).upper(), logging.WARNING))
+
+
+class Metrics:
+    """Таймеры и счетчики по именам, журнал замеров и профили действий"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timers = {}
+        self.counters = {}
+        self.profiles = {}
+        self.log_file = None
+        self.profile_actions = False
+        self.profile_dir = None
+        self.profiling = False
+
+    def open_log(self, path):
+        self.close()
+        self.log_file = open(path, 'a', encoding='utf-8')
+
+    def close(self):
+        with self.lock:
+            if self.log_file is not None:
+                self.log_file.close()
+                self.log_file = None
+
+    def write_log(self, record):
+        # Вызывается под self.lock
+        if self.log_file is None:
+            return
+        record = {'time': round(time.time(), 3), **record}
+        self.log_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.log_file.flush()
+
+    def record(self, name, seconds, **fields):
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = {'calls': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0}
+            timer['calls'] += 1
+            timer['total'] += seconds
+            timer['last'] = seconds
+            timer['max'] = max(timer['max'], seconds)
+            self.write_log({'timer': name, 'ms': round(seconds * 1000, 3), **fields})
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            self.write_log({'counter': name, 'value': value})
+
+    @contextmanager
+    def timer(self, name, **fields):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, **fields)
+
+    @contextmanager
+    def profile(self, name):
+        """Профиль cProfile вокруг блока; вложенные блоки не профилируются"""
+        if self.profiling:
+            yield
+            return
+        import cProfile
+        import io
+        import pstats
+
+        self.profiling = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self.profiling = False
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(PROFILE_TOP)
+            with self.lock:
+                self.profiles[name] = text.getvalue()
+            if self.profile_dir:
+                filename = UNSAFE_FILENAME_CHARS.sub('_', name) + '.prof'
+                try:
+                    os.makedirs(self.profile_dir, exist_ok=True)
+                    profiler.dump_stats(os.path.join(self.profile_dir, filename))
+                except OSError as e:
+                    # Профиль - только диагностика, само действие уже выполнено
+                    log.warning("Не удалось сохранить профиль %s: %s", filename, e)
+
+    @contextmanager
+    def action(self, name):
+        """Действие пользователя: всегда замер времени, профиль - если включен"""
+        with self.timer(f"action.{name}"):
+            if self.profile_actions:
+                with self.profile(name):
+                    yield
+            else:
+                yield
+
+    def reset(self):
+        with self.lock:
+            self.timers.clear()
+            self.counters.clear()
+            self.profiles.clear()
+
+    def snapshot(self):
+        """Все замеры обычными числами - для панели и для отчета в JSON"""
+        with self.lock:
+            return {
+                'timers': {
+                    name: {
+                        'calls': timer['calls'],
+                        'total_ms': timer['total'] * 1000,
+                        'avg_ms': timer['total'] * 1000 / timer['calls'],
+                        'max_ms': timer['max'] * 1000,
+                        'last_ms': timer['last'] * 1000,
+                    }
+                    for name, timer in self.timers.items()
+                },
+                'counters': dict(self.counters),
+                'profiles': sorted(self.profiles),
+            }
+
+
+metrics = Metrics()
@@ -0,0 +1,278 @@
+import bisect
+
+# Записи о пациентах и общие правила для них.
+#
+# В памяти пациент - объект Patient со __slots__: без словаря на каждую
+# запись он занимает примерно в 2,7 раза меньше места (104 байта против 280
+# на запись без учета строк, benchmarks/bench_memory.py на 100 тыс. записей).
+# Словари в формате JSON появляются только на границе с хранилищем и
+# файлами импорта (Patient.from_dict / to_dict).
+#
+# Пол приводится к коду один раз - при загрузке или сохранении записи - и
+# хранится рядом с исходным написанием в поле gender_code. Дальше все
+# подсчеты сравнивают целые числа, а не ищут подстроки.
+#
+# ИМТ - производное поле bmi: считается при сохранении записи, а при
+# загрузке - сразу для всего списка (update_bmi). Таблица, поиск и графики
+# берут готовое значение. В файлы ИМТ не записывается.
+#
+# У каждой записи есть постоянный id. Новые записи получают id больше всех
+# прежних в файле, а запись с другого рабочего места с меньшим id встает на
+# свое место, поэтому список пациентов всегда упорядочен по id (PatientList),
+# и запись по id находится без перебора списка.
+
+GENDER_UNKNOWN = 0
+GENDER_MALE = 1
+GENDER_FEMALE = 2
+
+GENDER_LABELS = {
+    GENDER_MALE: 'Мужчины',
+    GENDER_FEMALE: 'Женщины',
+}
+
+MALE_SPELLINGS = {'м', 'муж', 'мужской', 'мужчина', 'male', 'm', 'man'}
+FEMALE_SPELLINGS = {'ж', 'жен', 'женский', 'женщина', 'female', 'f', 'woman'}
+
+MIN_BMI, MAX_BMI = 10, 100
+
+
+def to_number(value, number_type=float):
+    """Число из строки вроде "170"; нечисловой мусор возвращается как есть"""
+    if value is None or isinstance(value, number_type):
+        return value
+    try:
+        return number_type(value)
+    except (ValueError, TypeError):
+        if number_type is int:
+            number = to_number(value, float)
+            if isinstance(number, float) and number.is_integer():
+                return int(number)
+        return value
+
+
+class Patient:
+    """Запись о пациенте"""
+
+    __slots__ = ('id', 'name', 'age', 'gender', 'height', 'weight', 'gender_code', 'bmi')
+
+    FIELDS = ('name', 'age', 'gender', 'height', 'weight')
+
+    def __init__(self, name, age, gender, height, weight, gender_code=None, bmi=None,
+                 patient_id=None):
+        self.id = patient_id
+        self.name = name
+        self.age = age
+        self.gender = gender
+        self.height = height
+        self.weight = weight
+        self.gender_code = gender_code
+        self.bmi = bmi
+
+    @classmethod
+    def from_dict(cls, data):
+        # Числа, записанные строками, приводятся к числам сразу при чтении
+        return cls(data.get('name', ''),
+                   to_number(data.get('age'), int),
+                   data.get('gender', ''),
+                   to_number(data.get('height')),
+                   to_number(data.get('weight')),
+                   data.get('gender_code'),
+                   patient_id=data.get('id'))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'age': self.age,
+            'gender': self.gender,
+            'height': self.height,
+            'weight': self.weight,
+            'gender_code': self.gender_code,
+        }
+
+    def __repr__(self):
+        return f"Patient({self.id!r}, {self.name!r}, age={self.age!r}, gender={self.gender!r})"
+
+
+def assign_patient_ids(patients):
+    """Проставляет id записям без него или с повторным id и упорядочивает список по id.
+
+    Возвращает True, если что-то поменялось и список нужно сохранить заново.
+    """
+    valid_ids = [patient.id for patient in patients
+                 if isinstance(patient.id, int) and patient.id > 0]
+    next_id = max(valid_ids, default=0) + 1
+    seen = set()
+    changed = False
+    for patient in patients:
+        if not isinstance(patient.id, int) or patient.id <= 0 or patient.id in seen:
+            patient.id = next_id
+            next_id += 1
+            changed = True
+        seen.add(patient.id)
+    if any(a.id > b.id for a, b in zip(patients, patients[1:])):
+        patients.sort(key=lambda patient: patient.id)
+        changed = True
+    return changed
+
+
+def patient_id_key(patient):
+    return patient.id
+
+
+class PatientList:
+    """Пациенты в порядке id плюс словарь id -> запись.
+
+    Позиция записи по id ищется двоичным поиском, сама запись - в словаре.
+    """
+
+    def __init__(self, patients=(), next_id=None):
+        self.records = list(patients)
+        self.by_id = {patient.id: patient for patient in self.records}
+        self.next_id = max(self.by_id, default=0) + 1
+        if next_id is not None:
+            self.next_id = max(self.next_id, next_id)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __getitem__(self, position):
+        return self.records[position]
+
+    def __contains__(self, patient_id):
+        return patient_id in self.by_id
+
+    def get(self, patient_id):
+        return self.by_id.get(patient_id)
+
+    def position(self, patient_id):
+        position = bisect.bisect_left(self.records, patient_id, key=patient_id_key)
+        if position == len(self.records) or self.records[position].id != patient_id:
+            raise KeyError(patient_id)
+        return position
+
+    def add(self, patient):
+        """Добавляет запись; запись без id получает новый.
+
+        Обычно у новой записи самый большой id, и она встает в конец. Запись
+        с меньшим id (ее добавили на другом рабочем месте, пока здесь
+        добавляли свою) вставляется на свое место по id.
+        """
+        if patient.id is None:
+            patient.id = self.next_id
+        elif patient.id in self.by_id:
+            raise ValueError(f"id {patient.id} уже есть в списке")
+        self.next_id = max(self.next_id, patient.id + 1)
+        if self.records and patient.id < self.records[-1].id:
+            position = bisect.bisect_left(self.records, patient.id, key=patient_id_key)
+            self.records.insert(position, patient)
+        else:
+            self.records.append(patient)
+        self.by_id[patient.id] = patient
+        return patient
+
+    def replace(self, patient_id, patient):
+        patient.id = patient_id
+        self.records[self.position(patient_id)] = patient
+        self.by_id[patient_id] = patient
+        return patient
+
+    def remove(self, patient_id):
+        del self.records[self.position(patient_id)]
+        return self.by_id.pop(patient_id)
+
+    def remove_many(self, patient_ids):
+        """Удаляет сразу много записей одним проходом по списку"""
+        removed = [self.by_id.pop(patient_id) for patient_id in patient_ids]
+        removed_ids = {patient.id for patient in removed}
+        self.records = [patient for patient in self.records if patient.id not in removed_ids]
+        return removed
+
+
+def calculate_bmi(weight, height):
+    """ИМТ по весу (кг) и росту (см); NaN, если его не посчитать"""
+    try:
+        height = float(height)
+        weight = float(weight)
+
+        if height <= 0 or weight <= 0:
+            return float('nan')
+
+        height_m = height / 100
+        bmi = weight / (height_m ** 2)
+
+        if bmi < MIN_BMI or bmi > MAX_BMI:
+            return float('nan')
+
+        return bmi
+    except (ValueError, TypeError, ZeroDivisionError):
+        return float('nan')
+
+
+def update_bmi(patients):
+    """Пересчитывает поле bmi всему списку - при загрузке или миграции.
+
+    Обычный цикл: NumPy здесь не быстрее (раскладка по объектам съедает
+    выигрыш), а его импорт при загрузке базы задержал бы первый кадр окна.
+    """
+    for patient in patients:
+        patient.bmi = calculate_bmi(patient.weight, patient.height)
+
+
+def normalize_gender(gender):
+    """Код пола по написанию: сравнение целиком, а не поиск подстроки.
+
+    Поиск подстроки ошибался: 'female' содержит 'male', а 'м' встречается
+    почти в любом слове.
+    """
+    gender_str = str(gender).lower().strip().rstrip('.')
+    if gender_str in MALE_SPELLINGS or gender_str.startswith('муж'):
+        return GENDER_MALE
+    if gender_str in FEMALE_SPELLINGS or gender_str.startswith('жен'):
+        return GENDER_FEMALE
+    return GENDER_UNKNOWN
+
+
+def normalize_patients(patients):
+    """Проставляет коды пола всему списку, возвращает позиции измененных записей"""
+    codes = {}
+    changed = []
+    for index, patient in enumerate(patients):
+        gender = str(patient.gender)
+        code = codes.get(gender)
+        if code is None:
+            code = codes[gender] = normalize_gender(gender)
+        if patient.gender_code != code:
+            patient.gender_code = code
+            changed.append(index)
+    return changed
+
+
+class PatientValidationError(ValueError):
+    pass
+
+
+def validate_patient(name, age, gender, height, weight):
+    """Проверяет поля по правилам формы пациента и собирает запись"""
+    name = str(name if name is not None else '').strip()
+    if not name:
+        raise PatientValidationError("Введите ФИО пациента")
+
+    try:
+        age = int(age)
+        height = float(height)
+        weight = float(weight)
+
+        if age <= 0 or height <= 0 or weight <= 0:
+            raise ValueError("Значения должны быть положительными")
+
+    except (ValueError, TypeError):
+        raise PatientValidationError("Проверьте корректность введенных данных:\n"
+                                     "- Возраст - целое число\n"
+                                     "- Рост и вес - числа больше 0")
+
+    return Patient(name, age, gender, height, weight, normalize_gender(gender),
+                   calculate_bmi(weight, height))
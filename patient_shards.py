@@ -0,0 +1,54 @@
+import glob
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from patient_model import normalize_patients, update_bmi
+from patient_sketch import PatientSketch
+from patient_storage import JournalStorage
+
+# Статистика по папке с файлами пациентов - по одному на филиал.
+#
+# Каждый файл (вместе с его журналом) читается в отдельном процессе, и
+# процесс возвращает не записи, а сводку PatientSketch - несколько десятков
+# килобайт независимо от размера файла. Сводки складываются в одну, и по
+# ней строятся те же четыре графика. Файлы филиалов только читаются.
+
+# Файлы *.json в папке, которые не являются файлами пациентов: сводки
+# (patients_cli.py sketch) часто кладут рядом с базой
+NOT_SHARD_SUFFIXES = ('.sketch.json',)
+
+
+def shard_files(directory):
+    """Файлы пациентов в папке: *.json, кроме сводок"""
+    paths = sorted(glob.glob(os.path.join(directory, '*.json')))
+    return [path for path in paths if not path.endswith(NOT_SHARD_SUFFIXES)]
+
+
+def shard_sketch(path):
+    """Сводка по одному файлу. Выполняется в процессе-исполнителе"""
+    patients = JournalStorage(path, read_only=True).load()
+    normalize_patients(patients)
+    update_bmi(patients)
+    return PatientSketch(patients)
+
+
+def aggregate_shards(paths, workers=None):
+    """Сводка по всем файлам и список (файл, ошибка) для файлов, которые не прочитались"""
+    total = PatientSketch()
+    errors = []
+    if not paths:
+        return total, errors
+
+    # Процессы запускаются начисто (spawn), без копии окна Tk и его потоков
+    context = multiprocessing.get_context('spawn')
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {pool.submit(shard_sketch, path): path for path in paths}
+        for future in as_completed(futures):
+            try:
+                total.merge(future.result())
+            except Exception as e:
+                errors.append((futures[future], e))
+    errors.sort(key=lambda error: error[0])
+    return total, errors
@@ -0,0 +1,202 @@
+import json
+
+import numpy as np
+
+from patient_model import GENDER_MALE, GENDER_FEMALE, GENDER_LABELS, MIN_BMI, MAX_BMI
+from patient_stats import MIN_AGE, MAX_AGE, PatientColumns, PatientStats
+
+# Сводка (скетч) пациентов для статистики по очень большим базам.
+#
+# Вместо массивов по всем записям хранятся счетчики фиксированного размера:
+# число пациентов по полу, гистограмма возраста по годам, гистограммы ИМТ с
+# шагом 0,1 по полу, суммы для среднего и дисперсии ИМТ, сетка "возраст x
+# ИМТ" и суммы для линии тренда. Запись добавляется и удаляется прибавлением
+# и вычитанием своих счетчиков, поэтому сводка обновляется при каждом
+# изменении, а окно статистики строится по ней за время, не зависящее от
+# числа пациентов. Сводки разных файлов складываются (merge).
+#
+# Квантили считаются по гистограмме с шагом 0,1, то есть с точностью до
+# 0,05 ИМТ. Скетчи вроде t-digest или KLL здесь не подходят: они не умеют
+# удалять записи.
+
+SKETCH_VERSION = 1
+
+AGE_BINS = MAX_AGE - MIN_AGE + 1
+BMI_STEP = 0.1
+BMI_BINS = int(round((MAX_BMI - MIN_BMI) / BMI_STEP)) + 1
+BMI_VALUES = MIN_BMI + np.arange(BMI_BINS) * BMI_STEP
+# Для точек графика "ИМТ от возраста" - сетка год x единица ИМТ
+TREND_BMI_BINS = MAX_BMI - MIN_BMI + 1
+GENDER_CODES = 3
+
+
+def histogram_percentiles(counts, values, percents):
+    """Процентили набора, где значение values[i] встречается counts[i] раз"""
+    cumulative = np.cumsum(counts)
+    ranks = np.asarray(percents, dtype=float) / 100 * (cumulative[-1] - 1)
+    lower = values[np.searchsorted(cumulative, np.floor(ranks), side='right')]
+    upper = values[np.searchsorted(cumulative, np.ceil(ranks), side='right')]
+    return lower + (upper - lower) * (ranks - np.floor(ranks))
+
+
+def histogram_box_stats(counts, values, moments, label):
+    """То же, что box_stats, но по гистограмме: выбросы - непустые корзины за усами"""
+    q1, median, q3 = histogram_percentiles(counts, values, [25, 50, 75])
+    iqr = q3 - q1
+    present = counts > 0
+    inside = present & (values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)
+    whislo = values[inside].min() if inside.any() else q1
+    whishi = values[inside].max() if inside.any() else q3
+    outside = present & ((values < whislo) | (values > whishi))
+    count, total, squares = moments
+    mean = total / count
+    return {
+        'label': label,
+        'med': median,
+        'q1': q1,
+        'q3': q3,
+        'whislo': whislo,
+        'whishi': whishi,
+        'fliers': values[outside],
+        'outliers': int(counts[outside].sum()),
+        'mean': mean,
+        'std': np.sqrt(max(squares / count - mean ** 2, 0.0)),
+    }
+
+
+class PatientSketch:
+    """Сводка пациентов фиксированного размера, которую можно обновлять и складывать"""
+
+    def __init__(self, patients=()):
+        self.size = 0
+        self.gender_counts = np.zeros(GENDER_CODES, dtype=np.int64)
+        self.age_counts = np.zeros(AGE_BINS, dtype=np.int64)
+        self.bmi_counts = np.zeros((GENDER_CODES, BMI_BINS), dtype=np.int64)
+        # Число значений, их сумма и сумма квадратов - по каждому полу
+        self.bmi_moments = np.zeros((GENDER_CODES, 3))
+        self.trend_counts = np.zeros((AGE_BINS, TREND_BMI_BINS), dtype=np.int64)
+        # n, сумма x, сумма y, сумма x^2, сумма xy для МНК-прямой ИМТ(возраст)
+        self.trend_sums = np.zeros(5)
+        if len(patients):
+            self.add(patients)
+
+    def add(self, patients):
+        self.update(PatientColumns(list(patients)), 1)
+
+    def remove(self, patients):
+        self.update(PatientColumns(list(patients)), -1)
+
+    def update(self, columns, sign):
+        gender = columns.gender.astype(np.intp)
+        self.size += sign * columns.size
+        self.gender_counts += sign * np.bincount(gender, minlength=GENDER_CODES)
+
+        age_valid = (columns.age > MIN_AGE) & (columns.age <= MAX_AGE)
+        years = np.floor(columns.age[age_valid]).astype(np.intp) - MIN_AGE
+        self.age_counts += sign * np.bincount(years, minlength=AGE_BINS)
+
+        bmi_valid = ~np.isnan(columns.bmi)
+        bmis = columns.bmi[bmi_valid]
+        bmi_genders = gender[bmi_valid]
+        cells = bmi_genders * BMI_BINS + np.rint((bmis - MIN_BMI) / BMI_STEP).astype(np.intp)
+        self.bmi_counts += sign * np.bincount(
+            cells, minlength=GENDER_CODES * BMI_BINS).reshape(GENDER_CODES, BMI_BINS)
+        for column, weights in enumerate((None, bmis, bmis ** 2)):
+            self.bmi_moments[:, column] += sign * np.bincount(
+                bmi_genders, weights=weights, minlength=GENDER_CODES)
+
+        both_valid = age_valid & bmi_valid
+        ages = columns.age[both_valid]
+        bmis = columns.bmi[both_valid]
+        cells = ((np.floor(ages).astype(np.intp) - MIN_AGE) * TREND_BMI_BINS
+                 + np.floor(bmis - MIN_BMI).astype(np.intp))
+        self.trend_counts += sign * np.bincount(
+            cells, minlength=AGE_BINS * TREND_BMI_BINS).reshape(AGE_BINS, TREND_BMI_BINS)
+        self.trend_sums += sign * np.array([ages.size, ages.sum(), bmis.sum(),
+                                            (ages ** 2).sum(), (ages * bmis).sum()])
+
+    def merge(self, other):
+        """Прибавляет к сводке другую, например сводку другой клиники"""
+        self.size += other.size
+        self.gender_counts += other.gender_counts
+        self.age_counts += other.age_counts
+        self.bmi_counts += other.bmi_counts
+        self.bmi_moments += other.bmi_moments
+        self.trend_counts += other.trend_counts
+        self.trend_sums += other.trend_sums
+        return self
+
+    def stats(self):
+        return SketchStats(self)
+
+    def to_dict(self):
+        return {
+            'version': SKETCH_VERSION,
+            'size': self.size,
+            'gender_counts': self.gender_counts.tolist(),
+            'age_counts': self.age_counts.tolist(),
+            'bmi_counts': self.bmi_counts.tolist(),
+            'bmi_moments': self.bmi_moments.tolist(),
+            'trend_counts': self.trend_counts.tolist(),
+            'trend_sums': self.trend_sums.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != SKETCH_VERSION:
+            raise ValueError("Неизвестная версия сводки")
+        sketch = cls()
+        sketch.size = int(data['size'])
+        for name in ('gender_counts', 'age_counts', 'bmi_counts', 'bmi_moments',
+                     'trend_counts', 'trend_sums'):
+            current = getattr(sketch, name)
+            value = np.array(data[name], dtype=current.dtype)
+            if value.shape != current.shape:
+                raise ValueError(f"Поле сводки {name}: неверный размер {value.shape}")
+            setattr(sketch, name, value)
+        return sketch
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+class SketchStats(PatientStats):
+    """Агрегаты для окна статистики, посчитанные по сводке, а не по записям"""
+
+    def __init__(self, sketch):
+        self.gender_counts = {GENDER_LABELS[GENDER_MALE]: int(sketch.gender_counts[GENDER_MALE]),
+                              GENDER_LABELS[GENDER_FEMALE]: int(sketch.gender_counts[GENDER_FEMALE])}
+
+        years = np.nonzero(sketch.age_counts)[0]
+        if years.size:
+            bins = min(10, years.size)
+            counts, edges = np.histogram(years + MIN_AGE, bins=bins,
+                                         weights=sketch.age_counts[years])
+            self.age_hist = (counts.astype(np.int64), edges)
+        else:
+            self.age_hist = None
+
+        self.bmi_boxes = []
+        for code in (GENDER_MALE, GENDER_FEMALE):
+            counts = sketch.bmi_counts[code]
+            if counts.sum() > 0:
+                self.bmi_boxes.append(histogram_box_stats(counts, BMI_VALUES,
+                                                          sketch.bmi_moments[code],
+                                                          GENDER_LABELS[code]))
+
+        # Вместо точки на каждого пациента - точка на каждую непустую клетку сетки
+        cell_ages, cell_bmis = np.nonzero(sketch.trend_counts)
+        self.trend_ages = (cell_ages + MIN_AGE).astype(float)
+        self.trend_bmis = cell_bmis + MIN_BMI + 0.5
+        self.trend = None
+        n, sum_x, sum_y, sum_xx, sum_xy = sketch.trend_sums
+        denominator = n * sum_xx - sum_x ** 2
+        if n > 1 and denominator > 1e-9 * n * sum_xx:
+            slope = (n * sum_xy - sum_x * sum_y) / denominator
+            self.trend = np.array([slope, (sum_y - slope * sum_x) / n])
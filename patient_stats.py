@@ -0,0 +1,132 @@
+import numpy as np
+
+from patient_model import (GENDER_MALE, GENDER_FEMALE, GENDER_LABELS, MIN_BMI, MAX_BMI,
+                           calculate_bmi, normalize_gender)
+
+# Колоночная статистика по пациентам для графиков.
+#
+# Список пациентов один раз раскладывается в массивы NumPy (возраст, рост,
+# вес, ИМТ и код пола), и все агрегаты для четырех графиков считаются по
+# этим массивам векторно, без циклов по записям.
+
+MIN_AGE, MAX_AGE = 0, 120
+
+
+def to_float_array(values):
+    try:
+        return np.array(values, dtype=float)
+    except (ValueError, TypeError):
+        pass
+    # Медленный путь только для данных с мусором вместо чисел
+    result = np.empty(len(values), dtype=float)
+    for i, value in enumerate(values):
+        try:
+            result[i] = float(value)
+        except (ValueError, TypeError):
+            result[i] = np.nan
+    return result
+
+
+def bmi_array(weight, height):
+    """Векторный вариант calculate_bmi: NaN там, где ИМТ не определен"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bmi = weight / (height / 100) ** 2
+    valid = (height > 0) & (weight > 0) & (bmi >= MIN_BMI) & (bmi <= MAX_BMI)
+    return np.where(valid, bmi, np.nan)
+
+
+def box_stats(values, label):
+    """Квартили, усы и выбросы для ax.bxp - то же, что считает ax.boxplot"""
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    whislo = inside.min() if inside.size else q1
+    whishi = inside.max() if inside.size else q3
+    return {
+        'label': label,
+        'med': median,
+        'q1': q1,
+        'q3': q3,
+        'whislo': whislo,
+        'whishi': whishi,
+        'fliers': values[(values < whislo) | (values > whishi)],
+        'mean': values.mean(),
+        'std': values.std(),
+    }
+
+
+class PatientColumns:
+    """Снимок данных пациентов в виде массивов"""
+
+    def __init__(self, patients):
+        self.size = len(patients)
+        self.age = to_float_array([p.age for p in patients])
+        # ИМТ уже посчитан у каждой записи, его только собираем в массив
+        self.bmi = np.fromiter((p.bmi if p.bmi is not None else calculate_bmi(p.weight, p.height)
+                                for p in patients), dtype=float, count=self.size)
+
+        # Код пола уже посчитан при загрузке или сохранении записи
+        self.gender = np.fromiter((p.gender_code if p.gender_code is not None
+                                   else normalize_gender(p.gender) for p in patients),
+                                  dtype=np.int8, count=self.size)
+
+
+class PatientStats:
+    """Все агрегаты для окна статистики, посчитанные по PatientColumns"""
+
+    def __init__(self, columns):
+        counts = np.bincount(columns.gender, minlength=3)
+        self.gender_counts = {GENDER_LABELS[GENDER_MALE]: int(counts[GENDER_MALE]),
+                              GENDER_LABELS[GENDER_FEMALE]: int(counts[GENDER_FEMALE])}
+
+        age_valid = (columns.age > MIN_AGE) & (columns.age <= MAX_AGE)
+        ages = columns.age[age_valid]
+        if ages.size:
+            bins = min(10, np.unique(ages).size)
+            self.age_hist = np.histogram(ages, bins=bins)
+        else:
+            self.age_hist = None
+
+        bmi_valid = ~np.isnan(columns.bmi)
+        self.bmi_boxes = []
+        for code in (GENDER_MALE, GENDER_FEMALE):
+            label = GENDER_LABELS[code]
+            values = columns.bmi[bmi_valid & (columns.gender == code)]
+            if values.size:
+                self.bmi_boxes.append(box_stats(values, label))
+
+        both_valid = age_valid & bmi_valid
+        self.trend_ages = columns.age[both_valid]
+        self.trend_bmis = columns.bmi[both_valid]
+        self.trend = None
+        if self.trend_ages.size > 1:
+            try:
+                self.trend = np.polyfit(self.trend_ages, self.trend_bmis, 1)
+            except (ValueError, np.linalg.LinAlgError):
+                self.trend = None
+
+    def summary(self):
+        """Агрегаты в виде обычных чисел и списков - для вывода в JSON"""
+        counts, bins = self.age_hist if self.age_hist is not None else ([], [])
+        return {
+            'gender_counts': dict(self.gender_counts),
+            'age_histogram': {
+                'counts': [int(c) for c in counts],
+                'bins': [float(b) for b in bins],
+            },
+            'bmi_by_gender': {
+                box['label']: {
+                    'median': float(box['med']),
+                    'q1': float(box['q1']),
+                    'q3': float(box['q3']),
+                    'whislo': float(box['whislo']),
+                    'whishi': float(box['whishi']),
+                    'mean': float(box['mean']),
+                    'std': float(box['std']),
+                    'outliers': int(box.get('outliers', len(box['fliers']))),
+                }
+                for box in self.bmi_boxes
+            },
+            'bmi_age_trend': (None if self.trend is None else
+                              {'slope': float(self.trend[0]), 'intercept': float(self.trend[1])}),
+        }
@@ -0,0 +1,978 @@
+import contextlib
+import json
+import logging
+import mmap
+import os
+import pathlib
+import sqlite3
+import sys
+import time
+import uuid
+import zlib
+from array import array
+
+from patient_model import (Patient, PatientList, assign_patient_ids, normalize_patients,
+                           update_bmi)
+
+# Хранилища данных пациентов.
+#
+# Любое изменение списка пациентов описывается "изменением" - кортежем
+# (операция, id пациента, пациент), где операция - 'add', 'update' или
+# 'delete'. Приложение передает хранилищу свой список и изменения к нему;
+# commit сначала записывает изменения на диск и только потом применяет их к
+# списку в памяти. Если записать не удалось, список остается прежним и
+# по-прежнему совпадает с файлом. id новым записям назначает commit. В памяти
+# пациенты - объекты Patient в PatientList, в словари JSON они превращаются
+# только здесь.
+#
+# Записям из файлов старого формата (без id) id проставляются при загрузке,
+# и файл сразу переписывается. Хранилище, открытое только для чтения
+# (read_only), ничего не переписывает: ни миграций, ни обрезки журнала.
+#
+# Один файл могут открывать несколько рабочих мест: запись идет под
+# блокировкой файла, а чужие изменения приложение забирает через sync -
+# только изменившиеся записи, без полной перезагрузки.
+
+JOURNAL_SUFFIX = '.journal'
+PREVIOUS_JOURNAL_SUFFIX = '.journal.prev'
+DEFAULT_COMPACT_EVERY = 1000
+LOCK_SUFFIX = '.lock'
+# Сколько секунд ждать, пока другое рабочее место допишет свое изменение
+LOCK_TIMEOUT = 10
+
+log = logging.getLogger('dear_patients.storage')
+
+
+def apply_change(patients, change):
+    """Применяет одно изменение к PatientList в памяти"""
+    op, patient_id, patient = change
+    if op == 'add':
+        patients.add(patient)
+    elif op == 'update':
+        patients.replace(patient_id, patient)
+    elif op == 'delete':
+        patients.remove(patient_id)
+    else:
+        raise ValueError(f"Неизвестная операция: {op}")
+
+
+def apply_changes(patients, changes):
+    """Применяет изменения по порядку; подряд идущие удаления - одним проходом"""
+    deleted = []
+    for change in changes + [(None, None, None)]:
+        if change[0] == 'delete':
+            deleted.append(change[1])
+            continue
+        if len(deleted) == 1:
+            patients.remove(deleted[0])
+        elif deleted:
+            patients.remove_many(deleted)
+        deleted = []
+        if change[0] is not None:
+            apply_change(patients, change)
+
+
+def prepare_changes(patients, changes, next_id=None):
+    """Назначает id новым записям и проверяет, что изменения применимы к patients.
+
+    Вызывается под блокировкой, до записи на диск: изменение записи, которой
+    нет в списке, не должно попасть в файл - при загрузке его уже не
+    применить. next_id - первый свободный id по файлу: в нем могут быть
+    записи, которых в patients еще нет.
+    """
+    next_id = max(patients.next_id, next_id or 0)
+    added = set()
+    deleted = set()
+    prepared = []
+    for op, patient_id, patient in changes:
+        if op == 'add':
+            patient.id = patient_id = next_id
+            next_id += 1
+            added.add(patient_id)
+        elif op in ('update', 'delete'):
+            if patient_id in deleted or (patient_id not in patients and patient_id not in added):
+                raise StorageConflictError(f"Пациента {patient_id} уже нет в списке")
+            if op == 'update':
+                patient.id = patient_id
+            else:
+                deleted.add(patient_id)
+        else:
+            raise ValueError(f"Неизвестная операция: {op}")
+        prepared.append((op, patient_id, patient))
+    return prepared
+
+
+def dump_patients(patients):
+    data = [patient.to_dict() for patient in patients]
+    return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def parse_patients(data):
+    return [Patient.from_dict(item) for item in json.loads(data)]
+
+
+def write_file_atomic(path, data):
+    # Пишем во временный файл рядом и подменяем им исходный одним rename -
+    # при падении посередине записи старый файл остается целым
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def snapshot_token(data):
+    return f"{zlib.crc32(data):08x}:{len(data)}"
+
+
+class StorageConflictError(Exception):
+    """Изменение не записано: файл или те же записи уже изменили на другом рабочем месте"""
+
+
+if os.name == 'nt':
+    import msvcrt
+
+    def lock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+
+    def unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class FileLock:
+    """Рекомендательная блокировка между процессами и рабочими местами.
+
+    Блокируется отдельный файл path + '.lock', поэтому сами файлы данных
+    можно подменять через rename. Повторный захват тем же объектом не
+    ждет, а только увеличивает счетчик.
+    """
+
+    def __init__(self, path, timeout=LOCK_TIMEOUT):
+        self.path = path + LOCK_SUFFIX
+        self.timeout = timeout
+        self.file = None
+        self.depth = 0
+
+    def acquire(self):
+        if self.depth:
+            self.depth += 1
+            return
+        f = open(self.path, 'a+b')
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                lock_file(f)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    f.close()
+                    raise TimeoutError(f"Файл {self.path} занят другим рабочим местом")
+                time.sleep(0.05)
+        self.file = f
+        self.depth = 1
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            unlock_file(self.file)
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def file_stamp(*paths):
+    """Размер и время изменения файлов - дешевая проверка, менял ли их кто-то"""
+    stamp = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamp.append((stat.st_size, stat.st_mtime_ns))
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def diff_patients(old, new):
+    """Изменения, которые превращают список old в new (сравнение по id)"""
+    new_ids = {patient.id for patient in new}
+    changes = [('delete', patient.id, None) for patient in old if patient.id not in new_ids]
+    for patient in new:
+        current = old.get(patient.id)
+        if current is None:
+            changes.append(('add', patient.id, patient))
+        elif current.to_dict() != patient.to_dict():
+            changes.append(('update', patient.id, patient))
+    return changes
+
+
+class PatientStorage:
+    """Базовый интерфейс хранилища пациентов"""
+
+    read_only = False
+
+    def load(self):
+        raise NotImplementedError
+
+    def commit(self, patients, changes):
+        """Записывает изменения и, если запись удалась, применяет их к patients.
+
+        Возвращает изменения с id, назначенными новым записям.
+        """
+        raise NotImplementedError
+
+    def sync(self, patients):
+        """Изменения других рабочих мест с прошлой загрузки или сверки.
+
+        Список patients не меняется - изменения применяет вызывающий.
+        """
+        return []
+
+    def close(self):
+        pass
+
+    def locked(self):
+        # Только читающему хранилищу (например, файлу другой клиники)
+        # блокировка не нужна, а файл .lock рядом может быть и не создать
+        return contextlib.nullcontext() if self.read_only else self.lock
+
+
+class JsonStorage(PatientStorage):
+    """Весь список пациентов в одном JSON-файле, перезаписывается целиком.
+
+    Версия файла - его отметка (snapshot_token). Если файл переписало другое
+    рабочее место, commit не затирает его своим списком, а отказывает.
+    """
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self.lock = FileLock(path)
+        self.token = snapshot_token(b'')
+        self.stamp = None
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return b''
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def load(self):
+        with self.locked():
+            data = self.read()
+            self.token = snapshot_token(data)
+            patients = parse_patients(data) if data else []
+            if assign_patient_ids(patients) and not self.read_only:
+                self.write(patients)
+            self.stamp = file_stamp(self.path)
+        return PatientList(patients)
+
+    def write(self, patients):
+        data = dump_patients(patients)
+        write_file_atomic(self.path, data)
+        self.token = snapshot_token(data)
+        self.stamp = file_stamp(self.path)
+
+    def commit(self, patients, changes):
+        if self.read_only:
+            raise PermissionError(f"{self.path} открыт только для чтения")
+        with self.lock:
+            if snapshot_token(self.read()) != self.token:
+                raise StorageConflictError("Файл пациентов изменен на другом рабочем месте")
+            changes = prepare_changes(patients, changes)
+            # Файл переписывается целиком, а список в памяти меняется только
+            # после удачной записи - пишем копию
+            updated = PatientList(list(patients), patients.next_id)
+            apply_changes(updated, changes)
+            self.write(updated)
+        apply_changes(patients, changes)
+        return changes
+
+    def sync(self, patients):
+        if file_stamp(self.path) == self.stamp:
+            return []
+        with self.locked():
+            data = self.read()
+            self.stamp = file_stamp(self.path)
+            token = snapshot_token(data)
+            if token == self.token:
+                return []
+            fresh = PatientList(parse_patients(data) if data else [])
+            self.token = token
+        update_bmi(fresh)
+        normalize_patients(fresh)
+        return diff_patients(patients, fresh)
+
+
+def parse_journal(data, offset):
+    """Целые записи журнала с позиции offset: пары (запись, конец ее строки)"""
+    while offset < len(data):
+        line_end = data.find(b'\n', offset)
+        if line_end < 0:
+            # Строку еще дописывают (или запись оборвалась при падении)
+            return
+        try:
+            record = json.loads(data[offset:line_end])
+        except ValueError:
+            return
+        yield record, line_end + 1
+        offset = line_end + 1
+
+
+class JournalStorage(PatientStorage):
+    """Снимок в JSON-файле плюс журнал изменений, который только дописывается.
+
+    Каждая запись журнала - одна строка JSON, после записи делается fsync,
+    поэтому сохранение стоит пропорционально размеру изменения, а не всего
+    списка. Когда в журнале накапливается compact_every записей, список
+    целиком записывается в новый снимок (через атомарный rename), а журнал
+    начинается заново.
+
+    С одними файлами могут работать несколько рабочих мест. Запись идет под
+    блокировкой (FileLock), у каждого изменения в журнале есть номер версии
+    v и отметка рабочего места by. sync дочитывает журнал с места, где
+    остановился в прошлый раз, и отдает только чужие изменения. При сжатии
+    прежний журнал остается рядом (.journal.prev), чтобы остальные могли
+    дочитать его хвост, а не перечитывать снимок целиком. Сжимает журнал
+    только рабочее место, у которого учтены все записи. Изменение записей,
+    которые уже поменял кто-то другой, commit не пишет (StorageConflictError).
+
+    С read_only=True файлы только читаются: ничего не переписывается и не
+    обрезается, даже если журнал устарел или файл старого формата.
+    """
+
+    def __init__(self, path, compact_every=DEFAULT_COMPACT_EVERY, read_only=False):
+        self.path = path
+        self.journal_path = path + JOURNAL_SUFFIX
+        self.previous_journal_path = path + PREVIOUS_JOURNAL_SUFFIX
+        self.compact_every = compact_every
+        self.read_only = read_only
+        self.journal_records = 0
+        self.base_token = snapshot_token(b'')
+        # Сколько байт журнала уже учтено в памяти и номер последнего
+        # учтенного изменения
+        self.journal_offset = 0
+        self.version = 0
+        self.writer = uuid.uuid4().hex[:12]
+        self.lock = FileLock(path)
+        self.stamp = None
+
+    def load_snapshot(self):
+        """Отметка снимка и пациенты из него"""
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        return snapshot_token(data), parse_patients(data)
+
+    def encode_snapshot(self, patients):
+        return dump_patients(patients)
+
+    def file_stamp(self):
+        return file_stamp(self.path, self.journal_path)
+
+    def load(self):
+        with self.locked():
+            patients, legacy = self.read_files(repair=not self.read_only)
+            if legacy and not self.read_only:
+                # Снимок и журнал старого формата сразу переписываются с id
+                self.compact(patients)
+            self.stamp = self.file_stamp()
+        return patients
+
+    def read_files(self, repair):
+        """Снимок с примененным журналом; legacy - если файлы старого формата"""
+        snapshot = []
+        self.base_token = snapshot_token(b'')
+        if os.path.exists(self.path):
+            self.base_token, snapshot = self.load_snapshot()
+        migrated = assign_patient_ids(snapshot)
+        patients = PatientList(snapshot)
+        self.journal_records, legacy = self.replay_journal(patients, repair)
+        return patients, migrated or legacy
+
+    def replay_journal(self, patients, repair=True):
+        self.journal_offset = 0
+        self.version = 0
+        if not os.path.exists(self.journal_path):
+            return 0, False
+
+        with open(self.journal_path, 'rb') as f:
+            data = f.read()
+
+        # Первая строка журнала - отметка снимка, к которому он относится.
+        # Если снимок уже другой (упали между записью снимка и сбросом
+        # журнала), все изменения из журнала в нем уже учтены.
+        header_end = data.find(b'\n')
+        try:
+            header = json.loads(data[:header_end])
+        except ValueError:
+            header = {}
+        if header_end < 0 or header.get('base') != self.base_token:
+            if repair:
+                os.remove(self.journal_path)
+            return 0, False
+
+        replayed = 0
+        legacy = False
+        self.version = header.get('version', 0)
+        good_end = header_end + 1
+        for record, good_end in parse_journal(data, header_end + 1):
+            patient = record.get('patient')
+            if patient is not None:
+                patient = Patient.from_dict(patient)
+            patient_id = record.get('id')
+            try:
+                if 'id' not in record:
+                    # Журнал старого формата ссылался на записи по позиции
+                    legacy = True
+                    if record['op'] != 'add':
+                        patient_id = patients[record['index']].id
+                apply_change(patients, (record['op'], patient_id, patient))
+            except (KeyError, IndexError, ValueError) as e:
+                # Одно изменение, которое не к чему применить (например,
+                # правка записи, добавление которой не дошло до файла), не
+                # должно мешать загрузить всю базу
+                log.warning("Журнал %s: пропущено изменение %s записи %s: %r",
+                            self.journal_path, record.get('op'), patient_id, e)
+            self.version = record.get('v', self.version + 1)
+            replayed += 1
+        self.journal_offset = good_end
+
+        if good_end < len(data):
+            # Недописанная последняя строка - приложение упало во время записи
+            log.warning("Журнал %s: пропущена поврежденная запись", self.journal_path)
+            if repair:
+                # Обрезаем хвост, чтобы новые записи не оказались после мусора
+                with open(self.journal_path, 'r+b') as f:
+                    f.truncate(good_end)
+                    os.fsync(f.fileno())
+        return replayed, legacy
+
+    def read_journal(self, path):
+        """Заголовок журнала, его содержимое и конец заголовка; None - если журнала нет"""
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        header_end = data.find(b'\n')
+        try:
+            header = json.loads(data[:header_end]) if header_end >= 0 else {}
+        except ValueError:
+            header = {}
+        return header, data, header_end + 1
+
+    def read_new_records(self):
+        """Записи журнала, которых еще нет в памяти, вместе с новой позицией чтения.
+
+        Возвращает (записи, отметка снимка, позиция в журнале) или None, если
+        снимок с тех пор переписан так, что хвост не восстановить (например,
+        сжатие прошло дважды) - тогда остается сравнить списки целиком.
+        """
+        current = self.read_journal(self.journal_path)
+        if current is None:
+            if snapshot_token(self.read_snapshot_bytes()) == self.base_token:
+                return [], self.base_token, 0
+            return None
+        header, data, header_end = current
+
+        records = []
+        if header.get('base') != self.base_token:
+            # Снимок сжат другим рабочим местом - дочитываем прежний журнал
+            previous = self.read_journal(self.previous_journal_path)
+            if (header.get('prev') != self.base_token or previous is None
+                    or previous[0].get('base') != self.base_token):
+                return None
+            previous_header, previous_data, previous_end = previous
+            start = max(self.journal_offset, previous_end)
+            records.extend(record for record, end in parse_journal(previous_data, start))
+            offset = header_end
+        else:
+            offset = max(self.journal_offset, header_end)
+
+        for record, offset in parse_journal(data, offset):
+            records.append(record)
+        return records, header.get('base'), offset
+
+    def read_snapshot_bytes(self):
+        if not os.path.exists(self.path):
+            return b''
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def advance(self, records, base_token, offset):
+        """Запоминает, что записи records уже учтены в памяти"""
+        if base_token != self.base_token:
+            self.base_token = base_token
+            self.journal_records = 0
+        self.journal_records += len(records)
+        self.journal_offset = offset
+        for record in records:
+            self.version = max(self.version, record.get('v', self.version + 1))
+
+    def sync(self, patients):
+        if self.read_only or self.file_stamp() == self.stamp:
+            return []
+        with self.locked():
+            found = self.read_new_records()
+            if found is None:
+                changes = self.reread(patients)
+            else:
+                records, base_token, offset = found
+                self.advance(records, base_token, offset)
+                changes = []
+                for record in records:
+                    if record.get('by') == self.writer:
+                        continue
+                    patient = record.get('patient')
+                    if patient is not None:
+                        patient = Patient.from_dict(patient)
+                    changes.append((record['op'], record['id'], patient))
+                update_bmi([patient for op, patient_id, patient in changes if patient is not None])
+            self.stamp = self.file_stamp()
+        return changes
+
+    def reread(self, patients):
+        # Хвост журнала потерян - читаем файлы заново и сравниваем со списком
+        fresh, legacy = self.read_files(repair=False)
+        update_bmi(fresh)
+        normalize_patients(fresh)
+        return diff_patients(patients, fresh)
+
+    def commit(self, patients, changes):
+        if self.read_only:
+            raise PermissionError(f"{self.path} открыт только для чтения")
+        if not changes:
+            return []
+
+        with self.locked():
+            found = self.read_new_records()
+            if found is None:
+                raise StorageConflictError("Файл пациентов переписан на другом рабочем месте")
+            records, base_token, offset = found
+            foreign = [record for record in records if record.get('by') != self.writer]
+            clash = ({record.get('id') for record in foreign}
+                     & {patient_id for op, patient_id, patient in changes if op != 'add'})
+            if clash:
+                raise StorageConflictError(
+                    f"Эти записи уже изменены на другом рабочем месте: {len(clash)}")
+            # id новых записей назначаются здесь, под блокировкой и после
+            # чужих записей журнала: два рабочих места не возьмут один id
+            file_next_id = max([record.get('id') or 0 for record in records], default=0) + 1
+            changes = prepare_changes(patients, changes, file_next_id)
+            # Свой список совпадает с файлами, только если чужих изменений не было
+            in_sync = not foreign and base_token == self.base_token
+            if in_sync:
+                self.advance(records, base_token, offset)
+
+            version = max([self.version] + [record.get('v', 0) for record in records])
+            lines = []
+            if not os.path.exists(self.journal_path):
+                lines.append(json.dumps({'base': self.base_token, 'version': version}))
+            for op, patient_id, patient in changes:
+                version += 1
+                record = {'op': op, 'id': patient_id, 'v': version, 'by': self.writer,
+                          'patient': patient.to_dict() if patient is not None else None}
+                lines.append(json.dumps(record, ensure_ascii=False))
+
+            with open(self.journal_path, 'ab') as f:
+                f.write(('\n'.join(lines) + '\n').encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+                end = f.tell()
+            # Изменения уже в журнале - с этого момента они сохранены
+            apply_changes(patients, changes)
+            if in_sync:
+                self.journal_records += len(changes)
+                self.journal_offset = end
+                self.version = version
+                self.stamp = self.file_stamp()
+                # Изменения сначала попадают в журнал и только потом в снимок:
+                # другие рабочие места дочитают их из прежнего журнала
+                if self.journal_records >= self.compact_every:
+                    try:
+                        self.compact(patients)
+                    except Exception:
+                        # Изменения уже сохранены в журнале, он цел - сжатие
+                        # повторится при следующей записи
+                        log.exception("Не удалось сжать журнал %s", self.journal_path)
+        return changes
+
+    def compact(self, patients):
+        with self.locked():
+            data = self.encode_snapshot(patients)
+            previous_base = self.base_token
+            write_file_atomic(self.path, data)
+            self.base_token = snapshot_token(data)
+            # Старый журнал после подмены снимка уже не подходит к нему по
+            # отметке, так что даже если сброс не успеет выполниться, он будет
+            # проигнорирован. Его хвост нужен другим рабочим местам - журнал
+            # не удаляется, а переименовывается.
+            if os.path.exists(self.journal_path):
+                os.replace(self.journal_path, self.previous_journal_path)
+            header = json.dumps({'base': self.base_token, 'version': self.version,
+                                 'prev': previous_base}) + '\n'
+            write_file_atomic(self.journal_path, header.encode('utf-8'))
+            self.journal_records = 0
+            self.journal_offset = len(header)
+            self.stamp = self.file_stamp()
+
+
+# Колоночный снимок: сигнатура, длина заголовка, заголовок JSON и дальше
+# колонки подряд, каждая с границы 8 байт. Числа лежат как массивы array
+# (int64, double), ФИО - одной строкой UTF-8 через символ \0, пол - номерами
+# в таблице написаний. Пустые значения в колонках заменены нулями, а их
+# позиции перечислены в заголовке (missing). Записи, которые так не уложить
+# (мусор вместо чисел, возраст не целым числом, \0 в ФИО), хранятся целиком в
+# заголовке в поле irregular.
+COLUMNAR_MAGIC = b'DPCOLS01'
+COLUMNAR_SUFFIX = '.dpcol'
+COLUMNAR_TYPES = (('id', 'q'), ('age', 'q'), ('height', 'd'), ('weight', 'd'),
+                  ('gender_code', 'b'), ('gender', 'I'))
+
+
+def align8(size):
+    return (size + 7) // 8 * 8
+
+
+# Целые, которые точно помещаются в колонку double (рост и вес)
+MAX_EXACT_DOUBLE_INT = 2 ** 53
+
+
+def is_regular_patient(patient):
+    """Укладывается ли запись в колонки без потерь"""
+    if not isinstance(patient.name, str) or '\0' in patient.name:
+        return False
+    if not isinstance(patient.gender, str):
+        return False
+    if patient.age is not None and (type(patient.age) is not int
+                                    or not -2 ** 63 <= patient.age < 2 ** 63):
+        return False
+    return all(value is None or type(value) is float
+               or (type(value) is int and abs(value) <= MAX_EXACT_DOUBLE_INT)
+               for value in (patient.height, patient.weight))
+
+
+def encode_columnar(patients):
+    columns = {name: array(typecode) for name, typecode in COLUMNAR_TYPES}
+    missing = {'age': [], 'height': [], 'weight': [], 'gender_code': []}
+    genders = {}
+    names = []
+    irregular = {}
+
+    numbers = [(field, columns[field], missing[field]) for field in missing]
+    for position, patient in enumerate(patients):
+        if is_regular_patient(patient):
+            name, gender = patient.name, patient.gender
+            values = (patient.age, patient.height, patient.weight, patient.gender_code)
+        else:
+            irregular[position] = patient.to_dict()
+            name, gender = '', ''
+            values = (None, None, None, None)
+        for (field, column, positions), value in zip(numbers, values):
+            if value is None:
+                positions.append(position)
+                value = 0
+            column.append(value)
+        columns['id'].append(patient.id)
+        columns['gender'].append(genders.setdefault(gender, len(genders)))
+        names.append(name)
+
+    blobs = [(name, values.typecode, values.tobytes()) for name, values in columns.items()]
+    blobs.append(('name', 'utf-8', '\0'.join(names).encode('utf-8')))
+    layout = []
+    offset = 0
+    for name, typecode, blob in blobs:
+        layout.append([name, typecode, offset, len(blob)])
+        offset += align8(len(blob))
+    header = json.dumps({
+        'count': len(names),
+        'byteorder': sys.byteorder,
+        'genders': list(genders),
+        'columns': layout,
+        'missing': missing,
+        'irregular': irregular,
+    }, ensure_ascii=False).encode('utf-8')
+
+    parts = [COLUMNAR_MAGIC, len(header).to_bytes(8, 'little'), header,
+             bytes(align8(len(header)) - len(header))]
+    for name, typecode, blob in blobs:
+        parts.append(blob)
+        parts.append(bytes(align8(len(blob)) - len(blob)))
+    return b''.join(parts)
+
+
+def decode_columnar(data):
+    view = memoryview(data)
+    try:
+        if bytes(view[:8]) != COLUMNAR_MAGIC:
+            raise ValueError("Файл не является колоночным снимком пациентов")
+        header_size = int.from_bytes(view[8:16], 'little')
+        header = json.loads(bytes(view[16:16 + header_size]))
+        start = 16 + align8(header_size)
+        columns = {}
+        for name, typecode, offset, size in header['columns']:
+            part = view[start + offset:start + offset + size]
+            if typecode == 'utf-8':
+                text = str(part, 'utf-8')
+                columns[name] = text.split('\0') if header['count'] else []
+            else:
+                values = array(typecode)
+                values.frombytes(part)
+                if header['byteorder'] != sys.byteorder:
+                    values.byteswap()
+                columns[name] = values.tolist()
+            part.release()
+    finally:
+        view.release()
+
+    for field, positions in header['missing'].items():
+        values = columns[field]
+        for position in positions:
+            values[position] = None
+    genders = header['genders']
+    gender_of = [genders[number] for number in columns['gender']]
+    patients = [Patient(name, age, gender, height, weight, code, patient_id=patient_id)
+                for patient_id, name, age, gender, height, weight, code in zip(
+                    columns['id'], columns['name'], columns['age'], gender_of,
+                    columns['height'], columns['weight'], columns['gender_code'])]
+    for position, fields in header['irregular'].items():
+        patients[int(position)] = Patient(fields['name'], fields['age'], fields['gender'],
+                                          fields['height'], fields['weight'],
+                                          fields['gender_code'], patient_id=fields['id'])
+    return patients
+
+
+class ColumnarStorage(JournalStorage):
+    """Как JournalStorage, но снимок - колоночный двоичный файл, а не JSON.
+
+    Колонки читаются из снимка без разбора текста, но записи Patient при
+    загрузке все равно создаются сразу для всего списка: выигрыш - в более
+    быстром разборе, а не в ленивом доступе к записям (на 100 тыс. записей
+    чтение в 2-3 раза быстрее JSON, запись - примерно в 5 раз, файл в 2,7 раза
+    меньше; benchmarks/bench_snapshot.py). Журнал изменений остается в JSON.
+    Если снимка еще нет, он один раз создается из JSON-файла import_from (с
+    его журналом).
+    """
+
+    def __init__(self, path, import_from=None, compact_every=DEFAULT_COMPACT_EVERY,
+                 read_only=False):
+        super().__init__(path, compact_every, read_only)
+        self.import_from = import_from
+
+    def load_snapshot(self):
+        with open(self.path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return snapshot_token(data), decode_columnar(data)
+
+    def encode_snapshot(self, patients):
+        return encode_columnar(patients)
+
+    def load(self):
+        if (not os.path.exists(self.path) and self.import_from
+                and os.path.exists(self.import_from)):
+            patients = JournalStorage(self.import_from, read_only=True).load()
+            if not self.read_only:
+                self.compact(patients)
+                log.info("Импортировано пациентов из %s: %d", self.import_from, len(patients))
+            return patients
+        return super().load()
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    age INTEGER,
+    gender TEXT,
+    height REAL,
+    weight REAL,
+    gender_code INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_patients_name ON patients(name);
+CREATE INDEX IF NOT EXISTS idx_patients_age ON patients(age);
+CREATE INDEX IF NOT EXISTS idx_patients_gender ON patients(gender);
+"""
+
+PATIENT_FIELDS = ('name', 'age', 'gender', 'height', 'weight', 'gender_code')
+
+
+def patient_row(patient):
+    return tuple(getattr(patient, field) for field in PATIENT_FIELDS)
+
+
+def import_json_to_sqlite(json_path, connection):
+    """Однократный перенос пациентов из patients.json (вместе с журналом) в базу SQLite"""
+    patients = JournalStorage(json_path, read_only=True).load()
+    normalize_patients(patients)
+    with connection:
+        connection.executemany(
+            "INSERT INTO patients (name, age, gender, height, weight, gender_code, id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (patient_row(patient) + (patient.id,) for patient in patients))
+    return len(patients)
+
+
+class SqliteStorage(PatientStorage):
+    """Пациенты в базе SQLite: добавление, правка и удаление - запись одной строки.
+
+    id пациента - первичный ключ строки. С read_only=True база открывается
+    только для чтения; если ее еще нет, она собирается из import_from в памяти.
+    """
+
+    def __init__(self, path, import_from=None, read_only=False):
+        self.path = path
+        self.import_from = import_from
+        self.read_only = read_only
+        self.connection = None
+
+    def connect(self):
+        if self.read_only:
+            self.connection = self.connect_read_only()
+            return
+        if (not os.path.exists(self.path) and self.import_from
+                and os.path.exists(self.import_from)):
+            self.import_database()
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(SQLITE_SCHEMA)
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(patients)")]
+        if 'gender_code' not in columns:
+            # База создана до появления кода пола - коды проставит приложение
+            self.connection.execute("ALTER TABLE patients ADD COLUMN gender_code INTEGER")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_patients_gender_code ON patients(gender_code)")
+
+    def import_database(self):
+        """Собирает базу из import_from во временном файле и кладет ее на место.
+
+        Если импорт не удался, базы нет, и при следующем запуске он повторится.
+        """
+        tmp_path = self.path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            connection = sqlite3.connect(tmp_path)
+            try:
+                connection.executescript(SQLITE_SCHEMA)
+                imported = import_json_to_sqlite(self.import_from, connection)
+            finally:
+                connection.close()
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        log.info("Импортировано пациентов из %s: %d", self.import_from, imported)
+
+    def connect_read_only(self):
+        if os.path.exists(self.path):
+            uri = pathlib.Path(self.path).resolve().as_uri() + '?mode=ro'
+            return sqlite3.connect(uri, uri=True)
+        connection = sqlite3.connect(':memory:')
+        connection.executescript(SQLITE_SCHEMA)
+        if self.import_from and os.path.exists(self.import_from):
+            import_json_to_sqlite(self.import_from, connection)
+        return connection
+
+    def load(self):
+        if self.connection is None:
+            self.connect()
+        patients = [Patient(*row[1:], patient_id=row[0]) for row in self.connection.execute(
+            "SELECT id, name, age, gender, height, weight, gender_code "
+            "FROM patients ORDER BY id")]
+        # AUTOINCREMENT помнит id удаленных записей - новые id их не повторят
+        sequence = self.connection.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'patients'").fetchone()
+        return PatientList(patients, next_id=sequence[0] + 1 if sequence else None)
+
+    def commit(self, patients, changes):
+        if self.read_only:
+            raise PermissionError(f"{self.path} открыт только для чтения")
+        if self.connection is None:
+            self.connect()
+        with self.connection:
+            # Запись блокируется сразу, до выбора id: другое рабочее место
+            # не добавит с тем же id, пока идет эта транзакция
+            self.connection.execute("BEGIN IMMEDIATE")
+            last_id, sequence = self.connection.execute(
+                "SELECT MAX(id), (SELECT seq FROM sqlite_sequence WHERE name = 'patients') "
+                "FROM patients").fetchone()
+            changes = prepare_changes(patients, changes, max(last_id or 0, sequence or 0) + 1)
+            for op, patient_id, patient in changes:
+                if op == 'add':
+                    self.connection.execute(
+                        "INSERT INTO patients (name, age, gender, height, weight, gender_code, id) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        patient_row(patient) + (patient_id,))
+                elif op == 'update':
+                    self.connection.execute(
+                        "UPDATE patients SET name = ?, age = ?, gender = ?, "
+                        "height = ?, weight = ?, gender_code = ? WHERE id = ?",
+                        patient_row(patient) + (patient_id,))
+                elif op == 'delete':
+                    self.connection.execute("DELETE FROM patients WHERE id = ?", (patient_id,))
+        apply_changes(patients, changes)
+        return changes
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def load_patients(storage):
+    """Загружает пациентов из хранилища.
+
+    Заодно выполняет однократную миграцию: записям без кода пола (или со
+    старым, посчитанным по подстрокам) код проставляется и сохраняется.
+    ИМТ пересчитывается сразу для всего списка. Хранилище только для чтения
+    не переписывается - коды остаются только в памяти.
+    """
+    patients = storage.load()
+    update_bmi(patients)
+    changed = normalize_patients(patients)
+    if changed and not storage.read_only:
+        try:
+            storage.commit(patients, [('update', patients[i].id, patients[i]) for i in changed])
+            log.info("Проставлены коды пола: %d записей", len(changed))
+        except Exception as e:
+            log.warning("Не удалось сохранить коды пола: %s", e)
+    return patients
+
+
+STORAGE_BACKENDS = {
+    'json': JsonStorage,
+    'journal': JournalStorage,
+    'columnar': ColumnarStorage,
+    'sqlite': SqliteStorage,
+}
+
+
+def open_storage(path, backend='journal', read_only=False):
+    try:
+        storage_class = STORAGE_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Неизвестный тип хранилища: {backend}")
+    if storage_class is SqliteStorage:
+        # База лежит рядом с JSON-файлом и при первом запуске заполняется из него
+        return SqliteStorage(os.path.splitext(path)[0] + '.db', import_from=path,
+                             read_only=read_only)
+    if storage_class is ColumnarStorage:
+        return ColumnarStorage(os.path.splitext(path)[0] + COLUMNAR_SUFFIX, import_from=path,
+                               read_only=read_only)
+    return storage_class(path, read_only=read_only)
@@ -0,0 +1,451 @@
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs, urlsplit
+
+from patient_index import SORT_FIELDS, PatientIndex, parse_number
+from patient_metrics import metrics
+from patient_model import (GENDER_UNKNOWN, Patient, PatientList, PatientValidationError,
+                           normalize_gender, validate_patient)
+from patient_storage import StorageConflictError, apply_change, load_patients
+
+# Локальный HTTP/JSON-сервис над базой пациентов - для лабораторной и
+# бухгалтерской систем, которым нужен доступ без окна программы.
+#
+# Сервер на asyncio без сторонних пакетов. Пациенты держатся в памяти вместе с
+# индексами (PatientIndex), поэтому чтение и поиск отвечают сразу. Все, что
+# трогает файлы (загрузка, запись, проверка чужих изменений), выполняется в
+# потоке, и цикл событий в это время продолжает обслуживать запросы.
+# Изменения копятся в очереди и уходят на диск пачками: запросы, пришедшие
+# почти одновременно, сохраняются одним commit, и каждый получает ответ, когда
+# его пачка записана. В памяти изменения появляются только после записи.
+# Перед записью пачки забираются изменения других рабочих мест: запрос к
+# пациенту, которого за это время удалили, получает 404. Если записать не
+# удалось, запросы пачки получают ошибку, а после конфликта с другим рабочим
+# местом база перечитывается.
+#
+#     GET    /patients?offset=0&limit=50&sort=bmi&order=desc
+#     GET    /patients?q=иванов&age_from=18&age_to=65&bmi_from=30
+#     GET    /patients/12
+#     POST   /patients            {"name": ..., "age": ..., ...} или список таких
+#     PUT    /patients/12         поля, которые нужно изменить
+#     DELETE /patients/12
+#     GET    /stats               агрегаты четырех графиков статистики
+#
+# Запуск: python patients_cli.py serve --port 8765. По умолчанию сервер
+# слушает только 127.0.0.1.
+
+log = logging.getLogger('dear_patients.api')
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+MAX_BODY_SIZE = 10 * 1024 * 1024
+# Сколько секунд копить изменения перед записью одной пачкой
+BATCH_DELAY = 0.005
+# Как часто проверять изменения других рабочих мест, в секундах
+SYNC_INTERVAL = 2.0
+
+FILTERS = ('q', 'age_from', 'age_to', 'bmi_from', 'bmi_to')
+
+STATUS_TEXT = {
+    200: 'OK',
+    201: 'Created',
+    204: 'No Content',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    409: 'Conflict',
+    413: 'Payload Too Large',
+    422: 'Unprocessable Entity',
+    500: 'Internal Server Error',
+}
+
+
+class ApiError(Exception):
+    """Ошибка запроса, которая отдается клиенту с HTTP-статусом"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def patient_json(patient):
+    data = patient.to_dict()
+    bmi = patient.bmi
+    data['bmi'] = None if bmi is None or bmi != bmi else round(bmi, 2)
+    return data
+
+
+def validated_patient(data, current=None):
+    """Запись по правилам формы; поля, которых нет в data, берутся из current"""
+    if not isinstance(data, dict):
+        raise ApiError(400, "Ожидается объект JSON с полями пациента")
+    fields = {name: getattr(current, name, None) for name in Patient.FIELDS}
+    fields.update((name, data[name]) for name in Patient.FIELDS if name in data)
+    if normalize_gender(fields['gender']) == GENDER_UNKNOWN:
+        raise ApiError(422, "Укажите пол: М или Ж")
+    try:
+        return validate_patient(**fields)
+    except PatientValidationError as e:
+        raise ApiError(422, str(e))
+
+
+class PatientService:
+    """Пациенты в памяти, их индексы и очередь записи на диск"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.patients = PatientList()
+        self.index = PatientIndex()
+        self.pending = []
+        self.data_version = 0
+        self.stats_cache = None
+        self.storage_lock = None
+        self.wakeup = None
+        self.tasks = []
+
+    async def start(self):
+        self.storage_lock = asyncio.Lock()
+        self.wakeup = asyncio.Event()
+        await self.reload()
+        self.tasks = [asyncio.create_task(self.write_loop()),
+                      asyncio.create_task(self.sync_loop())]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        # Дописываем то, что еще стоит в очереди
+        if self.pending:
+            await self.write_batch()
+
+    async def reload(self):
+        async with self.storage_lock:
+            patients = await asyncio.to_thread(load_patients, self.storage)
+            index = await asyncio.to_thread(PatientIndex, patients)
+        self.patients = patients
+        self.index = index
+        self.data_version += 1
+
+    def apply(self, change):
+        """Записанное изменение - в список и индексы"""
+        op, patient_id, patient = change
+        old_patient = self.patients.get(patient_id)
+        apply_change(self.patients, change)
+        if old_patient is not None:
+            self.index.remove(old_patient)
+        if patient is not None:
+            self.index.add(patient)
+        self.data_version += 1
+
+    async def write(self, changes):
+        """Ставит изменения в очередь и ждет, пока пачка с ними будет записана.
+
+        Возвращает записанные изменения - с id, назначенными новым записям.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((changes, future))
+        self.wakeup.set()
+        return await future
+
+    async def write_loop(self):
+        while True:
+            await self.wakeup.wait()
+            await asyncio.sleep(BATCH_DELAY)
+            await self.write_batch()
+
+    async def write_batch(self):
+        self.wakeup.clear()
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        try:
+            async with self.storage_lock:
+                await self.pull()
+                batch = self.drop_missing(batch)
+                changes = [change for batch_changes, future in batch for change in batch_changes]
+                if not changes:
+                    # Записывать нечего, но ответа ждут все запросы пачки
+                    for batch_changes, future in batch:
+                        if not future.done():
+                            future.set_result([])
+                    return
+                # commit применяет изменения к списку в потоке - ему достается
+                # копия, а цикл событий пока отвечает по прежнему списку
+                snapshot = PatientList(list(self.patients), self.patients.next_id)
+                changes = await asyncio.to_thread(self.storage.commit, snapshot, changes)
+        except Exception as e:
+            status = 409 if isinstance(e, StorageConflictError) else 500
+            log.warning("Не удалось сохранить %d запросов: %s", len(batch), e)
+            for batch_changes, future in batch:
+                if not future.done():
+                    future.set_exception(ApiError(status, f"Не удалось сохранить данные: {e}"))
+            if isinstance(e, StorageConflictError):
+                # Список в памяти разошелся с файлом
+                await self.reload()
+            return
+
+        for change in changes:
+            self.apply(change)
+        position = 0
+        for batch_changes, future in batch:
+            written = changes[position:position + len(batch_changes)]
+            position += len(batch_changes)
+            if not future.done():
+                future.set_result(written)
+
+    def drop_missing(self, batch):
+        """Запросы пачки, пациенты которых еще есть; остальные получают 404.
+
+        Пока запрос ждал в очереди, пациента могли удалить другим запросом
+        или на другом рабочем месте.
+        """
+        deleted = set()
+        kept = []
+        for batch_changes, future in batch:
+            if any(op != 'add' and (patient_id in deleted or patient_id not in self.patients)
+                   for op, patient_id, patient in batch_changes):
+                if not future.done():
+                    future.set_exception(ApiError(404, "Нет такого пациента"))
+                continue
+            deleted.update(patient_id for op, patient_id, patient in batch_changes
+                           if op == 'delete')
+            kept.append((batch_changes, future))
+        return kept
+
+    async def sync_loop(self):
+        while True:
+            await asyncio.sleep(SYNC_INTERVAL)
+            try:
+                await self.sync()
+            except Exception as e:
+                log.warning("Не удалось проверить изменения базы: %s", e)
+
+    async def sync(self):
+        async with self.storage_lock:
+            await self.pull()
+
+    async def pull(self):
+        """Изменения других рабочих мест - в список и индексы; зовется под storage_lock"""
+        snapshot = PatientList(list(self.patients), self.patients.next_id)
+        changes = await asyncio.to_thread(self.storage.sync, snapshot)
+        for op, patient_id, patient in changes:
+            exists = patient_id in self.patients
+            if op == 'add' and exists:
+                op = 'update'
+            elif op != 'add' and not exists:
+                continue
+            self.apply((op, patient_id, patient))
+
+    async def stats(self):
+        """Агрегаты графиков; считаются в потоке и один раз на версию данных"""
+        if self.stats_cache is None or self.stats_cache[0] != self.data_version:
+            version = self.data_version
+            patients = list(self.patients)
+
+            def summarize():
+                from patient_stats import PatientColumns, PatientStats
+                return PatientStats(PatientColumns(patients)).summary()
+
+            summary = await asyncio.to_thread(summarize)
+            summary['patients'] = len(patients)
+            self.stats_cache = (version, summary)
+        return self.stats_cache[1]
+
+
+def page_bounds(query, total):
+    try:
+        offset = max(0, int(query.get('offset', 0)))
+        limit = min(max(0, int(query.get('limit', DEFAULT_PAGE_SIZE))), MAX_PAGE_SIZE)
+    except ValueError:
+        raise ApiError(400, "offset и limit должны быть целыми числами")
+    return offset, limit, min(total, offset + limit)
+
+
+def query_number(query, name):
+    if not query.get(name):
+        return None
+    number = parse_number(query[name])
+    if number is None:
+        raise ApiError(400, f"{name} должно быть числом")
+    return number
+
+
+class PatientApi:
+    """Разбор HTTP-запросов и ответы в JSON поверх PatientService"""
+
+    def __init__(self, service):
+        self.service = service
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except ApiError as e:
+                    await send_response(writer, e.status, {'error': str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                with metrics.timer(f"api.{method}"):
+                    status, payload = await self.dispatch(method, target, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await send_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split('/') if part]
+        try:
+            if parts == ['patients']:
+                if method == 'GET':
+                    return 200, self.list_patients(query)
+                if method == 'POST':
+                    return 201, await self.create_patients(parse_body(body))
+            elif len(parts) == 2 and parts[0] == 'patients':
+                patient_id = self.patient_id(parts[1])
+                if method == 'GET':
+                    return 200, patient_json(self.service.patients.get(patient_id))
+                if method in ('PUT', 'PATCH'):
+                    return 200, await self.update_patient(patient_id, parse_body(body))
+                if method == 'DELETE':
+                    await self.service.write([('delete', patient_id, None)])
+                    return 204, None
+            elif parts == ['stats']:
+                if method == 'GET':
+                    return 200, await self.service.stats()
+            else:
+                raise ApiError(404, "Нет такого адреса")
+            raise ApiError(405, f"Метод {method} здесь не поддерживается")
+        except ApiError as e:
+            return e.status, {'error': str(e)}
+        except Exception as e:
+            log.exception("Ошибка обработки запроса %s %s", method, target)
+            return 500, {'error': str(e)}
+
+    def patient_id(self, text):
+        try:
+            patient_id = int(text)
+        except ValueError:
+            raise ApiError(404, "Нет такого пациента")
+        if patient_id not in self.service.patients:
+            raise ApiError(404, "Нет такого пациента")
+        return patient_id
+
+    def list_patients(self, query):
+        service = self.service
+        sort = query.get('sort')
+        if sort is not None and sort not in SORT_FIELDS:
+            raise ApiError(400, f"Сортировка возможна по полям: {', '.join(SORT_FIELDS)}")
+        descending = query.get('order') == 'desc'
+
+        if any(query.get(name) for name in FILTERS):
+            found = service.index.search(
+                query.get('q', ''),
+                age_range=(query_number(query, 'age_from'), query_number(query, 'age_to')),
+                bmi_range=(query_number(query, 'bmi_from'), query_number(query, 'bmi_to')))
+            if sort is not None:
+                found = service.index.sort_patients(found, sort, descending)
+            else:
+                found.sort(key=lambda patient: patient.id)
+            total = len(found)
+            offset, limit, end = page_bounds(query, total)
+            items = found[offset:end]
+        else:
+            total = len(service.patients)
+            offset, limit, end = page_bounds(query, total)
+            if sort is not None:
+                items = [service.index.sorted_patient(sort, position, descending)
+                         for position in range(offset, end)]
+            else:
+                items = [service.patients[position] for position in range(offset, end)]
+        return {'total': total, 'offset': offset, 'limit': limit,
+                'items': [patient_json(patient) for patient in items]}
+
+    async def create_patients(self, data):
+        # Список пациентов проверяется целиком и пишется одной пачкой
+        items = data if isinstance(data, list) else [data]
+        if not items:
+            raise ApiError(400, "Список пациентов пуст")
+        patients = [validated_patient(item) for item in items]
+        changes = await self.service.write([('add', None, patient) for patient in patients])
+        created = [patient_json(patient) for op, patient_id, patient in changes]
+        return created if isinstance(data, list) else created[0]
+
+    async def update_patient(self, patient_id, data):
+        patient = validated_patient(data, self.service.patients.get(patient_id))
+        patient.id = patient_id
+        await self.service.write([('update', patient_id, patient)])
+        return patient_json(patient)
+
+
+def parse_body(body):
+    try:
+        return json.loads(body or b'null')
+    except ValueError:
+        raise ApiError(400, "Тело запроса - не JSON")
+
+
+async def read_request(reader):
+    """Метод, адрес, заголовки и тело запроса; None - если клиент закрыл соединение"""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise ApiError(413, "Слишком длинные заголовки")
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ', 2)
+    except ValueError:
+        raise ApiError(400, "Неверная строка запроса")
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        raise ApiError(400, "Неверный Content-Length")
+    if length > MAX_BODY_SIZE:
+        raise ApiError(413, "Слишком большой запрос")
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), target, headers, body
+
+
+async def send_response(writer, status, payload, keep_alive=True):
+    body = b'' if payload is None else json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    head = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    if payload is not None:
+        head.append("Content-Type: application/json; charset=utf-8")
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+    await writer.drain()
+
+
+async def serve(storage, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+    """Запускает сервис и работает до отмены; ready(адрес) зовется после старта"""
+    service = PatientService(storage)
+    await service.start()
+    api = PatientApi(service)
+    server = await asyncio.start_server(api.handle_connection, host, port)
+    address = server.sockets[0].getsockname()
+    log.info("API слушает http://%s:%s", address[0], address[1])
+    if ready is not None:
+        ready(address)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
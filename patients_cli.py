@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import sys
+
+from patient_metrics import metrics, configure_logging
+from patient_storage import open_storage, load_patients
+
+# Командная строка для работы с базой пациентов без графического окна.
+#
+# Модуль не импортирует tkinter, а NumPy и Matplotlib подгружает только в
+# тех командах, которым они нужны, поэтому его можно запускать ночными
+# заданиями на сервере без экрана:
+#
+#     python patients_cli.py stats --json
+#     python patients_cli.py export-charts charts/
+#     python patients_cli.py import new_patients.csv
+#     python patients_cli.py validate
+#     python patients_cli.py duplicates
+#
+# Сводки (patient_sketch) нескольких клиник можно сложить и построить
+# общую статистику, не собирая записи в один файл:
+#
+#     python patients_cli.py sketch clinic1.sketch.json
+#     python patients_cli.py stats --sketch clinic1.sketch.json --sketch clinic2.sketch.json
+#
+# Или прочитать сразу папку с файлами всех клиник - параллельно, по
+# процессу на файл:
+#
+#     python patients_cli.py stats --shards clinics/
+#
+# Или отдавать базу другим программам по HTTP (patients_api):
+#
+#     python patients_cli.py serve --port 8765
+#
+# --metrics-log дописывает замеры времени строками JSON, --log-level DEBUG
+# включает отладочный вывод.
+#
+# Команды, которые только читают базу (stats, export-charts, sketch,
+# validate, duplicates), открывают ее только для чтения: файлы старого
+# формата не мигрируют и не переписываются. Сообщения хранилища идут в
+# журнал (stderr), так что вывод --json остается чистым JSON.
+
+
+def open_patients(args, read_only=False):
+    storage = open_storage(args.file, args.backend, read_only=read_only)
+    with metrics.timer('load_patients'):
+        patients = load_patients(storage)
+    return storage, patients
+
+
+def load_stats(args):
+    """Агрегаты для графиков и число пациентов - по файлу, сводкам или папке клиник"""
+    if args.shards:
+        from patient_shards import shard_files, aggregate_shards
+
+        paths = shard_files(args.shards)
+        sketch, errors = aggregate_shards(paths, workers=args.workers)
+        for path, error in errors:
+            print(f"Файл {path} пропущен: {error}", file=sys.stderr)
+        print(f"Прочитано файлов: {len(paths) - len(errors)} из {len(paths)}", file=sys.stderr)
+        return sketch.stats(), sketch.size
+
+    if args.sketch:
+        from patient_sketch import PatientSketch
+
+        sketch = PatientSketch()
+        for path in args.sketch:
+            sketch.merge(PatientSketch.load(path))
+        return sketch.stats(), sketch.size
+
+    from patient_stats import PatientColumns, PatientStats
+
+    storage, patients = open_patients(args, read_only=True)
+    storage.close()
+    return PatientStats(PatientColumns(patients)), len(patients)
+
+
+def command_stats(args):
+    stats, count = load_stats(args)
+    summary = stats.summary()
+    summary['patients'] = count
+
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        return 0
+
+    print(f"Пациентов: {summary['patients']}")
+    print(", ".join(f"{label}: {count}" for label, count in summary['gender_counts'].items()))
+    for label, box in summary['bmi_by_gender'].items():
+        print(f"ИМТ ({label}): медиана {box['median']:.1f}, "
+              f"квартили {box['q1']:.1f}-{box['q3']:.1f}, выбросов {box['outliers']}")
+    trend = summary['bmi_age_trend']
+    if trend is not None:
+        print(f"ИМТ от возраста: {trend['slope']:.3f} * возраст + {trend['intercept']:.2f}")
+    return 0
+
+
+def command_export_charts(args):
+    from patient_charts import CHARTS, render_chart_png
+
+    stats, count = load_stats(args)
+
+    os.makedirs(args.output, exist_ok=True)
+    for title, create_chart in CHARTS:
+        with metrics.timer(create_chart.__name__):
+            fig = create_chart(stats)
+        if fig is None:
+            print(f"{title} - недостаточно данных")
+            continue
+        # create_bmi_age_chart -> bmi_age.png
+        name = create_chart.__name__[len('create_'):-len('_chart')]
+        path = os.path.join(args.output, f"{name}.png")
+        with metrics.timer('render_chart_png'):
+            png = render_chart_png(fig)
+        with open(path, 'wb') as f:
+            f.write(png)
+        print(f"{title}: {path}")
+    return 0
+
+
+def command_sketch(args):
+    from patient_sketch import PatientSketch
+
+    storage, patients = open_patients(args, read_only=True)
+    storage.close()
+    PatientSketch(patients).save(args.output)
+    print(f"Сводка по {len(patients)} пациентам: {args.output}")
+    return 0
+
+
+def command_import(args):
+    from patient_io import import_patients
+
+    imported, rejected = import_patients(args.source)
+    for line_number, reason in rejected:
+        print(f"Строка {line_number}: {reason}", file=sys.stderr)
+
+    if imported:
+        storage, patients = open_patients(args)
+        storage.commit(patients, [('add', None, patient) for patient in imported])
+        storage.close()
+
+    print(f"Добавлено пациентов: {len(imported)}, отклонено строк: {len(rejected)}")
+    return 1 if rejected else 0
+
+
+def command_validate(args):
+    from patient_model import PatientValidationError, validate_patient
+
+    storage, patients = open_patients(args, read_only=True)
+    storage.close()
+    invalid = 0
+    for patient in patients:
+        try:
+            validate_patient(patient.name, patient.age, patient.gender,
+                             patient.height, patient.weight)
+        except PatientValidationError as e:
+            invalid += 1
+            reason = str(e).replace('\n', ' ')
+            print(f"Запись {patient.id} ({patient.name}): {reason}")
+
+    print(f"Проверено записей: {len(patients)}, с ошибками: {invalid}")
+    return 1 if invalid else 0
+
+
+def command_duplicates(args):
+    from patient_duplicates import find_duplicate_groups
+
+    storage, patients = open_patients(args, read_only=True)
+    storage.close()
+    with metrics.timer('duplicates.report'):
+        groups = find_duplicate_groups(patients)
+
+    if args.json:
+        json.dump([[patient.to_dict() for patient in group] for group in groups],
+                  sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        for number, group in enumerate(groups, 1):
+            print(f"Группа {number}:")
+            for patient in group:
+                print(f"  {patient.id}: {patient.name}, возраст {patient.age}, пол {patient.gender}")
+        print(f"Групп возможных дублей: {len(groups)}, "
+              f"записей в них: {sum(len(group) for group in groups)}")
+    return 0
+
+
+def command_serve(args):
+    import asyncio
+    from patients_api import serve
+
+    storage = open_storage(args.file, args.backend)
+
+    def ready(address):
+        print(f"API слушает http://{address[0]}:{address[1]} (Ctrl+C - остановить)")
+
+    try:
+        asyncio.run(serve(storage, args.host, args.port, ready))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        storage.close()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Медицинская система учета пациентов")
+    parser.add_argument('--file', default='patients.json', help="файл с пациентами")
+    parser.add_argument('--backend', default='journal', choices=('journal', 'json', 'columnar', 'sqlite'),
+                        help="способ хранения данных")
+    parser.add_argument('--log-level', default='WARNING',
+                        choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'), help="уровень журнала")
+    parser.add_argument('--metrics-log', metavar='FILE',
+                        help="дописывать замеры времени в файл (JSON Lines)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    stats = commands.add_parser('stats', help="сводная статистика")
+    stats.add_argument('--json', action='store_true', help="вывести в формате JSON")
+    stats.set_defaults(handler=command_stats)
+
+    charts = commands.add_parser('export-charts', help="сохранить графики в PNG")
+    charts.add_argument('output', help="каталог для картинок")
+    charts.set_defaults(handler=command_export_charts)
+
+    for command in (stats, charts):
+        source = command.add_mutually_exclusive_group()
+        source.add_argument('--sketch', action='append', metavar='FILE',
+                            help="взять данные из сводки (можно указать несколько - они сложатся)")
+        source.add_argument('--shards', metavar='DIR',
+                            help="папка с файлами клиник (*.json), читаются параллельно")
+        command.add_argument('--workers', type=int, default=None,
+                             help="сколько процессов для --shards (по умолчанию - по числу ядер)")
+
+    sketch = commands.add_parser('sketch', help="сохранить сводку для статистики")
+    sketch.add_argument('output', help="файл сводки .json")
+    sketch.set_defaults(handler=command_sketch)
+
+    importer = commands.add_parser('import', help="импорт из CSV или JSON Lines")
+    importer.add_argument('source', help="файл .csv или .jsonl")
+    importer.set_defaults(handler=command_import)
+
+    validate = commands.add_parser('validate', help="проверить записи по правилам формы")
+    validate.set_defaults(handler=command_validate)
+
+    duplicates = commands.add_parser('duplicates', help="найти возможные дубли пациентов")
+    duplicates.add_argument('--json', action='store_true', help="вывести в формате JSON")
+    duplicates.set_defaults(handler=command_duplicates)
+
+    server = commands.add_parser('serve', help="JSON API для других программ")
+    server.add_argument('--host', default='127.0.0.1', help="адрес (по умолчанию только этот компьютер)")
+    server.add_argument('--port', type=int, default=8765)
+    server.set_defaults(handler=command_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    configure_logging(args.log_level)
+    if args.metrics_log:
+        metrics.open_log(args.metrics_log)
+    try:
+        with metrics.timer(f"command.{args.command}"):
+            return args.handler(args)
+    finally:
+        metrics.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,16 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def patients_file(tmp_path):
+    """Копия patients.json из репозитория во временной папке"""
+    path = tmp_path / 'patients.json'
+    shutil.copy(os.path.join(ROOT, 'patients.json'), path)
+    return str(path)
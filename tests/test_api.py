@@ -0,0 +1,154 @@
+import asyncio
+import json
+from urllib.parse import quote
+
+from patient_storage import JournalStorage
+from patients_api import PatientApi, PatientService
+
+
+async def request(port, method, path, data=None):
+    """Один HTTP-запрос к серверу: статус и разобранный JSON ответа"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = b'' if data is None else json.dumps(data).encode('utf-8')
+    writer.write((f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+                  f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode('latin-1')
+                 + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    return status, json.loads(payload) if payload else None
+
+
+def run_api(path, scenario):
+    """Запускает сервис на файле path и выполняет scenario(port, service)"""
+    storage = JournalStorage(path)
+
+    async def main():
+        service = PatientService(storage)
+        await service.start()
+        server = await asyncio.start_server(PatientApi(service).handle_connection,
+                                            '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            async with server:
+                return await scenario(port, service)
+        finally:
+            await service.stop()
+
+    try:
+        return asyncio.run(main())
+    finally:
+        storage.close()
+
+
+def test_list_search_and_sort(patients_file):
+    async def scenario(port, service):
+        status, page = await request(port, 'GET', '/patients?offset=5&limit=10')
+        assert status == 200
+        assert page['total'] == 28
+        assert [item['id'] for item in page['items']] == list(range(6, 16))
+
+        status, found = await request(port, 'GET', '/patients?q=' + quote('картман'))
+        assert status == 200
+        assert found['items'] and all('Картман' in item['name'] for item in found['items'])
+
+        status, ordered = await request(port, 'GET', '/patients?sort=age&order=desc&limit=1000')
+        ages = [item['age'] for item in ordered['items']]
+        assert ages == sorted(ages, reverse=True)
+
+        status, error = await request(port, 'GET', '/patients?sort=colour')
+        assert status == 400
+
+    run_api(patients_file, scenario)
+
+
+def test_create_update_delete(patients_file):
+    async def scenario(port, service):
+        status, created = await request(port, 'POST', '/patients', {
+            'name': 'Баттерс Стотч', 'age': 10, 'gender': 'м', 'height': 135, 'weight': 30})
+        assert status == 201
+        assert created['id'] == 29
+        assert created['bmi'] == round(30 / 1.35 ** 2, 2)
+
+        status, updated = await request(port, 'PUT', '/patients/29', {'weight': 33})
+        assert status == 200
+        assert updated['weight'] == 33 and updated['name'] == 'Баттерс Стотч'
+        status, fetched = await request(port, 'GET', '/patients/29')
+        assert fetched['weight'] == 33
+
+        status, payload = await request(port, 'DELETE', '/patients/29')
+        assert status == 204
+        status, payload = await request(port, 'GET', '/patients/29')
+        assert status == 404
+
+    run_api(patients_file, scenario)
+    # Все изменения записаны в файл
+    patients = JournalStorage(patients_file).load()
+    assert len(patients) == 28 and 29 not in patients
+
+
+def test_validation_and_missing_patients(patients_file):
+    async def scenario(port, service):
+        status, error = await request(port, 'POST', '/patients', {
+            'name': 'Без возраста', 'age': -1, 'gender': 'ж', 'height': 160, 'weight': 50})
+        assert status == 422
+        status, error = await request(port, 'POST', '/patients', {
+            'name': 'Без пола', 'age': 30, 'gender': '?', 'height': 160, 'weight': 50})
+        assert status == 422
+        status, error = await request(port, 'PUT', '/patients/1', {'height': 'высокий'})
+        assert status == 422
+        for method in ('GET', 'PUT', 'DELETE'):
+            status, error = await request(port, method, '/patients/999', {'age': 1})
+            assert status == 404
+        status, error = await request(port, 'GET', '/nowhere')
+        assert status == 404
+
+    run_api(patients_file, scenario)
+
+
+def test_stats(patients_file):
+    async def scenario(port, service):
+        status, stats = await request(port, 'GET', '/stats')
+        assert status == 200
+        assert stats['patients'] == 28
+        assert sum(stats['gender_counts'].values()) == 28
+
+    run_api(patients_file, scenario)
+
+
+def test_update_of_patient_deleted_meanwhile(patients_file):
+    async def scenario(port, service):
+        # Удаление и правка попадают в одну пачку: правка получает 404,
+        # удаление проходит
+        api = PatientApi(service)
+        (delete_status, _), (update_status, _) = await asyncio.gather(
+            api.dispatch('DELETE', '/patients/3', b''),
+            api.dispatch('PUT', '/patients/3', b'{"age": 11}'))
+        assert delete_status == 204
+        assert update_status == 404
+
+        # Пациента удалили на другом рабочем месте, сервис об этом еще не знает
+        other = JournalStorage(patients_file)
+        other.commit(other.load(), [('delete', 4, None)])
+        other.close()
+        assert 4 in service.patients
+        status, error = await request(port, 'PUT', '/patients/4', {'age': 11})
+        assert status == 404
+        status, payload = await request(port, 'GET', '/patients/5')
+        assert status == 200
+
+    run_api(patients_file, scenario)
+
+
+def test_empty_requests_do_not_hang(patients_file):
+    async def scenario(port, service):
+        status, error = await asyncio.wait_for(request(port, 'POST', '/patients', []), 5)
+        assert status == 400
+        # Запрос без изменений в очереди получает ответ, а не ждет вечно
+        assert await asyncio.wait_for(service.write([]), 5) == []
+        status, page = await request(port, 'GET', '/patients')
+        assert page['total'] == 28
+
+    run_api(patients_file, scenario)
@@ -0,0 +1,50 @@
+from patient_duplicates import DuplicateIndex, find_duplicate_groups
+from patient_model import Patient, normalize_gender
+
+
+def make_patient(patient_id, name, age=10, gender='м'):
+    return Patient(name, age, gender, 140, 35, normalize_gender(gender), patient_id=patient_id)
+
+
+def found_ids(index, patient, exclude=None):
+    return [other.id for score, other in index.find(patient, exclude=exclude)]
+
+
+def test_finds_similar_names():
+    index = DuplicateIndex([make_patient(1, "Картман Эрик"),
+                            make_patient(2, "Брофловски Кайл"),
+                            make_patient(3, "Маккормик Кенни")])
+    # Другой порядок слов, латиница, опечатка, инициал
+    assert found_ids(index, make_patient(None, "Эрик Картман")) == [1]
+    assert found_ids(index, make_patient(None, "Kartman Erik")) == [1]
+    assert found_ids(index, make_patient(None, "Брофловский Кайл")) == [2]
+    assert found_ids(index, make_patient(None, "Маккормик К.")) == [3]
+    assert found_ids(index, make_patient(None, "Картман Эрик Теодор")) == [1]
+    assert found_ids(index, make_patient(None, "Марш Стэнли")) == []
+
+
+def test_age_gender_and_exclude():
+    index = DuplicateIndex([make_patient(1, "Картман Эрик")])
+    assert found_ids(index, make_patient(None, "Картман Эрик", age=11)) == [1]
+    assert found_ids(index, make_patient(None, "Картман Эрик", age=38)) == []
+    assert found_ids(index, make_patient(None, "Картман Эрик", gender='ж')) == []
+    # Сама редактируемая запись дублем не считается
+    assert found_ids(index, make_patient(1, "Картман Эрик"), exclude=1) == []
+
+
+def test_index_updates():
+    first = make_patient(1, "Картман Эрик")
+    index = DuplicateIndex([first])
+    index.replace(first, make_patient(1, "Марш Стэнли"))
+    assert found_ids(index, make_patient(None, "Картман Эрик")) == []
+    assert found_ids(index, make_patient(None, "Марш Стэнли")) == [1]
+    index.remove(make_patient(1, "Марш Стэнли"))
+    assert len(index) == 0
+
+
+def test_duplicate_groups():
+    patients = [make_patient(1, "Иванов И."), make_patient(2, "Петров Петр"),
+                make_patient(3, "Иванов Иван"), make_patient(4, "Иванов Иван Петрович"),
+                make_patient(5, "Петрова Анна", gender='ж')]
+    groups = find_duplicate_groups(patients)
+    assert [[patient.id for patient in group] for group in groups] == [[1, 3, 4]]
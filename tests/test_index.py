@@ -0,0 +1,63 @@
+from patient_index import PatientIndex
+from patient_model import Patient, calculate_bmi
+
+
+def make_patients():
+    rows = [("Картман Эрик", 10, 'м', 138, 41), ("Брофловски Кайл", 10, 'м', 142, 32),
+            ("Тестабургер Венди", 9, 'ж', 135, 30), ("Маккормик Кенни", 11, 'м', 137, 29),
+            ("Картман Лиэнн", 38, 'ж', 165, 60), ("Гаррисон Герберт", 45, 'м', None, 80)]
+    patients = []
+    for patient_id, (name, age, gender, height, weight) in enumerate(rows, 1):
+        patients.append(Patient(name, age, gender, height, weight,
+                                bmi=calculate_bmi(weight, height), patient_id=patient_id))
+    return patients
+
+
+def ids(patients):
+    return [patient.id for patient in patients]
+
+
+def test_search_by_name_and_ranges():
+    index = PatientIndex(make_patients())
+    assert sorted(ids(index.search("картман"))) == [1, 5]
+    assert sorted(ids(index.search("ка"))) == [1, 2, 5]
+    assert sorted(ids(index.search("тман"))) == [1, 5]
+    assert sorted(ids(index.search(age_range=(10, 11)))) == [1, 2, 4]
+    assert sorted(ids(index.search("картман", age_range=(None, 20)))) == [1]
+    # Без ИМТ запись в диапазон ИМТ не попадает
+    assert sorted(ids(index.search(bmi_range=(0, None)))) == [1, 2, 3, 4, 5]
+    assert len(index.search()) == 6
+
+
+def test_sort_orders():
+    patients = make_patients()
+    index = PatientIndex(patients)
+    by_age = [index.sorted_patient('age', position) for position in range(6)]
+    assert ids(by_age) == [3, 1, 2, 4, 5, 6]
+    by_height = [index.sorted_patient('height', position, descending=True)
+                 for position in range(6)]
+    # Запись без роста остается в конце и при обратном порядке
+    assert ids(by_height) == [5, 2, 1, 4, 3, 6]
+    for position, patient in enumerate(by_height):
+        assert index.sort_position('height', patient, descending=True) == position
+
+    found = index.search("картман")
+    assert ids(index.sort_patients(found, 'age', descending=True)) == [5, 1]
+    assert ids(index.sort_patients(patients, 'name')) == [2, 6, 5, 1, 4, 3]
+
+
+def test_updates_keep_indexes_in_step():
+    patients = make_patients()
+    index = PatientIndex(patients)
+    index.sort_order('age')
+
+    index.remove(patients[0])
+    renamed = Patient("Стотч Баттерс", 10, 'м', 135, 30, bmi=calculate_bmi(30, 135),
+                      patient_id=2)
+    index.replace(patients[1], renamed)
+    index.add(Patient("Твик Твик", 8, 'м', 130, 28, bmi=calculate_bmi(28, 130), patient_id=7))
+
+    assert ids(index.search("картман")) == [5]
+    assert ids(index.search("стотч")) == [2]
+    assert [index.sorted_patient('age', position).id for position in range(6)] == [7, 3, 2, 4, 5, 6]
+    assert len(index) == 6
@@ -0,0 +1,62 @@
+import pytest
+
+from patient_io import export_patients, import_chunks, import_patients
+
+
+def write(path, text):
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_csv_rejections(tmp_path):
+    path = write(tmp_path / 'new.csv',
+                 "ФИО,Возраст,Пол,Рост,Вес,Примечание\n"
+                 "Стотч Баттерс,10,м,135,30,новый\n"
+                 ",10,м,135,30,\n"
+                 "Твик Твик,-3,м,130,28,\n"
+                 "Такер Крейг,10,м,высокий,30,\n"
+                 "Тестабургер Венди,9,ж,135,30.5,\n")
+    patients, rejected = import_patients(path)
+    assert [patient.name for patient in patients] == ["Стотч Баттерс", "Тестабургер Венди"]
+    assert patients[1].weight == 30.5 and patients[1].gender_code == 2
+    # Номер строки файла (заголовок - первая) и причина в одну строку
+    assert [line_number for line_number, reason in rejected] == [3, 4, 5]
+    assert rejected[0][1] == "Введите ФИО пациента"
+    assert all('\n' not in reason for line_number, reason in rejected)
+
+
+def test_jsonl_rejections(tmp_path):
+    path = write(tmp_path / 'new.jsonl',
+                 '{"name": "Стотч Баттерс", "age": 10, "gender": "м", "height": 135, "weight": 30}\n'
+                 '\n'
+                 '{"name": "Обрыв", "age": 10\n'
+                 '["Твик Твик", 10]\n'
+                 '{"name": "Без веса", "age": 10, "gender": "м", "height": 135}\n')
+    patients, rejected = import_patients(path)
+    assert [patient.name for patient in patients] == ["Стотч Баттерс"]
+    assert [line_number for line_number, reason in rejected] == [3, 4, 5]
+    assert rejected[0][1].startswith("Некорректный JSON")
+    assert rejected[1][1] == "Строка должна быть объектом JSON"
+
+
+def test_chunks_and_unknown_format(tmp_path):
+    rows = "".join(f"Пациент {i},{20 + i},ж,160,55\n" for i in range(5))
+    path = write(tmp_path / 'new.csv', "name,age,gender,height,weight\n" + rows + ",1,ж,1,1\n")
+    chunks = list(import_chunks(path, chunk_size=2))
+    assert [len(accepted) + len(rejected) for accepted, rejected in chunks] == [2, 2, 2]
+    assert import_patients(path, chunk_size=2)[0][4].age == 24
+
+    with pytest.raises(ValueError):
+        import_patients(write(tmp_path / 'new.xlsx', ''))
+
+
+@pytest.mark.parametrize('name', ['out.csv', 'out.jsonl'])
+def test_export_round_trip(tmp_path, name):
+    source = write(tmp_path / 'new.csv', "name,age,gender,height,weight\n"
+                                         "Стотч Баттерс,10,м,135,30\nМарш Шелли,14,ж,160,52\n")
+    patients, rejected = import_patients(source)
+    path = str(tmp_path / name)
+    assert export_patients(patients, path) == 2
+    again, rejected = import_patients(path)
+    assert rejected == []
+    assert [patient.to_dict() for patient in again] == [patient.to_dict() for patient in patients]
@@ -0,0 +1,83 @@
+import math
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+from patient_model import (GENDER_FEMALE, GENDER_MALE, GENDER_UNKNOWN, Patient, PatientList,
+                           PatientValidationError, assign_patient_ids, calculate_bmi,
+                           normalize_gender, validate_patient)
+
+
+def test_update_bmi_does_not_import_numpy():
+    # Загрузка базы не должна тянуть NumPy до первого кадра окна
+    code = ("import sys\n"
+            "from patient_model import Patient, update_bmi\n"
+            "patients = [Patient('x', 30, 'м', 170, 70) for _ in range(5000)]\n"
+            "update_bmi(patients)\n"
+            "print(round(patients[0].bmi, 2), 'numpy' in sys.modules)\n")
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ['24.22', 'False']
+
+
+def test_normalize_gender():
+    assert normalize_gender('female') == GENDER_FEMALE
+    assert normalize_gender('Male') == GENDER_MALE
+    assert normalize_gender(' Муж. ') == GENDER_MALE
+    assert normalize_gender('ж') == GENDER_FEMALE
+    assert normalize_gender('Женский') == GENDER_FEMALE
+    # Поиск подстроки ошибался бы на обоих
+    assert normalize_gender('мама') == GENDER_UNKNOWN
+    assert normalize_gender('') == GENDER_UNKNOWN
+    assert normalize_gender(None) == GENDER_UNKNOWN
+
+
+def make_list(*ids):
+    return PatientList([Patient(f"Пациент {i}", 30, 'м', 170, 70, patient_id=i) for i in ids])
+
+
+def test_patient_list_add():
+    patients = make_list(1, 2, 5)
+    added = patients.add(Patient("Новый", 30, 'м', 170, 70))
+    assert added.id == 6 and patients.next_id == 7
+    # Запись с другого рабочего места с меньшим id встает на свое место
+    patients.add(Patient("Чужой", 30, 'м', 170, 70, patient_id=3))
+    assert [patient.id for patient in patients] == [1, 2, 3, 5, 6]
+    assert patients.position(5) == 3 and patients.get(3).name == "Чужой"
+    with pytest.raises(ValueError):
+        patients.add(Patient("Повтор", 30, 'м', 170, 70, patient_id=2))
+    with pytest.raises(KeyError):
+        patients.position(4)
+
+
+def test_patient_list_remove_many():
+    patients = make_list(1, 2, 3, 4, 5)
+    removed = patients.remove_many([4, 2])
+    assert [patient.id for patient in removed] == [4, 2]
+    assert [patient.id for patient in patients] == [1, 3, 5]
+    assert 2 not in patients and patients.position(5) == 2
+    # id удаленных записей не выдаются заново
+    assert patients.add(Patient("Новый", 30, 'м', 170, 70)).id == 6
+    with pytest.raises(KeyError):
+        patients.remove_many([7])
+
+
+def test_assign_patient_ids():
+    patients = [Patient("a", 1, '', 1, 1, patient_id=3), Patient("b", 1, '', 1, 1),
+                Patient("c", 1, '', 1, 1, patient_id=3), Patient("d", 1, '', 1, 1, patient_id=1)]
+    assert assign_patient_ids(patients)
+    assert [patient.id for patient in patients] == [1, 3, 4, 5]
+    assert not assign_patient_ids(patients)
+
+
+def test_validate_patient():
+    patient = validate_patient(" Стотч Баттерс ", "10", "м", "135", "30")
+    assert (patient.name, patient.age, patient.height) == ("Стотч Баттерс", 10, 135.0)
+    assert patient.gender_code == GENDER_MALE
+    assert math.isclose(patient.bmi, 30 / 1.35 ** 2)
+    for fields in (("", 10, 'м', 135, 30), ("x", 0, 'м', 135, 30), ("x", 10, 'м', "?", 30)):
+        with pytest.raises(PatientValidationError):
+            validate_patient(*fields)
+    assert math.isnan(calculate_bmi(30, 0))
@@ -0,0 +1,9 @@
+from patient_shards import shard_files
+
+
+def test_shard_files_skip_sketches_and_journals(tmp_path):
+    for name in ('north.json', 'south.json', 'south.json.journal', 'south.json.lock',
+                 'all.sketch.json', 'notes.txt'):
+        (tmp_path / name).write_text('[]', encoding='utf-8')
+    assert shard_files(str(tmp_path)) == [str(tmp_path / 'north.json'),
+                                          str(tmp_path / 'south.json')]
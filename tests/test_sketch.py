@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from patient_model import Patient, calculate_bmi, normalize_gender
+from patient_sketch import PatientSketch
+from patient_stats import PatientColumns, PatientStats
+
+
+def make_patients(count, seed):
+    rng = np.random.default_rng(seed)
+    patients = []
+    for i in range(count):
+        gender = 'м' if i % 2 else 'ж'
+        height = float(rng.integers(150, 195))
+        weight = float(rng.integers(45, 110))
+        patients.append(Patient(f"Пациент {i}", int(rng.integers(18, 90)), gender, height,
+                                weight, normalize_gender(gender), calculate_bmi(weight, height),
+                                patient_id=i + 1))
+    return patients
+
+
+def same_sketch(a, b):
+    # Суммы с плавающей точкой совпадают только с точностью до округления
+    a, b = a.to_dict(), b.to_dict()
+    return a.keys() == b.keys() and all(np.allclose(a[key], b[key]) for key in a)
+
+
+def test_merge_equals_sketch_of_all_records():
+    first, second = make_patients(300, 1), make_patients(200, 2)
+    merged = PatientSketch(first).merge(PatientSketch(second))
+    whole = PatientSketch(first + second)
+    assert merged.size == 500
+    assert np.array_equal(merged.bmi_counts, whole.bmi_counts)
+    assert np.allclose(merged.trend_sums, whole.trend_sums)
+
+
+def test_remove_undoes_add():
+    patients = make_patients(100, 3)
+    sketch = PatientSketch(patients[:60])
+    sketch.add(patients[60:])
+    sketch.remove(patients[60:])
+    assert same_sketch(sketch, PatientSketch(patients[:60]))
+
+
+def test_stats_match_exact_statistics():
+    patients = make_patients(1000, 4)
+    summary = PatientSketch(patients).stats().summary()
+    exact = PatientStats(PatientColumns(patients)).summary()
+    assert summary['gender_counts'] == exact['gender_counts']
+    for label, box in exact['bmi_by_gender'].items():
+        # Квантили сводки - по гистограмме с шагом 0,1
+        for field in ('median', 'q1', 'q3'):
+            assert summary['bmi_by_gender'][label][field] == pytest.approx(box[field], abs=0.1)
+        assert summary['bmi_by_gender'][label]['mean'] == pytest.approx(box['mean'])
+    assert summary['bmi_age_trend']['slope'] == pytest.approx(exact['bmi_age_trend']['slope'])
+
+
+def test_save_and_load(tmp_path):
+    sketch = PatientSketch(make_patients(50, 5))
+    path = str(tmp_path / 'clinic.sketch.json')
+    sketch.save(path)
+    assert same_sketch(PatientSketch.load(path), sketch)
+
+    data = sketch.to_dict()
+    data['version'] = 99
+    with pytest.raises(ValueError):
+        PatientSketch.from_dict(data)
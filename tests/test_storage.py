@@ -0,0 +1,222 @@
+import json
+import os
+
+import pytest
+
+from patient_model import Patient, normalize_gender
+from patient_storage import (ColumnarStorage, JournalStorage, SqliteStorage,
+                             StorageConflictError, apply_changes, load_patients)
+
+
+def new_patient(name, age=30, gender='м', height=175.0, weight=70.0):
+    return Patient(name, age, gender, height, weight, normalize_gender(gender))
+
+
+def records(patients):
+    return [patient.to_dict() for patient in patients]
+
+
+def test_journal_replay(patients_file):
+    storage = JournalStorage(patients_file)
+    patients = load_patients(storage)
+    storage.commit(patients, [('add', None, new_patient("Твик Твик")),
+                              ('update', 2, new_patient("Марш Стэнли", age=11)),
+                              ('delete', 5, None)])
+    storage.close()
+    assert os.path.exists(patients_file + '.journal')
+
+    reloaded = JournalStorage(patients_file).load()
+    assert records(reloaded) == records(patients)
+    assert reloaded.get(29).name == "Твик Твик"
+    assert reloaded.get(2).age == 11
+    assert 5 not in reloaded
+
+
+def test_replay_skips_change_of_missing_patient(patients_file):
+    storage = JournalStorage(patients_file)
+    patients = load_patients(storage)
+    with open(patients_file + '.journal', 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'op': 'update', 'id': 999, 'v': 1000, 'by': 'other',
+                            'patient': new_patient("Никто").to_dict()}) + '\n')
+
+    reloaded = JournalStorage(patients_file).load()
+    assert records(reloaded) == records(patients)
+
+
+def test_torn_tail_is_truncated(patients_file):
+    storage = JournalStorage(patients_file)
+    patients = load_patients(storage)
+    storage.commit(patients, [('add', None, new_patient("Твик Твик"))])
+    journal_path = patients_file + '.journal'
+    size = os.path.getsize(journal_path)
+    with open(journal_path, 'ab') as f:
+        f.write(b'{"op": "add", "id": 30, "pat')
+
+    # Только читающее хранилище файлы не трогает
+    assert records(JournalStorage(patients_file, read_only=True).load()) == records(patients)
+    assert os.path.getsize(journal_path) > size
+
+    reloaded = JournalStorage(patients_file)
+    assert records(reloaded.load()) == records(patients)
+    assert os.path.getsize(journal_path) == size
+
+    # Новая запись после обрезки читается
+    more = reloaded.load()
+    reloaded.commit(more, [('add', None, new_patient("Крейг Такер"))])
+    assert records(JournalStorage(patients_file).load()) == records(more)
+
+
+def test_compaction_keeps_previous_journal(patients_file):
+    writer = JournalStorage(patients_file, compact_every=3)
+    reader = JournalStorage(patients_file)
+    patients = load_patients(writer)
+    other = reader.load()
+
+    for number in range(4):
+        writer.commit(patients, [('add', None, new_patient(f"Пациент {number}"))])
+    assert os.path.exists(patients_file + '.journal.prev')
+
+    # Второе рабочее место дочитывает хвост прежнего журнала и новый журнал
+    changes = reader.sync(other)
+    assert [patient_id for op, patient_id, patient in changes] == [29, 30, 31, 32]
+    apply_changes(other, changes)
+    assert records(other) == records(patients)
+    assert records(JournalStorage(patients_file).load()) == records(patients)
+
+
+def test_sync_between_storages(patients_file):
+    first = JournalStorage(patients_file)
+    second = JournalStorage(patients_file)
+    first_patients = load_patients(first)
+    second_patients = second.load()
+
+    first.commit(first_patients, [('update', 1, new_patient("Брофловски Кайл", age=11)),
+                                  ('delete', 3, None)])
+    changes = second.sync(second_patients)
+    assert [(op, patient_id) for op, patient_id, patient in changes] == [('update', 1),
+                                                                        ('delete', 3)]
+    # Свои изменения sync не возвращает
+    assert first.sync(first_patients) == []
+    apply_changes(second_patients, changes)
+    assert records(second_patients) == records(first_patients)
+
+
+def test_conflicting_edit_is_refused(patients_file):
+    first = JournalStorage(patients_file)
+    second = JournalStorage(patients_file)
+    first_patients = load_patients(first)
+    second_patients = second.load()
+    before = records(second_patients)
+
+    first.commit(first_patients, [('update', 4, new_patient("Маккормик Кенни", age=11))])
+    with pytest.raises(StorageConflictError):
+        second.commit(second_patients, [('update', 4, new_patient("Маккормик Кенни", age=12))])
+    # Ни в памяти, ни в файле отказанного изменения нет
+    assert records(second_patients) == before
+    assert JournalStorage(patients_file).load().get(4).age == 11
+
+
+def test_concurrent_adds_get_distinct_ids(patients_file):
+    first = JournalStorage(patients_file)
+    second = JournalStorage(patients_file)
+    first_patients = load_patients(first)
+    second_patients = second.load()
+
+    first.commit(first_patients, [('add', None, new_patient("Твик Твик"))])
+    second.commit(second_patients, [('add', None, new_patient("Крейг Такер"))])
+    assert 29 in first_patients and 30 in second_patients
+
+    apply_changes(second_patients, second.sync(second_patients))
+    assert [patient.id for patient in second_patients][-2:] == [29, 30]
+    assert records(second_patients) == records(JournalStorage(patients_file).load())
+
+
+def test_change_of_missing_patient_is_not_written(patients_file):
+    storage = JournalStorage(patients_file)
+    patients = load_patients(storage)
+    before = records(patients)
+    with pytest.raises(StorageConflictError):
+        storage.commit(patients, [('add', None, new_patient("Твик Твик")),
+                                  ('update', 999, new_patient("Никто"))])
+    assert records(patients) == before
+    assert records(JournalStorage(patients_file).load()) == before
+
+
+@pytest.mark.parametrize('storage_class, suffix', [(ColumnarStorage, '.dpcol'),
+                                                   (SqliteStorage, '.db')])
+def test_round_trip(patients_file, storage_class, suffix):
+    path = os.path.splitext(patients_file)[0] + suffix
+    expected = load_patients(JournalStorage(patients_file, read_only=True))
+
+    storage = storage_class(path, import_from=patients_file)
+    patients = load_patients(storage)
+    assert records(patients) == records(expected)
+
+    # Запись, которая не укладывается в колонки, сохраняется как есть
+    odd = Patient("Без\0возраста", 'десять', 'ж', None, 40.0, 2)
+    storage.commit(patients, [('add', None, odd),
+                              ('add', None, new_patient("Твик Твик")),
+                              ('update', 7, new_patient("Тестабургер Венди", gender='ж')),
+                              ('delete', 1, None)])
+    storage.close()
+
+    reloaded = storage_class(path, import_from=patients_file)
+    assert records(reloaded.load()) == records(patients)
+    reloaded.close()
+
+
+@pytest.mark.parametrize('storage_class, suffix', [(ColumnarStorage, '.dpcol'),
+                                                   (SqliteStorage, '.db')])
+def test_import_takes_journal_tail(patients_file, storage_class, suffix):
+    journal = JournalStorage(patients_file)
+    expected = load_patients(journal)
+    journal.commit(expected, [('add', None, new_patient("Твик Твик")), ('delete', 2, None)])
+    journal.close()
+
+    storage = storage_class(os.path.splitext(patients_file)[0] + suffix,
+                            import_from=patients_file)
+    assert records(load_patients(storage)) == records(expected)
+    storage.close()
+
+
+def test_failed_sqlite_import_is_retried(patients_file):
+    with open(patients_file, 'rb') as f:
+        good = f.read()
+    with open(patients_file, 'wb') as f:
+        f.write(good[:len(good) // 2])
+    path = os.path.splitext(patients_file)[0] + '.db'
+
+    with pytest.raises(ValueError):
+        SqliteStorage(path, import_from=patients_file).load()
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + '.tmp')
+
+    with open(patients_file, 'wb') as f:
+        f.write(good)
+    storage = SqliteStorage(path, import_from=patients_file)
+    assert len(storage.load()) == 28
+    storage.close()
+
+
+def test_huge_numbers_survive_columnar_compaction(patients_file):
+    path = os.path.splitext(patients_file)[0] + '.dpcol'
+    storage = ColumnarStorage(path, import_from=patients_file, compact_every=1)
+    patients = load_patients(storage)
+    storage.commit(patients, [('add', None, new_patient("Мафусаил", age=10 ** 20,
+                                                        height=10 ** 400))])
+    # Снимок переписан: запись ушла из журнала в колонки (в заголовок)
+    assert storage.journal_records == 0
+    assert records(ColumnarStorage(path).load()) == records(patients)
+
+
+def test_failed_compaction_keeps_commit(patients_file, monkeypatch):
+    storage = JournalStorage(patients_file, compact_every=1)
+    patients = load_patients(storage)
+
+    def broken(patients):
+        raise ValueError("не кодируется")
+
+    monkeypatch.setattr(storage, 'encode_snapshot', broken)
+    changes = storage.commit(patients, [('add', None, new_patient("Твик Твик"))])
+    assert changes[0][1] == 29 and 29 in patients
+    assert records(JournalStorage(patients_file).load()) == records(patients)